@@ -0,0 +1,222 @@
+import hashlib
+import os
+import posixpath
+import shutil
+import stat
+import subprocess
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from config import cache_path
+from ignore import DEFAULT_EXCLUDES, IgnoreRules
+
+# Guards against zip bombs and runaway uploads
+ZIP_MAX_TOTAL_BYTES = 2 * 1024 ** 3
+ZIP_MAX_FILE_BYTES = 512 * 1024 ** 2
+ZIP_MAX_FILES = 200000
+ZIP_MAX_RATIO = 200
+ZIP_CHUNK_SIZE = 1 << 20
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def _git(*args: str, cwd: str = None, capture: bool = False) -> str:
+    result = subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=capture, text=True)
+    return result.stdout.strip() if capture else ""
+
+
+def repo_name_from_url(repo_url: str) -> str:
+    repo_name = repo_url.rstrip('/').split('/')[-1]
+    if repo_name.endswith('.git'):
+        repo_name = repo_name[:-4]
+    return repo_name
+
+
+def mirror_path(repo_url: str) -> str:
+    key = hashlib.sha1(repo_url.rstrip("/").encode()).hexdigest()[:16]
+    return os.path.join(cache_path("git"), f"{repo_name_from_url(repo_url)}-{key}.git")
+
+
+@contextmanager
+def _mirror_lock(mirror: str):
+    # Concurrent deploys of the same repo share one mirror; serialize updates
+    if fcntl is None:
+        yield
+        return
+    with open(f"{mirror}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def update_mirror(repo_url: str) -> str:
+    mirror = mirror_path(repo_url)
+    with _mirror_lock(mirror):
+        if not os.path.isdir(mirror):
+            print(f"[INFO] Creating local mirror of {repo_url} in {mirror}...")
+            _git("clone", "--mirror", "--quiet", repo_url, mirror)
+        else:
+            print(f"[INFO] Updating local mirror {mirror}...")
+            try:
+                _git("fetch", "--prune", "--quiet", "origin", cwd=mirror)
+            except subprocess.CalledProcessError as e:
+                # A stale mirror is still better than no deploy
+                print(f"[WARN] git fetch failed ({e}); using the cached mirror as-is")
+        _git("worktree", "prune", cwd=mirror)
+    return mirror
+
+
+def checkout_from_mirror(repo_url: str, dest: str, ref: str = None) -> str:
+    mirror = update_mirror(repo_url)
+    with _mirror_lock(mirror):
+        _git("worktree", "add", "--quiet", "--detach", "--force", dest, ref or "HEAD", cwd=mirror)
+    return _git("rev-parse", "HEAD", cwd=dest, capture=True)
+
+
+def shallow_clone(repo_url: str, dest: str, ref: str = None) -> str:
+    if ref is None:
+        _git("clone", "--depth", "1", "--filter=blob:none", "--single-branch", "--quiet", repo_url, dest)
+    else:
+        # fetch works for branches, tags and (where the server allows) commit ids
+        _git("init", "--quiet", dest)
+        _git("remote", "add", "origin", repo_url, cwd=dest)
+        _git("fetch", "--depth", "1", "--filter=blob:none", "--quiet", "origin", ref, cwd=dest)
+        _git("checkout", "--quiet", "--detach", "FETCH_HEAD", cwd=dest)
+    return _git("rev-parse", "HEAD", cwd=dest, capture=True)
+
+
+def acquire_git_repo(repo_url: str, dest: str, ref: str = None, use_cache: bool = None) -> str:
+    if use_cache is None:
+        use_cache = os.environ.get("AUTODEPLOY_GIT_CACHE", "1") != "0"
+    if use_cache:
+        try:
+            commit = checkout_from_mirror(repo_url, dest, ref)
+            print(f"[INFO] Checked out {ref or 'HEAD'} ({commit[:12]}) from local mirror into {dest}")
+            return commit
+        except subprocess.CalledProcessError as e:
+            print(f"[WARN] Mirror checkout failed ({e}); falling back to a shallow clone")
+    commit = shallow_clone(repo_url, dest, ref)
+    print(f"[INFO] Shallow-cloned {ref or 'HEAD'} ({commit[:12]}) into {dest}")
+    return commit
+
+
+def _zip_root(names: list[str]) -> str | None:
+    tops = {name.split("/", 1)[0] for name in names}
+    if len(tops) == 1 and all("/" in name or name.endswith("/") for name in names):
+        return tops.pop()
+    return None
+
+
+def _is_excluded(rules: IgnoreRules, rel_path: str) -> bool:
+    parts = rel_path.split("/")
+    for i in range(1, len(parts)):
+        if rules.is_ignored("/".join(parts[:i]), is_dir=True):
+            return True
+    return rules.is_ignored(rel_path)
+
+
+def iter_zip_members(zip_ref: zipfile.ZipFile, rules: IgnoreRules = None, strip_root: bool = True,
+                     max_total_bytes: int = ZIP_MAX_TOTAL_BYTES, max_file_bytes: int = ZIP_MAX_FILE_BYTES,
+                     max_files: int = ZIP_MAX_FILES):
+    # Yields (rel_path, ZipInfo) for regular files worth extracting, after
+    # zip-slip and size checks. rel_path is relative to the archive's single
+    # top-level folder when there is one.
+    infos = zip_ref.infolist()
+    if len(infos) > max_files:
+        raise ValueError(f"Zip has {len(infos)} entries, limit is {max_files}")
+    if rules is None:
+        rules = IgnoreRules(DEFAULT_EXCLUDES)
+    root = _zip_root([i.filename for i in infos]) if strip_root else None
+
+    total = 0
+    for info in infos:
+        name = info.filename.replace("\\", "/")
+        normalized = posixpath.normpath(name)
+        if name.startswith("/") or (len(name) > 1 and name[1] == ":") or normalized == ".." or normalized.startswith("../"):
+            raise ValueError(f"Unsafe path in zip: {info.filename}")
+        if info.is_dir():
+            continue
+        # Never materialize symlinks from untrusted archives
+        if stat.S_ISLNK(info.external_attr >> 16):
+            continue
+        rel_path = normalized[len(root) + 1:] if root else normalized
+        if not rel_path or _is_excluded(rules, rel_path):
+            continue
+        if info.file_size > max_file_bytes:
+            raise ValueError(f"{info.filename} is {info.file_size} bytes, limit is {max_file_bytes}")
+        if info.compress_size and info.file_size > 1024 ** 2 and info.file_size / info.compress_size > ZIP_MAX_RATIO:
+            raise ValueError(f"Suspicious compression ratio for {info.filename}")
+        total += info.file_size
+        if total > max_total_bytes:
+            raise ValueError(f"Zip expands to more than {max_total_bytes} bytes")
+        yield rel_path, info
+
+
+def open_zip_member(zip_ref: zipfile.ZipFile, info: zipfile.ZipInfo, max_bytes: int = ZIP_MAX_FILE_BYTES):
+    # Headers can lie about sizes, so enforce the limit on what actually comes out
+    src = zip_ref.open(info)
+    read = src.read
+    state = {"bytes": 0}
+
+    def limited_read(n=-1):
+        data = read(n)
+        state["bytes"] += len(data)
+        if state["bytes"] > max(info.file_size, 0) or state["bytes"] > max_bytes:
+            raise ValueError(f"{info.filename} decompressed past its declared size")
+        return data
+
+    src.read = limited_read
+    return src
+
+
+def extract_zip(zip_file_path: str, dest: str, rules: IgnoreRules = None, workers: int = None) -> tuple[str, str]:
+    # Members are decompressed concurrently; each worker gets its own ZipFile
+    # handle so reads don't contend on one file position.
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def worker_zip() -> zipfile.ZipFile:
+        if not hasattr(local, "zip"):
+            local.zip = zipfile.ZipFile(zip_file_path, "r")
+            with handles_lock:
+                handles.append(local.zip)
+        return local.zip
+
+    def extract_one(item: tuple[str, zipfile.ZipInfo]):
+        rel_path, info = item
+        target = os.path.join(dest, *rel_path.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open_zip_member(worker_zip(), info) as src, open(target, "wb") as out:
+            shutil.copyfileobj(src, out, ZIP_CHUNK_SIZE)
+        mode = (info.external_attr >> 16) & 0o777
+        if mode:
+            os.chmod(target, mode)
+        # The archive's timestamps, so re-extracting the same zip leaves the hash cache valid
+        mtime = time.mktime(info.date_time + (0, 0, -1))
+        os.utime(target, (mtime, mtime))
+        return info.file_size
+
+    with zipfile.ZipFile(zip_file_path, "r") as zip_ref:
+        names = [i.filename for i in zip_ref.infolist()]
+        members = list(iter_zip_members(zip_ref, rules))
+    root = _zip_root(names)
+    root_name = root or os.path.splitext(os.path.basename(zip_file_path))[0]
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers or min(16, (os.cpu_count() or 1) + 4)) as pool:
+            total = sum(pool.map(extract_one, members))
+    finally:
+        for handle in handles:
+            handle.close()
+
+    print(f"[INFO] Extracted {len(members)} files ({total / 1e6:.2f} MB) from {zip_file_path}")
+    return dest, root_name
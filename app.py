@@ -1,68 +1,289 @@
+import argparse
+import json
+import os
+import sys
+from contextlib import contextmanager
+
 from chatbot import process_deployment_request
+from dep_bundle import prepare_dependency_bundle
+from launcher import PYTHON_SERVER_PACKAGES
+from sizing import parse_expected_rps, recommend_instance
+from tracing import span, trace
+from images import select_image
+from llm_cache import get_cache
+from manifest import source_id
+from terraform_runner import deployment_workspace, resource_suffix
 from deploy import (
     download_or_extract_code,
     analyze_repo,
     generate_terraform_config,
     run_terraform_apply,
-    deploy_application
+    run_terraform_apply_fleet,
+    deploy_application,
+    deploy_fleet
 )
 
-def main():
-    print("Welcome to the Deployment Assistant!")
-    user_input = input("\nWhat would you like to deploy today? (type 'exit' to quit): ")
-    if user_input.lower() == 'exit':
-        print("Thank you for using the Deployment Assistant. Goodbye!")
-        return
 
-    deployment_instructions = process_deployment_request(user_input)
+@contextmanager
+def _unlimited(stage_name):
+    yield
 
-    provider = deployment_instructions.get('cloud_provider') or "aws"
-    provider = "aws" # Hardcoded for now
-    app_type = deployment_instructions.get('application_type') or "unknown"
-    resource_size = deployment_instructions.get('resource_size') or "t2.micro"
-
-    repo_url = input("Enter the GitHub repo URL (leave blank if using a zip file): ").strip()
-
-    zip_file_path = None
-    if not repo_url:
-        zip_file_path = input("Enter the path to your zip file: ").strip()
-
-    try:
-        code_path, root_dir, tree = download_or_extract_code(repo_url=repo_url, zip_file_path=zip_file_path)
-        print(f"Code downloaded/extracted to: {code_path}")
-    except Exception as e:
-        print(f"[ERROR] Failed to retrieve code: {e}")
-        return
-
-    if zip_file_path:
-        code_path = "/".join(code_path.split("/")[:-1])
-    repo_analysis = analyze_repo(code_path, root_dir, tree, known_framework=app_type)
-    print("[DEBUG] Repo Analysis:", repo_analysis)
-
-    # Generate Terraform config for the selected provider
-    tf_config = generate_terraform_config(provider, repo_analysis, instance_type=resource_size)
-    
-    # Run Terraform to provision the VM
-    try:
-        public_ip, private_key = run_terraform_apply(tf_config)
-        print(f"Terraform provisioning complete. Public IP: {public_ip}")
-    except Exception as e:
-        print(f"[ERROR] Terraform apply failed: {e}")
-        return
-
-    if public_ip:
-        deploy_application(
-            public_ip=public_ip,
-            repo_path=code_path,
-            needs_localhost_fix=repo_analysis["needs_localhost_replacement"],
+
+@contextmanager
+def _phase(stage, name):
+    # Queueing in `stage` isn't part of the span; only the work is
+    with stage(name), span(name):
+        yield
+
+
+def run_pipeline(repo_url: str = None, zip_file_path: str = None, app_type: str = "unknown", resource_size: str = None,
+                 provider: str = "aws", ref: str = None, workspace: str = None, proxy: bool = False, micro_cache: bool = False,
+                 instance_count: int = 1, expected_rps: int = None, trace_dir: str = None, bundle_dependencies: bool = True,
+                 deploy_overrides: dict = None, load_test: dict = None, upload_mode: str = "sftp", stage=_unlimited) -> dict:
+    # `stage` wraps each phase, letting batch mode cap per-stage concurrency and time it.
+    # `load_test` (loadtest.load_test options, {} for the defaults) load tests the
+    # deployed app and fails the deploy if it misses the SLO.
+    with trace("pipeline", out_dir=trace_dir, source=repo_url or zip_file_path or "") as root:
+        with _phase(stage, "acquire"):
+            try:
+                code_path, root_dir, tree, index = download_or_extract_code(repo_url=repo_url, zip_file_path=zip_file_path, ref=ref)
+                print(f"Code downloaded/extracted to: {code_path}")
+            except Exception as e:
+                raise Exception(f"Failed to retrieve code: {e}") from e
+
+        with _phase(stage, "analyze"):
+            repo_analysis = analyze_repo(code_path, root_dir, tree, known_framework=app_type, index=index)
+            print("[DEBUG] Repo Analysis:", repo_analysis)
+            if get_cache():
+                print("[DEBUG] LLM cache:", get_cache().stats())
+
+        # Resolved on this machine while nothing else is waiting on it; None means install online
+        bundle = None
+        if bundle_dependencies:
+            with span("dependency_bundle") as s:
+                bundle = prepare_dependency_bundle(repo_analysis["framework"], code_path, repo_analysis["dependency_manifest_path"],
+                                                   extra_packages=PYTHON_SERVER_PACKAGES)
+                s.set(built=bundle is not None)
+
+        sizing = recommend_instance(repo_analysis["framework"], code_path, repo_analysis["dependency_manifest_path"],
+                                    resource_size=resource_size, expected_rps=expected_rps)
+        print(f"[INFO] Instance: {sizing['instance_type']} (${sizing['monthly_usd']}/month, {sizing['vcpus']} vCPU, "
+              f"{sizing['memory_gib']} GiB): {'; '.join(sizing['reasons'])}")
+
+        ami = select_image(repo_analysis["framework"], code_path, repo_analysis["dependency_manifest_path"])
+
+        # Redeploys of the same app share a workspace, and with it the resources it tracks
+        workspace = workspace or deployment_workspace(source_id(repo_url, root_dir), root_dir)
+
+        # Generate Terraform config for the selected provider
+        tf_config = generate_terraform_config(provider, repo_analysis, instance_type=sizing["instance_type"], ami=ami, proxy=proxy,
+                                              instance_count=instance_count, name_suffix=resource_suffix(workspace))
+
+        # Run Terraform to provision the VM(s)
+        with _phase(stage, "terraform"):
+            try:
+                lb_dns_name = None
+                if instance_count > 1:
+                    public_ips, private_key, lb_dns_name = run_terraform_apply_fleet(tf_config, workspace=workspace)
+                    public_ip = public_ips[0] if public_ips else None
+                else:
+                    public_ip, private_key = run_terraform_apply(tf_config, workspace=workspace)
+                    public_ips = [public_ip] if public_ip else []
+                print(f"Terraform provisioning complete. Public IP: {public_ip}")
+            except Exception as e:
+                raise Exception(f"Terraform apply failed: {e}") from e
+
+        result = {
+            "root_dir": root_dir,
+            "framework": repo_analysis["framework"],
+            "public_ip": public_ip,
+            "public_ips": public_ips,
+            "lb_dns_name": lb_dns_name,
+            "instance_type": sizing["instance_type"],
+            "url": None,
+            "deployed": False,
+            "workspace": workspace,
+        }
+        deploy_args = dict(
             framework=repo_analysis["framework"],
             ssh_key=private_key,
             root_dir=root_dir,
             dependency_path=repo_analysis["dependency_manifest_path"],
-            main_file_path=repo_analysis["main_file_path"]
+            main_file_path=repo_analysis["main_file_path"],
+            dependency_bundle=bundle,
+            port=repo_analysis["ports"][0],
+            bindings=repo_analysis["bindings"],
+            upload_mode=upload_mode,
+            source_id=source_id(repo_url, root_dir),
+            proxy=proxy,
+            micro_cache=micro_cache,
+            max_workers=sizing["max_workers"],
+            **(deploy_overrides or {})
         )
-        print(f"deployment completed. App is at http://{public_ip}:{repo_analysis['ports'][0]}/")
+        if lb_dns_name:
+            with _phase(stage, "deploy"):
+                outcomes = deploy_fleet(public_ips, code_path, repo_analysis["needs_localhost_replacement"],
+                                        public_address=lb_dns_name, **deploy_args)
+                result["deployed"] = bool(outcomes) and all(outcomes.values())
+            result["url"] = f"http://{lb_dns_name}/"
+        elif public_ip:
+            with _phase(stage, "deploy"):
+                result["deployed"] = deploy_application(
+                    public_ip=public_ip,
+                    repo_path=code_path,
+                    needs_localhost_fix=repo_analysis["needs_localhost_replacement"],
+                    **deploy_args
+                )
+            result["url"] = f"http://{public_ip}/" if proxy else f"http://{public_ip}:{repo_analysis['ports'][0]}/"
+        if load_test is not None and result["deployed"] and result["url"]:
+            # Imported here: asyncio is a good share of startup otherwise.
+            # loadtest opens its own span; only the stage limit goes around it
+            from loadtest import run_load_test
+            with stage("loadtest"):
+                result["load_test"] = run_load_test(result["url"], **load_test)
+            result["deployed"] = result["load_test"]["passed"]
+        root.set(deployed=result["deployed"], instance_type=sizing["instance_type"])
+        result["trace_id"] = root.trace_id
+        return result
+
+
+def dry_run(repo_url: str = None, zip_file_path: str = None, app_type: str = "unknown", resource_size: str = None,
+            provider: str = "aws", ref: str = None, proxy: bool = False, instance_count: int = 1, expected_rps: int = None,
+            out_dir: str = None, trace_dir: str = None) -> dict:
+    # Acquire, analyze and write the terraform config, and stop there: no LLM,
+    # SSH or terraform, so none of their libraries are imported either.
+    # Low-confidence detection is reported rather than sent to the LLM.
+    with trace("dry_run", out_dir=trace_dir, source=repo_url or zip_file_path or "") as root:
+        with span("acquire"):
+            try:
+                code_path, root_dir, tree, index = download_or_extract_code(repo_url=repo_url, zip_file_path=zip_file_path, ref=ref)
+            except Exception as e:
+                raise Exception(f"Failed to retrieve code: {e}") from e
+        with span("analyze"):
+            repo_analysis = analyze_repo(code_path, root_dir, tree, known_framework=app_type, index=index, use_llm=False)
+
+        sizing = recommend_instance(repo_analysis["framework"], code_path, repo_analysis["dependency_manifest_path"],
+                                    resource_size=resource_size, expected_rps=expected_rps)
+        ami = select_image(repo_analysis["framework"], code_path, repo_analysis["dependency_manifest_path"])
+        tf_config = generate_terraform_config(provider, repo_analysis, instance_type=sizing["instance_type"], ami=ami, proxy=proxy,
+                                              instance_count=instance_count)
+
+        out_dir = out_dir or os.path.join(os.getcwd(), f"autodeploy-{root_dir or 'app'}")
+        os.makedirs(out_dir, exist_ok=True)
+        result = {"root_dir": root_dir, "analysis": repo_analysis, "sizing": sizing, "ami": ami,
+                  "config_path": os.path.join(out_dir, "main.tf")}
+        with open(result["config_path"], "w") as f:
+            f.write(tf_config)
+        with open(os.path.join(out_dir, "analysis.json"), "w") as f:
+            json.dump(result, f, indent=2)
+        root.set(framework=repo_analysis["framework"], instance_type=sizing["instance_type"])
+        result["trace_id"] = root.trace_id
+        return result
+
+
+def _ask(user_input: str) -> dict:
+    with span("llm_parse"):
+        deployment_instructions = process_deployment_request(user_input)
+
+    provider = deployment_instructions.get('cloud_provider') or "aws"
+    provider = "aws" # Hardcoded for now
+
+    # Kept as its own span so time spent typing isn't mistaken for pipeline time
+    with span("user_input"):
+        repo_url = input("Enter the GitHub repo URL (leave blank if using a zip file): ").strip()
+
+        zip_file_path = None
+        if not repo_url:
+            zip_file_path = input("Enter the path to your zip file: ").strip()
+
+    return {
+        "repo_url": repo_url,
+        "zip_file_path": zip_file_path,
+        "app_type": deployment_instructions.get('application_type') or "unknown",
+        "resource_size": deployment_instructions.get('resource_size'),
+        "provider": provider,
+        "expected_rps": parse_expected_rps(user_input),
+    }
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Deploy a Flask, Django or Node.js app; asks interactively without --repo/--zip")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--repo", help="git URL of the app")
+    source.add_argument("--zip", help="zip file of the app")
+    parser.add_argument("--ref", help="git ref to deploy")
+    parser.add_argument("--framework", default="unknown", help="skip detection for this framework")
+    parser.add_argument("--size", help="instance size or type")
+    parser.add_argument("--rps", type=int, help="expected requests per second, for sizing")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only acquire, analyze and write the terraform config; no LLM, terraform or SSH")
+    parser.add_argument("--out", help="directory for the dry run's main.tf and analysis.json")
+    parser.add_argument("--upload-mode", choices=["sftp", "tar", "delta"], default="sftp",
+                        help="delta only uploads files changed since the last deploy of the same repo to the instance")
+    parser.add_argument("--load-test", action=argparse.BooleanOptionalAction, default=True,
+                        help="load test the deployed app and fail the deploy if it misses the SLO")
+    parser.add_argument("--load-duration", type=float, help="measured seconds of load")
+    parser.add_argument("--load-concurrency", type=int, help="concurrent connections during the load test")
+    parser.add_argument("--p95-ms", type=float, help="p95 latency SLO")
+    parser.add_argument("--p99-ms", type=float, help="p99 latency SLO")
+    parser.add_argument("--max-error-rate", type=float, help="error rate SLO (0-1)")
+    parser.add_argument("--min-rps", type=float, help="throughput SLO")
+    args = parser.parse_args(argv)
+
+    if args.dry_run:
+        if not (args.repo or args.zip):
+            parser.error("--dry-run needs --repo or --zip")
+        try:
+            result = dry_run(repo_url=args.repo, zip_file_path=args.zip, app_type=args.framework, resource_size=args.size,
+                             ref=args.ref, expected_rps=args.rps, out_dir=args.out)
+        except Exception as e:
+            print(f"[ERROR] {e}")
+            return 1
+        print(f"Terraform config for {result['analysis']['framework']} on {result['sizing']['instance_type']} "
+              f"written to {result['config_path']}")
+        return 0
+
+    # Imported here so a dry run doesn't pay for asyncio
+    from loadtest import DEFAULT_SLO
+    from orchestrator import run_pipeline_overlapped
+
+    load_test = None
+    if args.load_test:
+        # SLO options override the defaults one by one
+        slo = {"p95_ms": args.p95_ms, "p99_ms": args.p99_ms, "error_rate": args.max_error_rate, "min_rps": args.min_rps}
+        options = {"duration": args.load_duration, "concurrency": args.load_concurrency,
+                   "slo": {**DEFAULT_SLO, **{k: v for k, v in slo.items() if v is not None}}}
+        load_test = {k: v for k, v in options.items() if v is not None}
+
+    request = None
+    if args.repo or args.zip:
+        request = {"repo_url": args.repo, "zip_file_path": args.zip, "app_type": args.framework,
+                   "resource_size": args.size, "provider": "aws", "expected_rps": args.rps}
+    else:
+        print("Welcome to the Deployment Assistant!")
+        user_input = input("\nWhat would you like to deploy today? (type 'exit' to quit): ")
+        if user_input.lower() == 'exit':
+            print("Thank you for using the Deployment Assistant. Goodbye!")
+            return 0
+
+    # One trace for the whole run; run_pipeline's phases nest under it
+    with trace("deploy"):
+        if request is None:
+            request = _ask(user_input)
+
+        try:
+            # Overlapped: terraform runs while the dependency bundle is built
+            result = run_pipeline_overlapped(**request, ref=args.ref, load_test=load_test,
+                                             upload_mode=args.upload_mode)
+        except Exception as e:
+            print(f"[ERROR] {e}")
+            return 1
 
+    if result.get("load_test") and not result["load_test"]["passed"]:
+        print(f"App is up at {result['url']} but missed its SLO: {'; '.join(result['load_test']['violations'])}")
+    elif result["url"]:
+        print(f"deployment completed. App is at {result['url']}")
+    return 0 if result["deployed"] else 1
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import argparse
+import json
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from app import run_pipeline
+from chatbot import process_deployment_request
+from sizing import parse_expected_rps
+
+# Defaults per stage; terraform is the one most likely to hit AWS API limits, and
+# load tests share this machine's CPU, so two at once would skew each other's latencies
+DEFAULT_STAGE_LIMITS = {"acquire": 8, "analyze": 8, "terraform": 4, "deploy": 8, "loadtest": 1}
+
+
+def load_specs(path: str) -> list[dict]:
+    specs = []
+    with open(path, "r") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                spec = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_no}: invalid JSON: {e}") from e
+            if not spec.get("repo_url") and not spec.get("zip_file_path"):
+                raise ValueError(f"{path}:{line_no}: spec needs repo_url or zip_file_path")
+            spec.setdefault("id", spec.get("name") or f"job-{line_no}")
+            specs.append(spec)
+    return specs
+
+
+class StageLimiter:
+    def __init__(self, limits: dict):
+        self.semaphores = {name: threading.Semaphore(n) for name, n in limits.items()}
+
+    def for_job(self, timings: dict):
+        @contextmanager
+        def stage(name):
+            semaphore = self.semaphores.get(name)
+            queued = time.perf_counter()
+            if semaphore:
+                semaphore.acquire()
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                timings[name] = {"queued": round(start - queued, 3), "seconds": round(time.perf_counter() - start, 3)}
+                if semaphore:
+                    semaphore.release()
+        return stage
+
+
+def run_job(spec: dict, limiter: StageLimiter) -> dict:
+    timings = {}
+    result = {"id": spec["id"], "status": "failed", "error": None, "started": time.time(), "timings": timings}
+    start = time.perf_counter()
+    try:
+        framework = spec.get("framework")
+        instance_type = spec.get("instance_type")
+        # Free-form requests still go through the parser; explicit fields win
+        if spec.get("request"):
+            parsed = process_deployment_request(spec["request"])
+            framework = framework or parsed.get("application_type")
+            instance_type = instance_type or parsed.get("resource_size")
+
+        outcome = run_pipeline(
+            repo_url=spec.get("repo_url"),
+            zip_file_path=spec.get("zip_file_path"),
+            app_type=framework or "unknown",
+            resource_size=instance_type,
+            provider=spec.get("cloud_provider") or "aws",
+            ref=spec.get("ref"),
+            workspace=spec.get("workspace"),
+            proxy=bool(spec.get("proxy")),
+            micro_cache=bool(spec.get("micro_cache")),
+            upload_mode=spec.get("upload_mode") or "sftp",
+            instance_count=int(spec.get("instance_count") or 1),
+            expected_rps=spec.get("expected_rps") or parse_expected_rps(spec.get("request")),
+            # true for the default load test, or a dict of loadtest.load_test options
+            load_test={} if spec.get("load_test") is True else (spec.get("load_test") or None),
+            stage=limiter.for_job(timings),
+        )
+        result.update(outcome)
+        result["status"] = "ok" if outcome["deployed"] else "failed"
+        if outcome.get("load_test") and not outcome["load_test"]["passed"]:
+            result["error"] = f"SLO missed: {'; '.join(outcome['load_test']['violations'])}"
+        elif not outcome["deployed"]:
+            result["error"] = "deploy_application did not complete"
+    except Exception as e:
+        result["error"] = str(e)
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    result["finished"] = time.time()
+    return result
+
+
+def run_batch(specs: list[dict], out_path: str, max_jobs: int = 8, stage_limits: dict = None) -> list[dict]:
+    limiter = StageLimiter({**DEFAULT_STAGE_LIMITS, **(stage_limits or {})})
+    results = []
+    with open(out_path, "a") as out, ThreadPoolExecutor(max_workers=max_jobs) as pool:
+        futures = {pool.submit(run_job, spec, limiter): spec for spec in specs}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            # Written as each job finishes so a crash mid-batch keeps what's done
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            print(f"[INFO] [{result['id']}] {result['status']} in {result['seconds']:.1f}s"
+                  + (f": {result['error']}" if result["error"] else ""))
+
+    ok = sum(1 for r in results if r["status"] == "ok")
+    print(f"[INFO] Batch finished: {ok}/{len(results)} deployed, results in {out_path}")
+    return results
+
+
+def _parse_stage_limits(values: list[str]) -> dict:
+    limits = {}
+    for value in values or []:
+        name, _, n = value.partition("=")
+        if name not in DEFAULT_STAGE_LIMITS or not n.isdigit() or int(n) < 1:
+            raise argparse.ArgumentTypeError(f"bad stage limit '{value}', expected one of {list(DEFAULT_STAGE_LIMITS)}=N")
+        limits[name] = int(n)
+    return limits
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Deploy many apps from a JSONL file of deployment specs")
+    parser.add_argument("specs", help="JSONL file, one spec per line: repo_url or zip_file_path, framework, instance_type, proxy, ...")
+    parser.add_argument("--out", default="deploy_results.jsonl", help="JSONL file to append per-job results to")
+    parser.add_argument("--max-jobs", type=int, default=8, help="jobs in flight at once")
+    parser.add_argument("--stage-limit", action="append", metavar="STAGE=N",
+                        help=f"concurrency limit for one stage ({', '.join(DEFAULT_STAGE_LIMITS)}); repeatable")
+    args = parser.parse_args(argv)
+
+    specs = load_specs(args.specs)
+    print(f"[INFO] Loaded {len(specs)} deployment specs from {args.specs}")
+    results = run_batch(specs, args.out, max_jobs=args.max_jobs, stage_limits=_parse_stage_limits(args.stage_limit))
+    return 0 if all(r["status"] == "ok" for r in results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
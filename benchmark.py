@@ -0,0 +1,599 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import zipfile
+
+from manifest import sync_tree
+from standins import (FakeOpenAIClient, LocalSSHServer, stop_fake_services, write_fake_terraform, write_privileged_shims,
+                      write_service_shims)
+from transfer import DEFAULT_UPLOAD_WORKERS, TAR_COMPRESSIONS, stream_tarball, upload_tree, zstandard
+
+# A regression is only reported past both the relative and the absolute margin,
+# so sub-100ms phases don't flap on scheduler noise
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_SLACK_SECONDS = 0.1
+
+# Libraries that only the LLM, SSH and load-test paths need; a dry run must not import them
+HEAVY_MODULES = ["openai", "httpx", "paramiko", "cryptography", "asyncio"]
+
+SYNTHETIC_APP = """from flask import Flask
+
+app = Flask(__name__)
+
+
+@app.route("/")
+def index():
+    return "ok"
+
+
+if __name__ == "__main__":
+    app.run(host="127.0.0.1", port=5000)
+"""
+
+
+def _file_size(rng: random.Random, min_size: int, max_size: int, profile: str) -> int:
+    if profile == "mixed":
+        # Mostly small sources with a long tail of assets, like a real repo
+        return min(max_size * 50, max(min_size, int(rng.lognormvariate(8, 1.5))))
+    return rng.randint(min_size, max_size)
+
+
+def make_synthetic_repo(root: str, num_files: int = 1000, min_size: int = 200, max_size: int = 20000,
+                        files_per_dir: int = 50, seed: int = 0, profile: str = "uniform") -> str:
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    for i in range(num_files):
+        subdir = os.path.join(root, f"pkg{i // files_per_dir:04d}")
+        os.makedirs(subdir, exist_ok=True)
+        with open(os.path.join(subdir, f"module_{i:06d}.py"), "wb") as f:
+            f.write(rng.randbytes(_file_size(rng, min_size, max_size, profile)))
+    return root
+
+
+def make_synthetic_app(root: str, num_files: int = 1000, seed: int = 0, profile: str = "mixed") -> str:
+    # A Flask app the local detector recognises with full confidence, padded out
+    # with synthetic modules
+    make_synthetic_repo(os.path.join(root, "lib"), num_files=num_files, seed=seed, profile=profile)
+    with open(os.path.join(root, "app.py"), "w") as f:
+        f.write(SYNTHETIC_APP)
+    with open(os.path.join(root, "requirements.txt"), "w") as f:
+        f.write("flask\n")
+    return root
+
+
+def _zip_dir(src: str, zip_path: str) -> str:
+    base = os.path.dirname(src)
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for root, _, files in os.walk(src):
+            for name in files:
+                path = os.path.join(root, name)
+                zf.write(path, os.path.relpath(path, base))
+    return zip_path
+
+
+def _upload_serial(ssh, repo_path: str, remote_root: str):
+    # Mirrors the original deploy_application loop: one blocking round trip
+    # per directory check and per file.
+    sftp = ssh.open_sftp()
+    try:
+        sftp.mkdir(remote_root)
+    except IOError:
+        pass
+    for root, _, files in os.walk(repo_path):
+        rel_path = os.path.relpath(root, repo_path)
+        remote_dir = remote_root if rel_path == "." else f"{remote_root}/{rel_path}"
+        try:
+            sftp.stat(remote_dir)
+        except IOError:
+            sftp.mkdir(remote_dir)
+        for file in files:
+            sftp.put(os.path.join(root, file), f"{remote_dir}/{file}")
+    sftp.close()
+
+
+def bench_upload(num_files: int, workers: int) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="bench_upload_")
+    try:
+        repo_path = make_synthetic_repo(os.path.join(work_dir, "repo"), num_files=num_files)
+        total_bytes = sum(
+            os.path.getsize(os.path.join(r, f)) for r, _, files in os.walk(repo_path) for f in files
+        )
+        results = {"files": num_files, "bytes": total_bytes}
+        with LocalSSHServer(cwd=work_dir) as server:
+            ssh = server.connect()
+            try:
+                start = time.perf_counter()
+                _upload_serial(ssh, repo_path, os.path.join(work_dir, "remote_serial"))
+                results["serial_seconds"] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                upload_tree(ssh, repo_path, os.path.join(work_dir, "remote_parallel"), workers=workers)
+                results["parallel_seconds"] = time.perf_counter() - start
+            finally:
+                ssh.close()
+        results["speedup"] = results["serial_seconds"] / results["parallel_seconds"]
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_tarball(num_files: int, workers: int) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="bench_tar_")
+    try:
+        repo_path = make_synthetic_repo(os.path.join(work_dir, "repo"), num_files=num_files)
+        results = {"files": num_files}
+        with LocalSSHServer(cwd=work_dir) as server:
+            ssh = server.connect()
+            try:
+                start = time.perf_counter()
+                _upload_serial(ssh, repo_path, os.path.join(work_dir, "remote_serial"))
+                results["serial_sftp_seconds"] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                upload_tree(ssh, repo_path, os.path.join(work_dir, "remote_parallel"), workers=workers)
+                results["parallel_sftp_seconds"] = time.perf_counter() - start
+
+                for compression in TAR_COMPRESSIONS:
+                    if compression == "zstd" and (zstandard is None or shutil.which("zstd") is None):
+                        continue
+                    start = time.perf_counter()
+                    stats = stream_tarball(ssh, repo_path, os.path.join(work_dir, f"remote_tar_{compression}"),
+                                           compression=compression)
+                    results[f"tar_{compression}_seconds"] = time.perf_counter() - start
+                    results[f"tar_{compression}_wire_bytes"] = stats["wire_bytes"]
+            finally:
+                ssh.close()
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_delta(num_files: int, workers: int, touched: int = 1) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="bench_delta_")
+    try:
+        repo_path = make_synthetic_repo(os.path.join(work_dir, "repo"), num_files=num_files)
+        remote_root = os.path.join(work_dir, "remote")
+        results = {"files": num_files, "touched": touched}
+        with LocalSSHServer(cwd=work_dir) as server:
+            ssh = server.connect()
+            try:
+                results["initial_seconds"] = sync_tree(ssh, repo_path, remote_root, workers=workers)["seconds"]
+                results["noop_seconds"] = sync_tree(ssh, repo_path, remote_root, workers=workers)["seconds"]
+
+                for i in range(touched):
+                    with open(os.path.join(repo_path, f"pkg{i:04d}", f"module_{i:06d}.py"), "ab") as f:
+                        f.write(b"# changed\n")
+                stats = sync_tree(ssh, repo_path, remote_root, workers=workers)
+                results["redeploy_seconds"] = stats["seconds"]
+                results["redeploy_uploaded"] = stats["added"] + stats["changed"]
+            finally:
+                ssh.close()
+        results["speedup"] = results["initial_seconds"] / results["redeploy_seconds"]
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+LOADTEST_APP = """import sys
+import time
+
+from flask import Flask, jsonify
+
+app = Flask(__name__)
+
+
+@app.route("/")
+def index():
+    return "ok"
+
+
+@app.route("/api/message")
+def get_message():
+    return jsonify(message="Hello, World!")
+
+
+@app.route("/slow")
+def slow():
+    time.sleep(0.2)
+    return "slow"
+
+
+if __name__ == "__main__":
+    app.run(host="127.0.0.1", port=int(sys.argv[1]), threaded=True)
+"""
+
+
+def _phase_seconds(root) -> dict:
+    phases = {}
+    for s, depth in root.walk():
+        if depth == 0:
+            continue
+        phases[s.name] = phases.get(s.name, 0.0) + (s.seconds or 0.0)
+    return phases
+
+
+def bench_e2e(num_files: int, upload_mode: str = "sftp", repeat: int = 1, llm_latency: float = 0.0,
+              profile: str = "mixed", orchestrator: str = "sequential", apply_seconds: float = 0.0,
+              bundle_dependencies: bool = False) -> dict:
+    # Drives app.run_pipeline (or the overlapped orchestrator) end to end: fake
+    # LLM, fake terraform, and a local SSH/SFTP server whose root-only commands
+    # are shimmed (see standins.py)
+    import app
+    import chatbot
+    import orchestrator as overlapped
+    import terraform_runner
+    from tracing import trace
+
+    work_dir = tempfile.mkdtemp(prefix="bench_e2e_")
+    saved = (chatbot.client, terraform_runner.TERRAFORM_BIN, os.environ.get("AUTODEPLOY_LLM_CACHE"))
+    try:
+        repo_path = make_synthetic_app(os.path.join(work_dir, "synthetic_app"), num_files=num_files, profile=profile)
+        total_bytes = sum(os.path.getsize(os.path.join(r, f)) for r, _, files in os.walk(repo_path) for f in files)
+        zip_path = _zip_dir(repo_path, os.path.join(work_dir, "synthetic_app.zip"))
+        shim_dir = write_privileged_shims(os.path.join(work_dir, "shims"), os.path.join(work_dir, "privileged.log"))
+
+        chatbot.client = FakeOpenAIClient(latency=llm_latency)
+        os.environ["AUTODEPLOY_LLM_CACHE"] = "0"
+        runs = []
+        for i in range(repeat):
+            home = os.path.join(work_dir, f"home{i}")
+            os.makedirs(home)
+            env = {**os.environ, "PATH": f"{shim_dir}{os.pathsep}{os.environ.get('PATH', '')}"}
+            with LocalSSHServer(cwd=home, env=env) as server:
+                terraform_runner.TERRAFORM_BIN = write_fake_terraform(
+                    work_dir, {"public_ip": server.host, "private_key_pem": server.private_key_pem},
+                    apply_seconds=apply_seconds)
+                with trace("e2e", out_dir=os.path.join(work_dir, "traces"), summary=False) as root:
+                    with app.span("llm_parse"):
+                        chatbot.process_deployment_request("Deploy my flask app on AWS")
+                    run = overlapped.run_pipeline_overlapped if orchestrator == "async" else app.run_pipeline
+                    result = run(
+                        zip_file_path=zip_path, app_type="flask",
+                        workspace=os.path.join(work_dir, f"tf{i}"),
+                        bundle_dependencies=bundle_dependencies, upload_mode=upload_mode,
+                        deploy_overrides={"ssh_host": server.host, "ssh_port": server.port, "remote_home": home},
+                    )
+            if not result["deployed"]:
+                raise Exception(f"e2e run {i} did not deploy")
+            runs.append((root.seconds, _phase_seconds(root)))
+
+        phases = {name: statistics.median(r[1].get(name, 0.0) for r in runs) for name in runs[0][1]}
+        total = statistics.median(r[0] for r in runs)
+        upload = phases.get("deploy.upload", 0.0)
+        return {
+            "files": num_files + 2,
+            "bytes": total_bytes,
+            "upload_mode": upload_mode,
+            "orchestrator": orchestrator,
+            "runs": repeat,
+            "total_seconds": total,
+            "phases": phases,
+            "upload_files_per_sec": (num_files + 2) / upload if upload else 0.0,
+            "upload_mb_per_sec": total_bytes / upload / 1e6 if upload else 0.0,
+        }
+    finally:
+        chatbot.client, terraform_runner.TERRAFORM_BIN = saved[0], saved[1]
+        if saved[2] is None:
+            os.environ.pop("AUTODEPLOY_LLM_CACHE", None)
+        else:
+            os.environ["AUTODEPLOY_LLM_CACHE"] = saved[2]
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _free_port_pair() -> int:
+    # A free port whose blue/green alternate is free too
+    import bluegreen
+    while True:
+        with socket.socket() as a:
+            a.bind(("127.0.0.1", 0))
+            port = a.getsockname()[1]
+        alt = bluegreen.alternate_port(port)
+        with socket.socket() as b:
+            try:
+                b.bind(("127.0.0.1", alt))
+            except OSError:
+                continue
+        return port
+
+
+def _poll_ports(ports: list[int], stop: threading.Event, samples: list):
+    # Records, every 20ms, which versions answer on either port; an empty
+    # sample means neither color was serving
+    while not stop.is_set():
+        answers = []
+        for port in ports:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as r:
+                    answers.append(r.read().decode())
+            except OSError:
+                pass
+        samples.append(answers)
+        time.sleep(0.02)
+
+
+def bench_bluegreen(num_files: int, redeploys: int = 3, keep: int = 2, drain_seconds: int = 1) -> dict:
+    # Deploys, redeploys and rolls back the synthetic app with bluegreen.py
+    # against the local SSH server, with units run by the fake systemctl
+    # (see standins.write_service_shims). Needs network access for pip.
+    import bluegreen
+    import launcher
+    from tracing import trace
+
+    work_dir = tempfile.mkdtemp(prefix="bench_bluegreen_")
+    unit_dir = os.path.join(work_dir, "units")
+    saved = (launcher.SYSTEMD_UNIT_DIR, bluegreen.SYSTEMD_UNIT_DIR)
+    launcher.SYSTEMD_UNIT_DIR = bluegreen.SYSTEMD_UNIT_DIR = unit_dir
+    try:
+        repo_path = make_synthetic_app(os.path.join(work_dir, "synthetic_app"), num_files=num_files)
+        shim_dir = write_service_shims(os.path.join(work_dir, "shims"), os.path.join(work_dir, "privileged.log"), unit_dir)
+        home = os.path.join(work_dir, "home")
+        os.makedirs(home)
+        port = _free_port_pair()
+        remote_root = os.path.join(home, "synthetic_app")
+        env = {**os.environ, "PATH": f"{shim_dir}{os.pathsep}{os.environ.get('PATH', '')}"}
+
+        samples = []
+        stop = threading.Event()
+        poller = threading.Thread(target=_poll_ports, args=([port, bluegreen.alternate_port(port)], stop, samples), daemon=True)
+        deploys = []
+        with LocalSSHServer(cwd=home, env=env) as server:
+            ssh = server.connect()
+            for version in range(1, redeploys + 2):
+                with open(os.path.join(repo_path, "app.py"), "w") as f:
+                    f.write(SYNTHETIC_APP.replace('"ok"', f'"v{version}"'))
+                with trace("bluegreen", out_dir=os.path.join(work_dir, "traces"), summary=False) as root:
+                    result = bluegreen.blue_green_deploy(ssh, repo_path, remote_root, "flask", "app.py", port=port,
+                                                         dependency_path="requirements.txt", home=home, keep=keep,
+                                                         drain_seconds=drain_seconds, label="bench")
+                if not result["activated"]:
+                    raise Exception(f"release v{version} was not activated")
+                phases = _phase_seconds(root)
+                deploys.append({"seconds": root.seconds, "switch": phases.get("bluegreen.switch", 0.0),
+                                "health": phases.get("bluegreen.health", 0.0)})
+                if version == 1:
+                    # Availability is only measured across switchovers, not the first start
+                    poller.start()
+
+            with trace("rollback", out_dir=os.path.join(work_dir, "traces"), summary=False) as root:
+                rolled = bluegreen.rollback(ssh, remote_root, "flask", drain_seconds=drain_seconds, label="bench")
+            stop.set()
+            poller.join()
+            state = bluegreen.read_state(ssh, remote_root)
+            ssh.close()
+
+        served = sorted({answer for sample in samples for answer in sample})
+        kept = sorted(d for d in os.listdir(bluegreen.releases_root(remote_root)) if not d.endswith((".json", ".rules", ".service", ".tmp", ".next")))
+        return {
+            "files": num_files + 2,
+            "redeploys": redeploys,
+            "redeploy_seconds": statistics.median(d["seconds"] for d in deploys[1:]),
+            "switch_seconds": statistics.median(d["switch"] for d in deploys[1:]),
+            "health_seconds": statistics.median(d["health"] for d in deploys[1:]),
+            "rollback_seconds": root.seconds,
+            "rolled_back": rolled["activated"],
+            "polls": len(samples),
+            "polls_unanswered": sum(1 for sample in samples if not sample),
+            "versions_served": " ".join(served),
+            "releases_kept": len(kept),
+            "active_port": state["active"]["port"],
+        }
+    finally:
+        stop_fake_services(unit_dir)
+        launcher.SYSTEMD_UNIT_DIR, bluegreen.SYSTEMD_UNIT_DIR = saved
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_loadtest(concurrency: int = 10, duration: float = 5) -> dict:
+    # loadtest.py against a local Flask dev server: an unpaced run over the
+    # hello_world routes, a paced one, and a slow route that must miss the SLO
+    from loadtest import run_load_test
+
+    work_dir = tempfile.mkdtemp(prefix="bench_loadtest_")
+    app_path = os.path.join(work_dir, "app.py")
+    with open(app_path, "w") as f:
+        f.write(LOADTEST_APP)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen([sys.executable, app_path, str(port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        url = f"http://127.0.0.1:{port}/"
+        options = dict(concurrency=concurrency, duration=duration, warmup=0.5,
+                       report_path=os.path.join(work_dir, "report.json"))
+        unpaced = run_load_test(url, paths=["/", "/api/message"], **options)
+        paced = run_load_test(url, paths=["/", "/api/message"], rate=100, **options)
+        slow = run_load_test(url, paths=["/slow"], slo={"p95_ms": 100}, **options)
+        return {
+            "unpaced_rps": unpaced["summary"]["throughput_rps"],
+            "unpaced_ms": {f"unpaced_{k}_ms": v for k, v in unpaced["summary"]["latency_ms"].items() if k != "mean"},
+            "paced_rps": paced["summary"]["throughput_rps"],
+            "paced_ms": {f"paced_{k}_ms": v for k, v in paced["summary"]["latency_ms"].items() if k != "mean"},
+            "error_rate": max(unpaced["summary"]["error_rate"], paced["summary"]["error_rate"]),
+            "slo_passed": unpaced["passed"] and paced["passed"],
+            "slow_route_caught": not slow["passed"],
+        }
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _fresh_python(code: str, env: dict) -> dict:
+    # Runs `code` in a new interpreter that reports its import time and heavy modules
+    probe = (f"import sys, time\nstart = time.perf_counter()\n{code}\n"
+             f"import json\nprint(json.dumps({{'seconds': time.perf_counter() - start, "
+             f"'heavy': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))")
+    out = subprocess.run([sys.executable, "-c", probe], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def bench_startup(num_files: int, repeat: int = 5) -> dict:
+    # Import time of the entry points and a full dry run (acquire, analyze,
+    # terraform config) of the synthetic app, each in a fresh interpreter with
+    # no API key set. "heavy" lists the libraries a run pulled in that it shouldn't.
+    work_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        zip_path = _zip_dir(make_synthetic_app(os.path.join(work_dir, "synthetic_app"), num_files=num_files),
+                           os.path.join(work_dir, "synthetic_app.zip"))
+        env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+        env["AUTODEPLOY_TRACE_DIR"] = os.path.join(work_dir, "traces")
+        cases = {
+            "import_app": "import app",
+            "import_deploy": "import deploy",
+            "dry_run": (f"import app, contextlib, io\nwith contextlib.redirect_stdout(io.StringIO()):\n"
+                        f"    assert app.main(['--dry-run', '--zip', {zip_path!r}, '--out', {os.path.join(work_dir, 'out')!r}]) == 0"),
+        }
+        results = {"seconds": {}, "heavy": {}}
+        for name, code in cases.items():
+            runs = [_fresh_python(code, env) for _ in range(repeat)]
+            results["seconds"][name] = statistics.median(r["seconds"] for r in runs)
+            results["heavy"][name] = " ".join(runs[0]["heavy"]) or "none"
+        return {"files": num_files + 2, "repeat": repeat, "seconds": results["seconds"],
+                **{f"heavy_{name}": heavy for name, heavy in results["heavy"].items()}}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_bindings(repeat: int = 3) -> dict:
+    # The binding scan over the interpreter's lib directory: thousands of real source
+    # files, on one process and on the pool scan_bindings picks by default
+    import bindings
+    from walker import walk_repo
+
+    repo_path = os.path.dirname(os.__file__)
+    files = [rel for rel, _, is_dir in walk_repo(repo_path) if not is_dir]
+    candidates = [rel for rel in files if bindings.file_type(rel)]
+    mb = sum(os.path.getsize(os.path.join(repo_path, rel)) for rel in candidates) / 1e6
+    results = {"files": len(candidates), "mb": mb}
+    for name, workers in (("serial", 1), ("default", None)):
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            findings = bindings.scan_bindings(repo_path, files=files, workers=workers)
+            runs.append(time.perf_counter() - start)
+        results[f"{name}_seconds"] = statistics.median(runs)
+        results[f"{name}_mb_per_sec"] = mb / results[f"{name}_seconds"]
+    results["findings"] = len(findings)
+    results["workers"] = os.cpu_count() or 1
+    return results
+
+
+def baseline_key(results: dict) -> str:
+    suffix = "" if results.get("orchestrator", "sequential") == "sequential" else f"-{results['orchestrator']}"
+    return f"e2e-{results['files']}-{results['upload_mode']}{suffix}"
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE,
+                        slack: float = DEFAULT_SLACK_SECONDS) -> list[str]:
+    regressions = []
+    timed = {"total": results["total_seconds"], **results["phases"]}
+    previous = {"total": baseline["total_seconds"], **baseline["phases"]}
+    for name, seconds in timed.items():
+        base = previous.get(name)
+        if base is None:
+            continue
+        if seconds > base * (1 + tolerance) and seconds - base > slack:
+            regressions.append(f"{name}: {seconds:.3f}s vs baseline {base:.3f}s (+{(seconds / base - 1) * 100 if base else 100:.0f}%)")
+    return regressions
+
+
+def load_baselines(path: str) -> dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path: str, results: dict):
+    baselines = load_baselines(path)
+    baselines[baseline_key(results)] = {k: results[k] for k in ("total_seconds", "phases", "upload_files_per_sec",
+                                                                "upload_mb_per_sec", "runs")}
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+
+
+def print_results(name: str, results: dict):
+    print(f"\n== {name} ==")
+    for key, value in results.items():
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                print(f"{sub_key:>24}: {sub_value:.3f}")
+        elif isinstance(value, float):
+            print(f"{key:>24}: {value:.3f}")
+        else:
+            print(f"{key:>24}: {value}")
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the deploy pipeline against local stand-ins")
+    parser.add_argument("--files", type=int, default=1000, help="number of files in the synthetic repo")
+    parser.add_argument("--workers", type=int, default=DEFAULT_UPLOAD_WORKERS, help="SFTP channels for the parallel upload")
+    parser.add_argument("--suite", choices=["all", "upload", "tar", "delta", "e2e", "bluegreen", "loadtest", "startup", "bindings"],
+                        default="all")
+    parser.add_argument("--upload-mode", choices=["sftp", "tar", "delta"], default="sftp", help="upload mode for the e2e suite")
+    parser.add_argument("--repeat", type=int, default=3, help="e2e runs; phase times are the median")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated seconds per fake LLM call")
+    parser.add_argument("--orchestrator", choices=["sequential", "async"], default="sequential",
+                        help="e2e pipeline: app.run_pipeline or the overlapped orchestrator")
+    parser.add_argument("--apply-seconds", type=float, default=0.0, help="simulated terraform apply time for the e2e suite")
+    parser.add_argument("--bundle", action="store_true", help="build the dependency bundle in the e2e suite (needs pip download)")
+    parser.add_argument("--baseline", help="JSON file of stored e2e results to check for regressions against")
+    parser.add_argument("--save-baseline", action="store_true", help="store this e2e result in --baseline instead of checking it")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed relative slowdown per phase")
+    args = parser.parse_args(argv)
+
+    if args.suite in ("all", "upload"):
+        print_results("upload: serial sftp.put vs parallel pipelined", bench_upload(args.files, args.workers))
+    if args.suite in ("all", "tar"):
+        print_results("upload: per-file sftp vs single tar stream", bench_tarball(args.files, args.workers))
+    if args.suite in ("all", "delta"):
+        print_results("redeploy: full upload vs manifest delta sync", bench_delta(args.files, args.workers))
+    if args.suite == "bluegreen":
+        # Not part of "all": it installs flask from the network for every release
+        print_results("redeploy: blue/green switchover", bench_bluegreen(min(args.files, 200)))
+    if args.suite in ("all", "startup"):
+        results = bench_startup(args.files)
+        print_results("startup: import time and dry run", results)
+        if any(results[f"heavy_{name}"] != "none" for name in ("import_app", "import_deploy", "dry_run")):
+            print("\nStartup imported libraries that only deploys need; see heavy_* above")
+            return 1
+    if args.suite in ("all", "bindings"):
+        print_results("analyze: host/port binding scan of the Python lib directory", bench_bindings())
+    if args.suite in ("all", "loadtest"):
+        print_results("post-deploy load test: local Flask dev server", bench_loadtest())
+    if args.suite in ("all", "e2e"):
+        results = bench_e2e(args.files, upload_mode=args.upload_mode, repeat=args.repeat, llm_latency=args.llm_latency,
+                            orchestrator=args.orchestrator, apply_seconds=args.apply_seconds, bundle_dependencies=args.bundle)
+        print_results(f"end to end: {baseline_key(results)}", results)
+        if args.baseline and args.save_baseline:
+            save_baseline(args.baseline, results)
+            print(f"\nSaved baseline {baseline_key(results)} to {args.baseline}")
+        elif args.baseline:
+            baseline = load_baselines(args.baseline).get(baseline_key(results))
+            if baseline is None:
+                print(f"\nNo baseline for {baseline_key(results)} in {args.baseline}; run with --save-baseline first")
+                return 1
+            regressions = compare_to_baseline(results, baseline, tolerance=args.tolerance)
+            if regressions:
+                print("\nRegressions against baseline:")
+                for line in regressions:
+                    print(f"  {line}")
+                return 1
+            print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
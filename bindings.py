@@ -0,0 +1,330 @@
+import bisect
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from walker import walk_repo
+
+# Whole-repo scan for where an app binds its host and port and which loopback
+# URLs it hardcodes. Only text files under SCAN_MAX_BYTES are read; large
+# repos are split into batches over a process pool. Each finding records its
+# location, and whether the value is the default of an environment variable,
+# in which case the deploy sets that variable instead of editing the source.
+#
+# Kinds: "bind" (address a server listens on), "port" (listen=True when the
+# app is started on it, False for other settings such as a database port),
+# "url" (http(s) URL to a loopback host), "host" (other host settings) and
+# "allowed_hosts" (Django).
+
+SCAN_MAX_BYTES = 256 * 1024
+SCAN_BATCH_FILES = 256
+# Below this many candidate files, starting worker processes costs more than it saves
+PARALLEL_MIN_FILES = 2000
+MAX_EXTRA_PORTS = 4
+
+PYTHON_EXTENSIONS = {".py"}
+JS_EXTENSIONS = {".js", ".mjs", ".cjs", ".ts", ".jsx", ".tsx", ".vue", ".svelte"}
+MARKUP_EXTENSIONS = {".html", ".htm", ".jinja", ".jinja2", ".j2", ".ejs", ".hbs"}
+CONFIG_EXTENSIONS = {".json", ".yml", ".yaml", ".toml", ".ini", ".cfg", ".conf"}
+SCRIPT_EXTENSIONS = {".sh", ".bash"}
+SCRIPT_NAMES = {"Procfile", "Dockerfile", "Makefile", "package.json"}
+# Start scripts and .env files aren't what the deploy runs, so they're never edited
+REWRITE_KINDS = {"python", "js", "markup", "config"}
+
+LOOPBACK_HOSTS = {"localhost", "::1", "[::1]"}
+LOOPBACK_IP_RE = re.compile(r"^127(?:\.\d{1,3}){3}$")
+HOSTLIKE_RE = re.compile(r"^[\w.\[\]:-]+$")
+# Environment variables that name the port the app itself listens on
+LISTEN_ENV_RE = re.compile(r"^(?:PORT|(?:HTTP|APP|SERVER|WEB|FLASK_RUN)_PORT)$")
+BIND_ENV_RE = re.compile(r"^(?:HOST|BIND|(?:HTTP|APP|SERVER|WEB|FLASK_RUN)_(?:HOST|BIND|ADDR|ADDRESS))$")
+SETTING_KEY_RE = re.compile(r"^(?:host|hostname|port|bind|address)$|_(?:host|port|url|uri|addr|address)$", re.IGNORECASE)
+
+URL_RE = re.compile(r"https?://(?P<host>localhost|127(?:\.\d{1,3}){3}|0\.0\.0\.0|\[::1\])(?::(?P<port>\d{2,5}))?"
+                    r"(?P<path>/[^\s'\"`<>)\]}]*)?")
+PY_ENV_DEFAULT_RE = re.compile(r"(?:environ\.get|getenv)\s*\(\s*(['\"])(?P<env>\w+)\1\s*,\s*"
+                               r"(?:(['\"])(?P<s>[^'\"\n]*)\3|(?P<n>\d{2,5})\b)")
+JS_ENV_DEFAULT_RE = re.compile(r"process\.env\.(?P<env>\w+)\s*(?:\|\||\?\?)\s*(?:(['\"`])(?P<s>[^'\"`\n]*)\2|(?P<n>\d{2,5})\b)")
+RUN_CALL_RE = re.compile(r"\.run\s*\(")
+PORT_ARG_TAIL_RE = re.compile(r"\bport\s*=\s*(?:int\s*\(\s*)?$")
+HOST_KWARG_RE = re.compile(r"\bhost\s*=\s*(['\"])(?P<host>[^'\"\n]+)\1")
+PORT_KWARG_RE = re.compile(r"\bport\s*=\s*(?P<port>\d{2,5})\b")
+LISTEN_RE = re.compile(r"\.listen\s*\(\s*(?P<port>\d{2,5})\b(?:\s*,\s*(['\"])(?P<host>[^'\"\n]+)\2)?")
+# Anchored on the separator so the engine can skip ahead to each ':'/'=', which is
+# much cheaper than trying every identifier; the key is then read backwards with
+# SETTING_KEY_BEFORE_RE from the few characters in front of it
+SETTING_RE = re.compile(r"[:=]\s*(?:(?P<vq>['\"])(?P<s>[^'\"\n]*)(?P=vq)|(?P<n>\d{2,5})\b)")
+SETTING_KEY_BEFORE_RE = re.compile(r"(?P<key>[A-Za-z_][A-Za-z0-9_]*)(['\"]?)\s*$")
+ENV_ASSIGN_RE = re.compile(r"(?<![\w$.-])(?P<env>[A-Z][A-Z0-9_]*)=(?:(['\"])(?P<s>[^'\"\n]*)\2|(?P<v>[^\s'\"#;&|]+))")
+CLI_PORT_RE = re.compile(r"(?:--port|-p)(?:\s+|=)(?P<port>\d{2,5})\b(?!:)")
+CLI_HOST_RE = re.compile(r"--host(?:\s+|=)(?P<host>[\w.:\[\]-]+)")
+CLI_BIND_RE = re.compile(r"(?:--bind|-b)(?:\s+|=)['\"]?(?P<host>[\w.\[\]-]*):(?P<port>\d{2,5})\b")
+RUNSERVER_RE = re.compile(r"\brunserver\s+(?:--\S+\s+)*(?:(?P<host>[\w.\[\]-]+):)?(?P<port>\d{2,5})\b")
+EXPOSE_RE = re.compile(r"^\s*EXPOSE\s+(?P<port>\d{2,5})\b", re.MULTILINE)
+ALLOWED_HOSTS_RE = re.compile(r"ALLOWED_HOSTS\s*=\s*[\[(](?P<hosts>[^\])]*)[\])]")
+
+# When two patterns report the same value, the more specific one wins
+PRIORITY = {"env": 4, "server": 3, "url": 2, "setting": 1}
+
+
+def is_loopback(host: str) -> bool:
+    return host in LOOPBACK_HOSTS or bool(LOOPBACK_IP_RE.match(host))
+
+
+def file_type(rel_path: str) -> str | None:
+    name = rel_path.rsplit("/", 1)[-1]
+    if name == ".env" or name.startswith(".env.") or name.endswith(".env"):
+        return "env"
+    if name in SCRIPT_NAMES or name.startswith("Dockerfile"):
+        return "script"
+    ext = os.path.splitext(name)[1].lower()
+    if ext in PYTHON_EXTENSIONS:
+        return "python"
+    if ext in JS_EXTENSIONS:
+        return "js"
+    if ext in SCRIPT_EXTENSIONS:
+        return "script"
+    if ext in CONFIG_EXTENSIONS:
+        return "config"
+    if ext in MARKUP_EXTENSIONS:
+        return "markup"
+    return None
+
+
+def _call_end(text: str, start: int, limit: int = 2000) -> int:
+    # Index of the parenthesis closing the call whose arguments begin at `start`
+    depth = 1
+    for i in range(start, min(len(text), start + limit)):
+        if text[i] == "(":
+            depth += 1
+        elif text[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return start
+
+
+class _Findings:
+    def __init__(self, rel_path: str, text: str):
+        self.rel_path = rel_path
+        self.text = text
+        self.newlines = None
+        self.by_offset = {}
+
+    def add(self, offset: int, kind: str, value: str, source: str, env: str = None, **extra):
+        current = self.by_offset.get(offset)
+        if current and PRIORITY[current["source"]] >= PRIORITY[source]:
+            return
+        if self.newlines is None:
+            # Most files have no findings, so line offsets are only worked out on the first
+            self.newlines = [m.start() for m in re.finditer("\n", self.text)]
+        line = bisect.bisect_left(self.newlines, offset)
+        column = offset - (self.newlines[line - 1] + 1 if line else 0)
+        finding = {"path": self.rel_path, "line": line + 1, "column": column + 1, "offset": offset, "kind": kind,
+                   "value": value, "env": env, "source": source, **extra}
+        if kind in ("bind", "url", "host"):
+            host = extra.get("host", value)
+            # 0.0.0.0 is right to bind to but unreachable as a URL
+            finding["loopback"] = is_loopback(host) or (kind == "url" and host == "0.0.0.0")
+        self.by_offset[offset] = finding
+
+    def add_value(self, offset: int, value: str, source: str, name: str = "", env: str = None, server: bool = False):
+        # Classifies a literal by its shape and the name it's assigned to;
+        # `server` means it's an argument of the call that starts the server
+        upper = name.upper()
+        url = URL_RE.fullmatch(value)
+        if url:
+            self.add(offset, "url", value, source, env=env, host=url.group("host"))
+        elif value.isdigit() and len(value) <= 5 and (upper.endswith("PORT") or server):
+            # The name only says "listening port" when it's an environment variable, not e.g. a `port:` key
+            by_name = source != "setting" and bool(LISTEN_ENV_RE.match(upper))
+            self.add(offset, "port", value, source, env=env, port=int(value), listen=server or by_name)
+        elif HOSTLIKE_RE.match(value) and (server or (source != "setting" and BIND_ENV_RE.match(upper))):
+            self.add(offset, "bind", value, source, env=env)
+        elif HOSTLIKE_RE.match(value) and SETTING_KEY_RE.search(name) and not upper.endswith(("URL", "URI")):
+            self.add(offset, "host", value, source, env=env)
+
+    def sorted(self) -> list[dict]:
+        return [self.by_offset[k] for k in sorted(self.by_offset)]
+
+
+def _value_span(m: re.Match) -> tuple[int, str] | None:
+    for group in ("s", "n", "v"):
+        if group in m.re.groupindex and m.group(group) is not None:
+            return m.start(group), m.group(group)
+    return None
+
+
+def scan_text(rel_path: str, text: str, kind: str) -> list[dict]:
+    found = _Findings(rel_path, text)
+
+    # The substring checks skip most files before any pattern runs
+    if "://" in text:
+        for m in URL_RE.finditer(text):
+            found.add(m.start(), "url", m.group(0), "url", host=m.group("host"))
+
+    if kind in ("python", "js", "config"):
+        for m in SETTING_RE.finditer(text):
+            k = SETTING_KEY_BEFORE_RE.search(text, max(0, m.start() - 64), m.start())
+            key = k.group("key") if k else ""
+            if SETTING_KEY_RE.search(key):
+                offset, value = _value_span(m)
+                found.add_value(offset, value, "setting", name=key)
+
+    if kind == "python" and ".run" in text:
+        for m in RUN_CALL_RE.finditer(text):
+            end = _call_end(text, m.end())
+            args = text[m.end():end]
+            for h in HOST_KWARG_RE.finditer(args):
+                found.add(m.end() + h.start("host"), "bind", h.group("host"), "server")
+            for p in PORT_KWARG_RE.finditer(args):
+                found.add(m.end() + p.start("port"), "port", p.group("port"), "server", port=int(p.group("port")), listen=True)
+            for e in PY_ENV_DEFAULT_RE.finditer(args):
+                offset, value = _value_span(e)
+                before = args[:e.start()]
+                server = bool(PORT_ARG_TAIL_RE.search(before) or re.search(r"\bhost\s*=\s*$", before))
+                found.add_value(m.end() + offset, value, "env", name=e.group("env"), env=e.group("env"), server=server)
+    if kind == "python" and ("environ" in text or "getenv" in text):
+        for m in PY_ENV_DEFAULT_RE.finditer(text):
+            offset, value = _value_span(m)
+            found.add_value(offset, value, "env", name=m.group("env"), env=m.group("env"))
+    if kind == "python" and "ALLOWED_HOSTS" in text:
+        for m in ALLOWED_HOSTS_RE.finditer(text):
+            hosts = re.findall(r"['\"]([^'\"]+)['\"]", m.group("hosts"))
+            found.add(m.start("hosts"), "allowed_hosts", ",".join(hosts), "server", hosts=hosts,
+                      loopback=bool(hosts) and all(is_loopback(h) for h in hosts))
+
+    if kind == "js":
+        for m in LISTEN_RE.finditer(text):
+            found.add(m.start("port"), "port", m.group("port"), "server", port=int(m.group("port")), listen=True)
+            if m.group("host"):
+                found.add(m.start("host"), "bind", m.group("host"), "server")
+        for m in JS_ENV_DEFAULT_RE.finditer(text):
+            offset, value = _value_span(m)
+            found.add_value(offset, value, "env", name=m.group("env"), env=m.group("env"))
+
+    if kind in ("script", "env"):
+        for m in ENV_ASSIGN_RE.finditer(text):
+            offset, value = _value_span(m)
+            # What a .env file assigns, the app reads from that variable (so the deploy can
+            # override it); a start script's assignments are only reported
+            found.add_value(offset, value, "server", name=m.group("env"), env=m.group("env") if kind == "env" else None)
+
+    if kind == "script":
+        for m in CLI_PORT_RE.finditer(text):
+            found.add(m.start("port"), "port", m.group("port"), "server", port=int(m.group("port")), listen=True)
+        for m in CLI_HOST_RE.finditer(text):
+            found.add(m.start("host"), "bind", m.group("host"), "server")
+        for regex in (CLI_BIND_RE, RUNSERVER_RE):
+            for m in regex.finditer(text):
+                if m.group("host"):
+                    found.add(m.start("host"), "bind", m.group("host"), "server")
+                found.add(m.start("port"), "port", m.group("port"), "server", port=int(m.group("port")), listen=True)
+        for m in EXPOSE_RE.finditer(text):
+            found.add(m.start("port"), "port", m.group("port"), "server", port=int(m.group("port")), listen=True)
+
+    return found.sorted()
+
+
+def _read_text(path: str, max_bytes: int) -> str | None:
+    try:
+        if os.path.getsize(path) > max_bytes:
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if b"\0" in data[:8192]:
+        return None
+    # surrogateescape round-trips undecodable bytes, so offsets stay valid for rewriting
+    return data.decode("utf-8", errors="surrogateescape")
+
+
+def _scan_batch(repo_path: str, batch: list[tuple[str, str]], max_bytes: int) -> list[dict]:
+    findings = []
+    for rel_path, kind in batch:
+        text = _read_text(os.path.join(repo_path, rel_path), max_bytes)
+        if text:
+            findings.extend(scan_text(rel_path, text, kind))
+    return findings
+
+
+def scan_bindings(repo_path: str, files: list[str] = None, workers: int = None, max_bytes: int = SCAN_MAX_BYTES) -> list[dict]:
+    # Every finding in the repo, ordered by path and position. `files` (repo
+    # relative, e.g. from a RepoIndex) skips the walk.
+    if files is None:
+        files = [rel for rel, _, is_dir in walk_repo(repo_path) if not is_dir]
+    candidates = [(rel, kind) for rel in files if (kind := file_type(rel))]
+    batches = [candidates[i:i + SCAN_BATCH_FILES] for i in range(0, len(candidates), SCAN_BATCH_FILES)]
+    workers = min(workers or os.cpu_count() or 1, len(batches))
+    if len(candidates) < PARALLEL_MIN_FILES or workers < 2:
+        return _scan_batch(repo_path, candidates, max_bytes)
+
+    # Spawned, not forked: the pipeline calls this from worker threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        results = pool.map(_scan_batch, [repo_path] * len(batches), batches, [max_bytes] * len(batches))
+        return [finding for batch in results for finding in batch]
+
+
+def listen_ports(findings: list[dict], exclude: int = None, limit: int = MAX_EXTRA_PORTS) -> list[int]:
+    # Ports the app is started on, most mentioned first; SSH and privileged ports
+    # other than HTTP(S) are never opened from here
+    counts = {}
+    for f in findings:
+        if f["kind"] == "port" and f.get("listen"):
+            port = f["port"]
+            if port != exclude and port != 22 and (port >= 1024 or port in (80, 443)) and port <= 65535:
+                counts[port] = counts.get(port, 0) + 1
+    return sorted(counts, key=lambda p: (-counts[p], p))[:limit]
+
+
+def needs_rewrite(findings: list[dict]) -> bool:
+    return any(f.get("loopback") and f["kind"] in ("bind", "url") for f in findings)
+
+
+def _public_url(finding: dict, public_address: str) -> str:
+    m = URL_RE.fullmatch(finding["value"])
+    return finding["value"][:m.start("host")] + public_address + finding["value"][m.end("host"):]
+
+
+def binding_env(findings: list[dict], public_address: str) -> dict[str, str]:
+    # Environment for the app process: every variable the code reads with a
+    # loopback default is pointed at the VM instead
+    env = {}
+    for f in findings:
+        if not f["env"] or not f.get("loopback"):
+            continue
+        if f["kind"] == "bind":
+            env[f["env"]] = "0.0.0.0"
+        elif f["kind"] == "url":
+            env[f["env"]] = _public_url(f, public_address)
+    return env
+
+
+def rewrite_bindings(repo_path: str, findings: list[dict], public_address: str) -> list[dict]:
+    # For the dev-server fallback only: hardcoded loopback binds become 0.0.0.0
+    # and loopback URLs point at `public_address`, edited at the positions the
+    # scan reported. Values read from the environment are left to binding_env.
+    targets = {}
+    for f in findings:
+        if f["env"] is None and f.get("loopback") and f["kind"] in ("bind", "url") and file_type(f["path"]) in REWRITE_KINDS:
+            targets.setdefault(f["path"], []).append(f)
+
+    rewritten = []
+    for rel_path, file_findings in targets.items():
+        path = os.path.join(repo_path, rel_path)
+        text = _read_text(path, SCAN_MAX_BYTES)
+        if text is None:
+            continue
+        for f in sorted(file_findings, key=lambda f: f["offset"], reverse=True):
+            if text[f["offset"]:f["offset"] + len(f["value"])] != f["value"]:
+                print(f"[WARN] {rel_path}:{f['line']} changed since the scan; not rewriting {f['value']}")
+                continue
+            new = "0.0.0.0" if f["kind"] == "bind" else _public_url(f, public_address)
+            text = text[:f["offset"]] + new + text[f["offset"] + len(f["value"]):]
+            rewritten.append(dict(f, rewritten_to=new))
+        with open(path, "w", encoding="utf-8", errors="surrogateescape", newline="") as out:
+            out.write(text)
+    for f in sorted(rewritten, key=lambda f: (f["path"], f["line"])):
+        print(f"[INFO] {f['path']}:{f['line']}: {f['value']} -> {f['rewritten_to']}")
+    return rewritten
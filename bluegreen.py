@@ -0,0 +1,389 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import posixpath
+import shlex
+import sys
+import time
+import uuid
+from typing import TYPE_CHECKING
+
+from bindings import binding_env
+from deploy import analyze_repo, connect_instance, download_or_extract_code
+from dep_bundle import DEPS_DIR, offline_install_command, prepare_dependency_bundle, upload_dependency_bundle
+from detect import DEFAULT_PORTS, pip_install_args
+from launcher import LAUNCH_DIR, PYTHON_SERVER_PACKAGES, SYSTEMD_UNIT_DIR, plan_launch, remote_vcpus, systemd_unit, unit_name
+from manifest import remote_manifest_path, source_id, sync_tree
+from proxy import find_static_dirs, proxy_files, proxy_steps
+from remote_steps import put_files, run_steps, step
+from terraform_runner import terraform_outputs, workspace_path
+from tracing import span, trace
+
+if TYPE_CHECKING:
+    import paramiko
+
+# Zero-downtime redeploy onto an instance that's already running the app.
+# Releases live side by side under <root_dir>/.releases/<id>, each with its
+# own dependencies and its own systemd unit (<unit>-<port>). A new release
+# starts on whichever of the two ports is free, is health-checked there, and
+# only then gets the traffic: by rewriting the nginx upstream when the proxy
+# is in front, otherwise by an iptables REDIRECT from the public port. The
+# old unit is drained and stopped; the last `keep` releases stay on disk so
+# `rollback` is a restart, not an upload.
+
+RELEASES_DIR = ".releases"
+STATE_FILE = "state.json"
+DEPS_SUBDIR = ".deps"
+DEFAULT_KEEP = 3
+DEFAULT_DRAIN_SECONDS = 5
+DEFAULT_HEALTH_TIMEOUT = 60
+ALTERNATE_PORT_OFFSET = 10000
+NGINX_SITES = "/etc/nginx/sites-available"
+
+REDIRECT_UNIT = """[Unit]
+Description=autodeploy {name} port switch
+After=network.target
+
+[Service]
+Type=oneshot
+RemainAfterExit=yes
+ExecStart=/usr/sbin/iptables-restore --noflush {rules}
+ExecStartPost=/bin/sh -c 'iptables -t nat -C PREROUTING -p tcp --dport {port} -j {chain} 2>/dev/null || iptables -t nat -I PREROUTING -p tcp --dport {port} -j {chain}'
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+
+def releases_root(remote_root: str) -> str:
+    return f"{remote_root}/{RELEASES_DIR}"
+
+
+def alternate_port(port: int) -> int:
+    return port + ALTERNATE_PORT_OFFSET if port + ALTERNATE_PORT_OFFSET <= 65535 else port - ALTERNATE_PORT_OFFSET
+
+
+def new_release_id() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:4]}"
+
+
+def read_state(ssh: paramiko.SSHClient, remote_root: str) -> dict | None:
+    sftp = ssh.open_sftp()
+    try:
+        with sftp.open(f"{releases_root(remote_root)}/{STATE_FILE}", "r") as f:
+            return json.loads(f.read())
+    except (IOError, ValueError):
+        return None
+    finally:
+        sftp.close()
+
+
+def write_state(ssh: paramiko.SSHClient, remote_root: str, state: dict):
+    path = f"{releases_root(remote_root)}/{STATE_FILE}"
+    sftp = ssh.open_sftp()
+    try:
+        with sftp.open(f"{path}.tmp", "w") as f:
+            f.write(json.dumps(state, indent=2))
+        sftp.posix_rename(f"{path}.tmp", path)
+    finally:
+        sftp.close()
+
+
+def _probe(ssh: paramiko.SSHClient, name: str, legacy_command: str) -> set[str]:
+    # What a first blue/green redeploy takes over: the unit or dev server the
+    # plain deploy started, and whether nginx fronts it
+    site = f"{NGINX_SITES}/{name}"
+    checks = [
+        f"systemctl is-active --quiet {name} && echo legacy-unit",
+        f"pgrep -f -- {shlex.quote(legacy_command)} >/dev/null && echo legacy-dev",
+        f"[ -f {site} ] && echo nginx",
+        f"grep -qs proxy_cache_path {site} && echo micro_cache",
+    ]
+    _, stdout, _ = ssh.exec_command("; ".join(checks) + "; true")
+    return set(stdout.read().decode().split())
+
+
+def redirect_rules(chain: str, public_port: int, active_port: int) -> str:
+    # Declaring the chain in a --noflush restore replaces its rules in one commit
+    rules = ["*nat", f":{chain} - [0:0]"]
+    if active_port != public_port:
+        rules.append(f"-A {chain} -p tcp --dport {public_port} -j REDIRECT --to-ports {active_port}")
+    return "\n".join(rules + ["COMMIT", ""])
+
+
+def _switch(ssh: paramiko.SSHClient, state: dict, remote_root: str, release_dir: str, plan: dict, framework: str,
+            name: str, public_port: int) -> tuple[dict, list[dict]]:
+    # Files to put and steps that move the traffic to plan["port"]
+    if state["switch"] == "nginx":
+        files = proxy_files(None, release_dir, framework, None, plan["port"], name, micro_cache=state.get("micro_cache", False),
+                            static_dirs=plan["static_dirs"])
+        steps = proxy_steps(None, release_dir, framework, None, name, static_dirs=plan["static_dirs"])
+        return files, [dict(s, name=f"switch.{s['name']}") for s in steps]
+
+    releases = releases_root(remote_root)
+    chain = f"AUTODEPLOY-{public_port}"
+    redirect = f"{name}-redirect"
+    files = {
+        f"{releases}/redirect.rules.next": redirect_rules(chain, public_port, plan["port"]),
+        f"{releases}/{redirect}.service": REDIRECT_UNIT.format(name=name, rules=f"{releases}/redirect.rules",
+                                                               port=public_port, chain=chain),
+    }
+    # The rules file is what the unit re-applies at boot, so it only moves once the new release is healthy
+    return files, [step("switch", f"mv {releases}/redirect.rules.next {releases}/redirect.rules"
+                                  f" && sudo install -m 644 {releases}/{redirect}.service {SYSTEMD_UNIT_DIR}/{redirect}.service"
+                                  f" && sudo systemctl daemon-reload && sudo systemctl enable {redirect}"
+                                  f" && sudo systemctl restart {redirect}")]
+
+
+def _start_steps(unit: str, unit_file: str, port: int, health_path: str, health_timeout: int) -> list[dict]:
+    health = (f"for i in $(seq {health_timeout * 2}); do"
+              f" code=$(curl -s -o /dev/null -m 2 -w '%{{http_code}}' http://127.0.0.1:{port}{health_path});"
+              f" case $code in 000|5*) sleep 0.5;; *) echo \"healthy on :{port} ($code)\"; exit 0;; esac; done;"
+              f" echo \"not healthy on :{port} after {health_timeout}s (last status $code)\" >&2;"
+              f" sudo journalctl -u {unit} -n 30 --no-pager >&2; exit 1")
+    return [
+        step("start", f"sudo install -m 644 {shlex.quote(unit_file)} {SYSTEMD_UNIT_DIR}/{unit}.service"
+                      f" && sudo systemctl daemon-reload && sudo systemctl restart {unit}"),
+        step("health", health),
+    ]
+
+
+def _activate(ssh: paramiko.SSHClient, state: dict, remote_root: str, release_id: str, plan: dict, framework: str,
+              name: str, public_port: int, extra_steps: list[dict] = (), drain_seconds: int = DEFAULT_DRAIN_SECONDS,
+              health_path: str = "/", health_timeout: int = DEFAULT_HEALTH_TIMEOUT, user: str = "ubuntu",
+              label: str = None) -> bool:
+    # Starts `release_id` on the free port, checks it, switches traffic and
+    # retires the old unit. On failure before the switch the old one is untouched.
+    release_dir = f"{releases_root(remote_root)}/{release_id}"
+    active = state.get("active")
+    plan = dict(plan, port=alternate_port(public_port) if active and active["port"] == public_port else public_port)
+    unit = f"{name}-{plan['port']}"
+    unit_file = posixpath.join(release_dir, LAUNCH_DIR, f"{unit}.service")
+    workdir = posixpath.join(release_dir, plan["chdir"]) if plan["chdir"] else release_dir
+
+    files = {posixpath.join(workdir, LAUNCH_DIR, filename): content for filename, content in plan["files"].items()}
+    files[unit_file] = systemd_unit(plan, release_dir, unit, user)
+    files[f"{release_dir}/{LAUNCH_DIR}/plan.json"] = json.dumps(plan, indent=2)
+    switch_files, switch_steps = _switch(ssh, state, remote_root, release_dir, plan, framework, name, public_port)
+    files.update(switch_files)
+
+    steps = list(extra_steps) + _start_steps(unit, unit_file, plan["port"], health_path, health_timeout) + switch_steps
+    if active:
+        retire = f"sleep {drain_seconds}; sudo systemctl disable --now {active['unit']} 2>/dev/null"
+        if active.get("legacy_command"):
+            retire += f"; pkill -f -- {shlex.quote(active['legacy_command'])}"
+        steps.append(step("drain", retire + "; true"))
+
+    put_files(ssh, files)
+    with span("bluegreen.activate", release=release_id, port=plan["port"]):
+        run = run_steps(ssh, steps, label=label, span_prefix="bluegreen.")
+    switched = all(r["exit_status"] == 0 for r in run["steps"] if r["name"].startswith("switch"))
+    if not switched:
+        # The old release never stopped serving; take the new one back down
+        print(f"[ERROR] Release {release_id} not activated; {active['unit'] if active else 'nothing'} keeps serving")
+        run_steps(ssh, [step("abort", f"sudo systemctl disable --now {unit} 2>/dev/null; sudo rm -f {SYSTEMD_UNIT_DIR}/{unit}.service; true")],
+                  label=label, echo=False)
+        return False
+
+    state["active"] = {"release": release_id, "port": plan["port"], "unit": unit}
+    write_state(ssh, remote_root, state)
+    print(f"[INFO] Release {release_id} live on :{plan['port']} behind :{80 if state['switch'] == 'nginx' else public_port}")
+    return True
+
+
+def blue_green_deploy(ssh: paramiko.SSHClient, repo_path: str, remote_root: str, framework: str, main_file_path: str,
+                      port: int = None, dependency_path: str = None, dependency_bundle: dict = None, home: str = "/home/ubuntu",
+                      keep: int = DEFAULT_KEEP, drain_seconds: int = DEFAULT_DRAIN_SECONDS, health_path: str = "/",
+                      health_timeout: int = DEFAULT_HEALTH_TIMEOUT, max_workers: int = None, user: str = "ubuntu",
+                      label: str = None, env: dict = None, source_id: str = None) -> dict:
+    framework = framework.lower()
+    port = port or DEFAULT_PORTS.get(framework, 5000)
+    name = unit_name(posixpath.basename(remote_root))
+    releases = releases_root(remote_root)
+    plan = plan_launch(repo_path, framework, main_file_path, port, vcpus=remote_vcpus(ssh),
+                       manifest_path=dependency_path, max_workers=max_workers)
+    if plan is None:
+        # The dev server can't be pointed at another port or directory from outside
+        raise Exception("Blue/green needs an app server entry point (gunicorn or node cluster); redeploy with a full deploy")
+
+    state = read_state(ssh, remote_root)
+    if state is None:
+        legacy_command = f"[p]ython3 {remote_root}/{main_file_path}"
+        found = _probe(ssh, name, legacy_command)
+        state = {"public_port": port, "switch": "nginx" if "nginx" in found else "iptables",
+                 "micro_cache": "micro_cache" in found, "releases": [], "active": None}
+        if found & {"legacy-unit", "legacy-dev"}:
+            # The plain deploy's app holds the public port until the first switch
+            state["active"] = {"release": None, "port": port, "unit": name,
+                               "legacy_command": legacy_command if "legacy-dev" in found else None}
+    public_port = state["public_port"]
+
+    release_id = new_release_id()
+    release_dir = f"{releases}/{release_id}"
+    previous = state["releases"][0] if state["releases"] else None
+    result = {"release": release_id, "previous": (state.get("active") or {}).get("release"), "activated": False}
+
+    # Seeded from the previous release (or the plain deploy's tree) so the upload is a delta;
+    # python dependencies are reinstalled per release, node_modules is reused by npm
+    seed_from = f"{releases}/{previous}" if previous else remote_root
+    seed = (f"mkdir -p {release_dir} && cd {shlex.quote(seed_from)}"
+            f" && find . -mindepth 1 -maxdepth 1 ! -name {RELEASES_DIR} ! -name {DEPS_SUBDIR} -exec cp -a {{}} {release_dir}/ \\;"
+            f" && {{ cp {shlex.quote(remote_manifest_path(seed_from))} {remote_manifest_path(release_dir)} 2>/dev/null || true; }}")
+    with span("bluegreen.seed", source=seed_from):
+        if not run_steps(ssh, [step("seed", f"if [ -d {shlex.quote(seed_from)} ]; then {seed}; else mkdir -p {release_dir}; fi")],
+                         label=label, echo=False)["ok"]:
+            raise Exception(f"Could not create release directory {release_dir}")
+    with span("bluegreen.upload") as s:
+        s.add_stats(sync_tree(ssh, repo_path, release_dir, cache_key=source_id))
+
+    deps = []
+    manifest = f"{release_dir}/{dependency_path}" if dependency_path else None
+    if framework in ("flask", "django"):
+        target = f"{release_dir}/{DEPS_SUBDIR}"
+        pip_args = pip_install_args(manifest)
+        network = (f"python3 -m pip install --quiet --target {target}"
+                   f"{' ' + pip_args if pip_args else ''} {' '.join(PYTHON_SERVER_PACKAGES)}")
+        if dependency_bundle and manifest:
+            remote_bundle = upload_dependency_bundle(ssh, dependency_bundle, remote_store=f"{home}/{DEPS_DIR}")
+            offline = offline_install_command(dependency_bundle, remote_bundle, manifest, target=target)
+            network = f"{{ {offline} || {{ rm -rf {target}; {network}; }}; }}"
+        deps.append(step("dependencies", f"rm -rf {target} && {network}", retries=1))
+        plan["pythonpath"] = target
+    elif framework == "nodejs" and manifest:
+        network = f"cd {shlex.quote(posixpath.dirname(manifest))} && npm install --no-audit --no-fund"
+        if dependency_bundle:
+            remote_bundle = upload_dependency_bundle(ssh, dependency_bundle, remote_store=f"{home}/{DEPS_DIR}")
+            network = f"{{ {offline_install_command(dependency_bundle, remote_bundle, manifest)} || ({network}); }}"
+        deps.append(step("dependencies", network, retries=1))
+    plan["static_dirs"] = find_static_dirs(repo_path, framework, main_file_path)
+    # Kept in the release's plan.json, so a rollback starts it with the same environment
+    plan["env"] = env or {}
+
+    if not _activate(ssh, state, remote_root, release_id, plan, framework, name, public_port, extra_steps=deps,
+                     drain_seconds=drain_seconds, health_path=health_path, health_timeout=health_timeout, user=user,
+                     label=label):
+        run_steps(ssh, [step("discard", f"rm -rf {release_dir} {remote_manifest_path(release_dir)}")], label=label, echo=False)
+        return result
+
+    state["releases"].insert(0, release_id)
+    pruned = state["releases"][max(keep, 2):]
+    state["releases"] = state["releases"][:max(keep, 2)]
+    write_state(ssh, remote_root, state)
+    if pruned:
+        targets = " ".join(f"{releases}/{r} {remote_manifest_path(f'{releases}/{r}')}" for r in pruned)
+        run_steps(ssh, [step("prune", f"rm -rf {targets}")], label=label, echo=False)
+    result.update(activated=True, port=state["active"]["port"], releases=state["releases"], pruned=pruned)
+    return result
+
+
+def rollback(ssh: paramiko.SSHClient, remote_root: str, framework: str, to_release: str = None,
+             drain_seconds: int = DEFAULT_DRAIN_SECONDS, health_path: str = "/", health_timeout: int = DEFAULT_HEALTH_TIMEOUT,
+             user: str = "ubuntu", label: str = None) -> dict:
+    # Back to `to_release`, by default the one before the active release; it's still on disk
+    state = read_state(ssh, remote_root)
+    if not state or not state.get("active"):
+        raise Exception(f"No blue/green releases recorded under {releases_root(remote_root)}")
+    releases = state["releases"]
+    current = state["active"]["release"]
+    if to_release is None:
+        older = releases[releases.index(current) + 1:] if current in releases else []
+        if not older:
+            raise Exception(f"No release older than {current} is kept; nothing to roll back to")
+        to_release = older[0]
+    elif to_release not in releases:
+        raise Exception(f"Release {to_release} isn't kept (have: {', '.join(releases)})")
+
+    sftp = ssh.open_sftp()
+    try:
+        with sftp.open(f"{releases_root(remote_root)}/{to_release}/{LAUNCH_DIR}/plan.json", "r") as f:
+            plan = json.loads(f.read())
+    finally:
+        sftp.close()
+    name = unit_name(posixpath.basename(remote_root))
+    activated = _activate(ssh, state, remote_root, to_release, plan, framework.lower(), name, state["public_port"],
+                          drain_seconds=drain_seconds, health_path=health_path, health_timeout=health_timeout,
+                          user=user, label=label)
+    return {"release": to_release, "previous": current, "activated": activated}
+
+
+def redeploy(workspace: str, repo_url: str = None, zip_file_path: str = None, ref: str = None, app_type: str = "unknown",
+             keep: int = DEFAULT_KEEP, drain_seconds: int = DEFAULT_DRAIN_SECONDS, health_path: str = "/",
+             bundle_dependencies: bool = True, to_release: str = None, do_rollback: bool = False,
+             ssh_host: str = None, ssh_port: int = 22, remote_home: str = None, trace_dir: str = None) -> dict:
+    # Redeploys (or rolls back) the instances recorded in a terraform workspace,
+    # one after another so a fleet keeps serving throughout
+    if os.sep not in workspace:
+        workspace = workspace_path(workspace)
+    outputs = terraform_outputs(workspace)
+    public_ips = [ip for ip in (outputs.get("public_ips") or [outputs.get("public_ip")]) if ip]
+    if not public_ips or not outputs.get("private_key_pem"):
+        raise Exception(f"No instance or key in the terraform state at {workspace}")
+    home = remote_home or "/home/ubuntu"
+
+    with trace("redeploy", out_dir=trace_dir, workspace=workspace, rollback=do_rollback) as root:
+        with span("acquire"):
+            code_path, root_dir, tree, index = download_or_extract_code(repo_url=repo_url, zip_file_path=zip_file_path, ref=ref)
+        with span("analyze"):
+            analysis = analyze_repo(code_path, root_dir, tree, known_framework=app_type, index=index)
+        remote_root = f"{home}/{root_dir}"
+
+        bundle = None
+        if bundle_dependencies and not do_rollback:
+            with span("dependency_bundle"):
+                bundle = prepare_dependency_bundle(analysis["framework"], code_path, analysis["dependency_manifest_path"],
+                                                   extra_packages=PYTHON_SERVER_PACKAGES)
+
+        results = {}
+        for ip in public_ips:
+            with span("bluegreen.instance", host=ip):
+                ssh = connect_instance(ip, outputs["private_key_pem"], ssh_host=ssh_host, ssh_port=ssh_port)
+                try:
+                    if do_rollback:
+                        results[ip] = rollback(ssh, remote_root, analysis["framework"], to_release=to_release,
+                                               drain_seconds=drain_seconds, health_path=health_path, label=ip)
+                    else:
+                        results[ip] = blue_green_deploy(ssh, code_path, remote_root, analysis["framework"],
+                                                        analysis["main_file_path"], port=analysis["ports"][0],
+                                                        dependency_path=analysis["dependency_manifest_path"],
+                                                        dependency_bundle=bundle, home=home, keep=keep,
+                                                        drain_seconds=drain_seconds, health_path=health_path, label=ip,
+                                                        env=binding_env(analysis["bindings"], outputs.get("lb_dns_name") or ip),
+                                                        source_id=source_id(repo_url, root_dir))
+                finally:
+                    ssh.close()
+            if not results[ip]["activated"]:
+                # Stop the rollout; the remaining instances still run the old release
+                print(f"[ERROR] {ip} failed; not continuing to {len(public_ips) - len(results)} more instance(s)")
+                break
+        root.set(activated=all(r["activated"] for r in results.values()) and len(results) == len(public_ips))
+        return {"instances": results, "trace_id": root.trace_id}
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Zero-downtime redeploy onto the instances of a terraform workspace")
+    parser.add_argument("workspace", help="terraform workspace path or name from the original deploy")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--repo", help="git URL of the new version")
+    source.add_argument("--zip", help="zip file of the new version")
+    parser.add_argument("--ref", help="git ref to deploy")
+    parser.add_argument("--framework", default="unknown", help="skip detection for this framework")
+    parser.add_argument("--keep", type=int, default=DEFAULT_KEEP, help="releases to keep for rollback")
+    parser.add_argument("--drain", type=int, default=DEFAULT_DRAIN_SECONDS, help="seconds the old release keeps serving in-flight requests")
+    parser.add_argument("--health-path", default="/", help="path the new release must answer before the switch")
+    parser.add_argument("--rollback", action="store_true", help="switch back to the previous release instead of deploying")
+    parser.add_argument("--to", dest="to_release", help="release id to roll back to")
+    args = parser.parse_args(argv)
+    if not (args.repo or args.zip):
+        parser.error("the source is needed to find the app (--repo or --zip), also with --rollback")
+
+    result = redeploy(args.workspace, repo_url=args.repo, zip_file_path=args.zip, ref=args.ref, app_type=args.framework,
+                      keep=args.keep, drain_seconds=args.drain, health_path=args.health_path,
+                      to_release=args.to_release, do_rollback=args.rollback)
+    print(json.dumps(result["instances"], indent=2))
+    return 0 if all(r["activated"] for r in result["instances"].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
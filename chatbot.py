@@ -1,5 +1,7 @@
-from openai import OpenAI
 import json
+import threading
+from llm_cache import get_cache, make_key
+from tracing import current_span, span
 
 SYSTEM_PROMPT = """
 You are a deployment instruction parser. The user will provide a natural language description of how they want their application deployed. Your job is to extract key information from their request and produce a well-formed JSON object only.
@@ -77,23 +79,62 @@ Ideal JSON:
 }
 """
 
-client = OpenAI()
+MODEL = "gpt-4o-mini"
+
+# Built on first use, so importing this module (and everything that only
+# analyzes a repo locally) neither loads openai nor needs OPENAI_API_KEY.
+# Assigning a client here (e.g. a stand-in) takes precedence.
+client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                from openai import OpenAI
+                client = OpenAI()
+    return client
+
+
+def _complete(system_prompt: str, user_content: str) -> str | None:
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content}
+    ]
+    cache = get_cache()
+    key = make_key(MODEL, messages, temperature=0.0)
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            current_span().count("llm_cache_hits")
+            return cached
+
+    with span("llm", model=MODEL):
+        response = get_client().chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            temperature=0.0  # Keeps output deterministic
+        )
+
+    if not response.choices:
+        return None
+    output_text = response.choices[0].message.content
+
+    # Only remember answers we can actually use
+    if cache:
+        try:
+            json.loads(output_text)
+            cache.put(key, output_text)
+        except (TypeError, json.JSONDecodeError):
+            pass
+    return output_text
+
 
 def process_deployment_request(user_text: str) -> dict:
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_text}
-        ],
-        temperature=0.0  # Keeps output deterministic
-    )
-
-    if response.choices:
-        output_text = response.choices[0].message.content
-    else:
-        output_text = "Sorry, I couldn't understand your request."
-    
+    output_text = _complete(SYSTEM_PROMPT, user_text) or "Sorry, I couldn't understand your request."
+
     try:
         return json.loads(output_text)
     except json.JSONDecodeError:
@@ -101,22 +142,10 @@ def process_deployment_request(user_text: str) -> dict:
         return {"cloud_provider": "aws", "application_type": None, "resource_size": None}
     
 def get_repo_structure(root_dir, tree, framework):
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": STRUCTURE_PROMPT},
-            {"role": "user", "content": f"Framework: {framework}\nTree:\n{root_dir}\n{tree}"}
-        ],
-        temperature=0.0  # Keeps output deterministic
-    )
-
-    if response.choices:
-        output_text = response.choices[0].message.content
-    else:
-        output_text = "Sorry, I couldn't understand your request."
-    
+    output_text = _complete(STRUCTURE_PROMPT, f"Framework: {framework}\nTree:\n{root_dir}\n{tree}") or "Sorry, I couldn't understand your request."
+
     try:
         return json.loads(output_text)
     except json.JSONDecodeError:
         # Fallback if GPT doesn't return valid JSON
-        return {"dependency_manifest_path": None, "main_file_path": None}
\ No newline at end of file
+        return {"dependency_manifest_path": None, "main_file_path": None}
@@ -0,0 +1,12 @@
+import os
+
+# Local state kept between runs (hash caches, LLM responses, git mirrors, ...)
+CACHE_DIR = os.environ.get("AUTODEPLOY_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "autodeploy"
+)
+
+
+def cache_path(*parts: str) -> str:
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
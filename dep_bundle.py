@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import TYPE_CHECKING
+
+from config import cache_path
+from ignore import IgnoreRules
+from transfer import upload_tree
+
+if TYPE_CHECKING:
+    import paramiko
+
+# What the VM runs: Ubuntu 22.04 on x86_64 ships CPython 3.10
+TARGET_PYTHON = "3.10"
+TARGET_PLATFORMS = ["manylinux_2_35_x86_64", "manylinux_2_28_x86_64", "manylinux2014_x86_64", "linux_x86_64"]
+DEPS_DIR = ".autodeploy-deps"
+REMOTE_STORE = f"/home/ubuntu/{DEPS_DIR}"
+COMPLETE_MARKER = ".complete"
+
+
+def bundle_key(framework: str, repo_path: str, manifest_path: str, extra_packages: list[str] = ()) -> str:
+    h = hashlib.sha256(f"{framework}:{TARGET_PYTHON}:{','.join(TARGET_PLATFORMS)}:{','.join(extra_packages)}:".encode())
+    manifest_dir = os.path.dirname(os.path.join(repo_path, manifest_path))
+    for name in (os.path.basename(manifest_path), "package-lock.json"):
+        path = os.path.join(manifest_dir, name)
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                h.update(name.encode() + b"\0" + f.read())
+    return h.hexdigest()[:24]
+
+
+def _build_wheels(manifest: str, out_dir: str, extra_packages: list[str] = ()):
+    wheels = os.path.join(out_dir, "wheels")
+    os.makedirs(wheels, exist_ok=True)
+    platform_args = [arg for p in TARGET_PLATFORMS for arg in ("--platform", p)]
+    subprocess.run(
+        [sys.executable, "-m", "pip", "download", "--quiet", "--disable-pip-version-check",
+         "-r", manifest, "-d", wheels, "--only-binary=:all:", "--implementation", "cp",
+         "--python-version", TARGET_PYTHON, *platform_args, *extra_packages],
+        check=True,
+    )
+
+
+def _build_npm_cache(manifest: str, out_dir: str):
+    npm = shutil.which("npm")
+    if not npm:
+        raise FileNotFoundError("npm is not installed locally")
+    work = tempfile.mkdtemp(prefix="npm_bundle_")
+    try:
+        shutil.copy(manifest, work)
+        lock = os.path.join(os.path.dirname(manifest), "package-lock.json")
+        if os.path.isfile(lock):
+            shutil.copy(lock, work)
+        else:
+            subprocess.run([npm, "install", "--package-lock-only", "--no-audit", "--no-fund"], cwd=work, check=True)
+        # Populating a private cache is all we need; the VM builds node_modules from it offline
+        cache = os.path.join(out_dir, "npm-cache")
+        subprocess.run([npm, "ci", "--cache", cache, "--ignore-scripts", "--no-audit", "--no-fund"], cwd=work, check=True)
+        shutil.copy(os.path.join(work, "package-lock.json"), os.path.join(out_dir, "package-lock.json"))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def prepare_dependency_bundle(framework: str, repo_path: str, manifest_path: str, extra_packages: list[str] = ()) -> dict | None:
+    if not manifest_path:
+        return None
+    name = os.path.basename(manifest_path)
+    if not ((framework in ("flask", "django") and name == "requirements.txt")
+            or (framework == "nodejs" and name == "package.json")):
+        return None
+
+    # Extras (e.g. the app server) only apply to wheel bundles
+    extra_packages = list(extra_packages) if name == "requirements.txt" else []
+    key = bundle_key(framework, repo_path, manifest_path, extra_packages)
+    store = os.path.join(cache_path("deps"), key)
+    # Bundles are built in a temp dir and renamed into place, so existing means complete
+    if os.path.isdir(store):
+        print(f"[INFO] Reusing local dependency bundle {key}")
+        return {"key": key, "path": store, "kind": name, "extra_packages": extra_packages}
+
+    building = tempfile.mkdtemp(prefix=f"{key}.", dir=cache_path("deps"))
+    try:
+        print(f"[INFO] Building dependency bundle {key} from {manifest_path}...")
+        manifest = os.path.join(repo_path, manifest_path)
+        if name == "requirements.txt":
+            _build_wheels(manifest, building, extra_packages)
+        else:
+            _build_npm_cache(manifest, building)
+        try:
+            os.rename(building, store)
+        except OSError:
+            # Another process finished the same bundle first; theirs is identical
+            shutil.rmtree(building, ignore_errors=True)
+    except (subprocess.CalledProcessError, OSError) as e:
+        shutil.rmtree(building, ignore_errors=True)
+        print(f"[WARN] Could not build a dependency bundle ({e}); the VM will install from the network")
+        return None
+    return {"key": key, "path": store, "kind": name, "extra_packages": extra_packages}
+
+
+def upload_dependency_bundle(ssh: paramiko.SSHClient, bundle: dict, remote_store: str = REMOTE_STORE) -> str:
+    remote = f"{remote_store}/{bundle['key']}"
+    _, stdout, _ = ssh.exec_command(f"test -f {shlex.quote(remote)}/{COMPLETE_MARKER}")
+    if stdout.channel.recv_exit_status() == 0:
+        print(f"[INFO] Dependency bundle {bundle['key']} already on the VM")
+        return remote
+    # A bundle is shipped verbatim; the repo ignore defaults don't apply to it
+    upload_tree(ssh, bundle["path"], remote, rules=IgnoreRules())
+    # Marked only once every file landed, so an interrupted upload is redone next time
+    ssh.exec_command(f"touch {shlex.quote(remote)}/{COMPLETE_MARKER}")[1].channel.recv_exit_status()
+    return remote
+
+
+def offline_install_command(bundle: dict, remote_bundle: str, remote_manifest: str, target: str = None) -> str:
+    # `target` installs python packages into that directory instead of system-wide
+    if bundle["kind"] == "requirements.txt":
+        pip = f"python3 -m pip install --target {shlex.quote(target)}" if target else "sudo python3 -m pip install"
+        return (f"{pip} --no-index --find-links {shlex.quote(remote_bundle)}/wheels "
+                f"-r {shlex.quote(remote_manifest)} {' '.join(map(shlex.quote, bundle.get('extra_packages', [])))}").rstrip()
+    app_dir = shlex.quote(os.path.dirname(remote_manifest))
+    return (f"cd {app_dir} && ( [ -f package-lock.json ] || cp {shlex.quote(remote_bundle)}/package-lock.json . ) "
+            f"&& npm ci --offline --no-audit --no-fund --cache {shlex.quote(remote_bundle)}/npm-cache")
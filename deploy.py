@@ -1,84 +1,140 @@
+from __future__ import annotations
+
 import os
-import subprocess
 import tempfile
-import zipfile
-import re
-import paramiko
+import shlex
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from io import StringIO
-import time
+from typing import TYPE_CHECKING
+from acquire import acquire_git_repo, extract_zip, repo_name_from_url
+from bindings import binding_env, listen_ports, needs_rewrite, rewrite_bindings, scan_bindings
 from chatbot import get_repo_structure
-
-
-def download_or_extract_code(repo_url: str = None, zip_file_path: str = None) -> tuple[str, str, str]:
+from dep_bundle import DEPS_DIR, offline_install_command, upload_dependency_bundle
+from detect import CONFIDENCE_THRESHOLD, DEFAULT_PORTS, detect_app, manifest_kind, pip_install_args
+from images import BASE_AMI
+from launcher import PYTHON_SERVER_PACKAGES, plan_launch, remote_vcpus, service_files, service_steps, unit_name
+from manifest import sync_tree
+from proxy import PROXY_PORTS, proxy_files, proxy_steps
+from transfer import DEFAULT_UPLOAD_WORKERS, stream_tarball, upload_tree
+from readiness import wait_until_ready
+from remote_steps import put_files, run_steps, step
+from terraform_runner import DEFAULT_PARALLELISM, apply_config
+from tracing import span
+from walker import RepoIndex, build_index
+
+if TYPE_CHECKING:
+    import paramiko
+
+# unattended-upgrades may still hold the dpkg lock after cloud-init is done;
+# let apt wait for it rather than failing
+APT_LOCK_TIMEOUT = 300
+
+
+def download_or_extract_code(repo_url: str = None, zip_file_path: str = None, ref: str = None, use_git_cache: bool = None) -> tuple[str, str, str, RepoIndex]:
     temp_dir = tempfile.mkdtemp(prefix="app_code_")
 
     if repo_url and repo_url != "":
-        print(f"[INFO] Cloning repo from {repo_url} to {temp_dir}...")
-        subprocess.run(["git", "clone", repo_url, temp_dir], check=True)
-        # Get the repo name from the URL
-        repo_name = repo_url.rstrip('/').split('/')[-1]
-        if repo_name.endswith('.git'):
-            repo_name = repo_name[:-4]
-        return temp_dir, repo_name, tree(temp_dir)
+        print(f"[INFO] Fetching repo from {repo_url} to {temp_dir}...")
+        with span("acquire.clone", ref=ref or ""):
+            acquire_git_repo(repo_url, temp_dir, ref=ref, use_cache=use_git_cache)
+        repo_name = repo_name_from_url(repo_url)
+        with span("acquire.index") as s:
+            index = build_index(temp_dir)
+            s.count("files", len(index.files))
+            return temp_dir, repo_name, index.tree_text(), index
 
     if zip_file_path and zip_file_path != "":
         print(f"[INFO] Extracting zip file from {zip_file_path} to {temp_dir}...")
-        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-            # Get the root folder name from the first item in the zipfile
-            first_item = zip_ref.namelist()[0]
-            root_folder = first_item.split('/')[0]
-            zip_ref.extractall(temp_dir)
-        return temp_dir, repo_name, tree(temp_dir)
-
-    return temp_dir, "", tree(temp_dir)
-
-
-def analyze_repo(repo_path: str, repo_name: str, tree: str, known_framework: str = None) -> dict:
-    repo_structure = get_repo_structure(repo_name, tree, known_framework)
+        with span("acquire.extract"):
+            code_path, root_name = extract_zip(zip_file_path, temp_dir)
+        with span("acquire.index") as s:
+            index = build_index(code_path)
+            s.count("files", len(index.files))
+            return code_path, root_name, index.tree_text(), index
+
+    index = build_index(temp_dir)
+    return temp_dir, "", index.tree_text(), index
+
+
+def analyze_repo(repo_path: str, repo_name: str, tree: str, known_framework: str = None, index: RepoIndex = None,
+                 use_llm: bool = True) -> dict:
+    files = index.files if index is not None and index.repo_path == repo_path else None
+    detected = detect_app(repo_path, files=files, known_framework=known_framework)
+    print(f"[INFO] Local detection confidence {detected['confidence']:.2f}: {detected}")
     results = {
-        "framework": known_framework or "unknown",
-        "ports": [5000],  # default assumption
+        "framework": detected["framework"],
+        "ports": detected["ports"],
         "needs_localhost_replacement": False,
-        **repo_structure # dependency_manifest_path, main_file_path
+        "dependency_manifest_path": detected["dependency_manifest_path"],
+        "main_file_path": detected["main_file_path"],
     }
 
-    # Check for Flask or Django in requirements.txt / package.json
-    if os.path.isfile(results["dependency_manifest_path"]):
-        with open(results["dependency_manifest_path"], "r") as f:
-            content = f.read().lower()
-            if "django" in content:
-                results["framework"] = "django"
-                results["ports"] = [5000]
-            elif "flask" in content:
-                results["framework"] = "flask"
-                results["ports"] = [5000]
-            elif "express" in content:
-                results["framework"] = "nodejs"
-                results["ports"] = [5000]
-
-    # Very naive check for 'localhost' references
-    # Only check for localhost references in main file
-    if results["main_file_path"]:
-        with open(os.path.join(repo_path, results["main_file_path"]), "r", encoding="utf-8", errors="ignore") as code_file:
-            code_text = code_file.read()
-            if "localhost" in code_text or "127.0.0.1" in code_text:
-                results["needs_localhost_replacement"] = True
+    # Only pay for an LLM round trip when the heuristics aren't sure
+    if detected["confidence"] < CONFIDENCE_THRESHOLD and not use_llm:
+        print("[WARN] Low confidence and the LLM is off; going with the local detection")
+    elif detected["confidence"] < CONFIDENCE_THRESHOLD:
+        print("[INFO] Low confidence, asking the LLM for the project structure...")
+        repo_structure = get_repo_structure(repo_name, tree, known_framework)
+        for key in ("dependency_manifest_path", "main_file_path"):
+            if repo_structure.get(key):
+                results[key] = repo_structure[key]
+
+        # Check for Flask or Django in requirements.txt / package.json
+        manifest_path = os.path.join(repo_path, results["dependency_manifest_path"] or "")
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, "r") as f:
+                content = f.read().lower()
+                if "django" in content:
+                    results["framework"] = "django"
+                elif "flask" in content:
+                    results["framework"] = "flask"
+                elif "express" in content:
+                    results["framework"] = "nodejs"
+
+    # Decides the install command: pip -r, pip install <project dir> or npm
+    results["dependency_manifest_kind"] = manifest_kind(results["dependency_manifest_path"])
+    if results["dependency_manifest_kind"] == "pipfile":
+        print(f"[WARN] pip can't install from {results['dependency_manifest_path']}; add a requirements.txt or pyproject.toml")
+
+    # Every host/port/URL binding in the repo (see bindings.py); other ports the
+    # app listens on are opened next to the main one
+    with span("analyze.bindings") as s:
+        bindings = scan_bindings(repo_path, files=files)
+        s.count("findings", len(bindings))
+    results["bindings"] = bindings
+    results["needs_localhost_replacement"] = needs_rewrite(bindings)
+    results["ports"] = [*results["ports"], *listen_ports(bindings, exclude=results["ports"][0])]
+    for f in bindings:
+        if f.get("loopback") and f["kind"] in ("bind", "url", "allowed_hosts"):
+            via = f" (from ${f['env']})" if f["env"] else ""
+            print(f"[INFO] Loopback {f['kind']} {f['value']} at {f['path']}:{f['line']}{via}")
+        if f["kind"] == "allowed_hosts" and f.get("loopback"):
+            print(f"[WARN] {f['path']}:{f['line']}: ALLOWED_HOSTS only allows loopback; Django will reject requests to the VM")
 
     return results
 
 
-def generate_terraform_config(provider: str, repo_analysis: dict, instance_type: str = "t2.micro") -> str:
+def generate_terraform_config(provider: str, repo_analysis: dict, instance_type: str = "t2.micro", ami: str = None, proxy: bool = False,
+                              instance_count: int = 1, health_check_path: str = "/", name_suffix: str = None) -> str:
     import random
     import string
 
     region = "us-east-1"
-    ami = "ami-08c40ec9ead489470"
+    # A pre-baked image (see images.py) already has the runtime and dependencies
+    prebaked = ami is not None
+    ami = ami or BASE_AMI
 
     if provider.lower() != "aws":
         return "# Future: Add Terraform config for other providers"
 
-    # build ingress rules from ports discovered
-    ports = repo_analysis.get("ports", [5000])
+    # build ingress rules from ports discovered; behind nginx only the proxy is exposed
+    ports = PROXY_PORTS if proxy else repo_analysis.get("ports", [5000])
+    app_port = 80 if proxy else ports[0]
+    scaled = instance_count > 1
+    if scaled and 80 not in ports:
+        # The load balancer shares the security group and listens on 80
+        ports = [*ports, 80]
     ingress_blocks = []
     for p in ports:
         ingress_blocks.append(f"""
@@ -104,10 +160,15 @@ def generate_terraform_config(provider: str, repo_analysis: dict, instance_type:
     ingress_str = "".join(ingress_blocks)
 
     framework = repo_analysis.get("framework", "unknown")
-    user_data_script = generate_user_data_script(framework)
+    user_data_script = generate_user_data_script(framework, prebaked=prebaked, proxy=proxy)
 
-    # Random suffix for unique resource names
-    random_suffix = ''.join(random.choices(string.ascii_lowercase + string.digits, k=6))
+    # Suffix for unique resource names; stable per workspace when given, so re-applies update in place
+    random_suffix = name_suffix or ''.join(random.choices(string.ascii_lowercase + string.digits, k=6))
+
+    instance_count_line = f"  count                  = {instance_count}\n\n" if scaled else ""
+    subnet_index = "count.index" if scaled else "0"
+    instance_outputs = _instance_outputs(scaled)
+    load_balancer = _load_balancer_config(random_suffix, instance_count, app_port, health_check_path) if scaled else ""
 
     tf_config = f"""
 terraform {{
@@ -179,10 +240,10 @@ resource "aws_key_pair" "generated_key" {{
 }}
 
 resource "aws_instance" "app_server" {{
-  ami                    = "{ami}"
+{instance_count_line}  ami                    = "{ami}"
   instance_type          = "{instance_type}"
   key_name               = aws_key_pair.generated_key.key_name
-  subnet_id              = element(data.aws_subnets.default.ids, 0)
+  subnet_id              = element(data.aws_subnets.default.ids, {subnet_index})
   vpc_security_group_ids = [local.final_sg_id]
 
   user_data = <<-EOT
@@ -193,12 +254,8 @@ resource "aws_instance" "app_server" {{
     Name = "AutoDeployedVM"
   }}
 }}
-
-output "public_ip" {{
-  description = "Public IP of the instance"
-  value       = aws_instance.app_server.public_ip
-}}
-
+{load_balancer}
+{instance_outputs}
 output "private_key_pem" {{
   description = "Private key in PEM format (Sensitive! Do not commit to public repos)"
   value       = tls_private_key.ssh_key.private_key_pem
@@ -207,234 +264,297 @@ output "private_key_pem" {{
 """
     return tf_config
 
-def generate_user_data_script(framework: str) -> str:
-    if framework in ["flask", "django"]:
+
+def _instance_outputs(scaled: bool) -> str:
+    if not scaled:
+        return """output "public_ip" {
+  description = "Public IP of the instance"
+  value       = aws_instance.app_server.public_ip
+}
+"""
+    return """output "public_ip" {
+  description = "Public IP of the first instance"
+  value       = aws_instance.app_server[0].public_ip
+}
+
+output "public_ips" {
+  description = "Public IPs of every instance behind the load balancer"
+  value       = aws_instance.app_server[*].public_ip
+}
+
+output "lb_dns_name" {
+  description = "DNS name of the application load balancer"
+  value       = aws_lb.app_lb.dns_name
+}
+"""
+
+
+def _load_balancer_config(random_suffix: str, instance_count: int, app_port: int, health_check_path: str) -> str:
+    # Instances are spread round-robin over the default subnets (one per AZ)
+    return f"""
+resource "aws_lb" "app_lb" {{
+  name               = "autodeploy-lb-{random_suffix}"
+  load_balancer_type = "application"
+  security_groups    = [local.final_sg_id]
+  subnets            = data.aws_subnets.default.ids
+}}
+
+resource "aws_lb_target_group" "app_tg" {{
+  name                 = "autodeploy-tg-{random_suffix}"
+  port                 = {app_port}
+  protocol             = "HTTP"
+  vpc_id               = data.aws_vpc.default.id
+  deregistration_delay = 30
+
+  health_check {{
+    path                = "{health_check_path}"
+    port                = "traffic-port"
+    matcher             = "200-399"
+    interval            = 10
+    timeout             = 5
+    healthy_threshold   = 2
+    unhealthy_threshold = 3
+  }}
+}}
+
+resource "aws_lb_target_group_attachment" "app_tg_attachment" {{
+  count            = {instance_count}
+  target_group_arn = aws_lb_target_group.app_tg.arn
+  target_id        = aws_instance.app_server[count.index].id
+  port             = {app_port}
+}}
+
+resource "aws_lb_listener" "app_http" {{
+  load_balancer_arn = aws_lb.app_lb.arn
+  port              = 80
+  protocol          = "HTTP"
+
+  default_action {{
+    type             = "forward"
+    target_group_arn = aws_lb_target_group.app_tg.arn
+  }}
+}}
+"""
+
+
+def generate_user_data_script(framework: str, prebaked: bool = False, proxy: bool = False) -> str:
+    # nginx goes in with the base packages so deploy doesn't wait on apt for it
+    extra = " nginx" if proxy else ""
+    if prebaked:
         return """#!/bin/bash
 set -e
+""" + (f"sudo apt-get update -y\nsudo apt-get install -y{extra}\n" if proxy else "")
+    if framework in ["flask", "django"]:
+        return f"""#!/bin/bash
+set -e
 sudo apt-get update -y
-sudo apt-get install -y python3 python3-pip git
+sudo apt-get install -y python3 python3-pip git{extra}
 """
     elif framework == "nodejs":
-        return """#!/bin/bash
+        return f"""#!/bin/bash
 set -e
 sudo apt-get update -y
-sudo apt-get install -y nodejs npm git
+sudo apt-get install -y nodejs npm git{extra}
 """
     else:
-        return """#!/bin/bash
+        return f"""#!/bin/bash
 set -e
 sudo apt-get update -y
-sudo apt-get install -y python3 python3-pip git
+sudo apt-get install -y python3 python3-pip git{extra}
 """
 
 
-def run_terraform_apply(tf_config: str):
-    tf_temp_dir = tempfile.mkdtemp(prefix="tf_")
-    main_tf_path = os.path.join(tf_temp_dir, "main.tf")
+def run_terraform_apply(tf_config: str, workspace: str = None, parallelism: int = DEFAULT_PARALLELISM, cancel=None):
+    # Workspaces persist under the cache dir and share a provider plugin cache,
+    # so init is skipped or fully local after the first deploy
+    result = apply_config(tf_config, workspace=workspace, parallelism=parallelism, cancel=cancel)
+    outputs = result["outputs"]
 
-    # Write out the Terraform config
-    with open(main_tf_path, "w") as f:
-        f.write(tf_config)
+    public_ip = outputs.get("public_ip")
+    private_key = outputs.get("private_key_pem")
+    print(f"[INFO] Terraform workspace: {result['workspace']}")
 
-    # terraform init
-    subprocess.run(["terraform", "init"], cwd=tf_temp_dir, check=True)
+    return public_ip, private_key
 
-    # terraform apply
-    subprocess.run(["terraform", "apply", "-auto-approve"], cwd=tf_temp_dir, check=True)
 
-    # terraform output -json
-    result = subprocess.run(
-        ["terraform", "output", "-json"],
-        cwd=tf_temp_dir,
-        capture_output=True,
-        text=True
-    )
+def run_terraform_apply_fleet(tf_config: str, workspace: str = None, parallelism: int = DEFAULT_PARALLELISM, cancel=None):
+    # Same as run_terraform_apply for configs with instance_count > 1
+    result = apply_config(tf_config, workspace=workspace, parallelism=parallelism, cancel=cancel)
+    outputs = result["outputs"]
+
+    public_ips = [ip for ip in (outputs.get("public_ips") or [outputs.get("public_ip")]) if ip]
+    print(f"[INFO] Terraform workspace: {result['workspace']}")
+
+    return public_ips, outputs.get("private_key_pem"), outputs.get("lb_dns_name")
+
+
+def deploy_fleet(public_ips: list[str], repo_path: str, needs_localhost_fix: bool, framework: str, main_file_path: str = None,
+                 public_address: str = None, max_workers: int = None, bindings: list[dict] = None, **kwargs) -> dict[str, bool]:
+    # Rewrite the shared checkout once, up front, instead of racing per instance;
+    # the address clients should use is the load balancer's, not any one VM's
+    public_address = public_address or public_ips[0]
+    port = kwargs.get("port") or DEFAULT_PORTS.get(framework.lower(), 5000)
+    if needs_localhost_fix and bindings is None:
+        bindings = scan_bindings(repo_path)
+    if needs_localhost_fix and plan_launch(repo_path, framework, main_file_path, port) is None:
+        rewrite_bindings(repo_path, bindings, public_address)
+
+    def deploy_one(ip):
+        with span("deploy.instance", host=ip) as s:
+            ok = deploy_application(public_ip=ip, repo_path=repo_path, needs_localhost_fix=False,
+                                    framework=framework, main_file_path=main_file_path, bindings=bindings,
+                                    public_address=public_address, **kwargs)
+            s.set(deployed=ok)
+            return ok
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers or len(public_ips) or 1) as pool:
+        # Each instance's spans hang off the caller's current span
+        futures = {pool.submit(contextvars.copy_context().run, deploy_one, ip): ip for ip in public_ips}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    ok = sum(results.values())
+    print(f"[INFO] Deployed to {ok}/{len(public_ips)} instances")
+    return results
 
-    import json
-    outputs = json.loads(result.stdout)
 
-    public_ip = outputs.get("public_ip", {}).get("value")
-    private_key = outputs.get("private_key_pem", {}).get("value")
-    print("Private key (PEM format):", private_key)
+def connect_instance(public_ip: str, ssh_key: str, username: str = "ubuntu", ssh_host: str = None,
+                     ssh_port: int = 22) -> paramiko.SSHClient:
+    import paramiko
 
-    return public_ip, private_key
+    pkey = paramiko.RSAKey.from_private_key(StringIO(ssh_key))
+    # Convert IP address format for AWS hostname
+    formatted_ip = public_ip.replace('.', '-')
+    hostname = ssh_host or f"ec2-{formatted_ip}.compute-1.amazonaws.com"
 
+    # Connects as soon as sshd answers and returns once cloud-init (and
+    # so the user_data apt installs) has finished
+    print(f"attempting to connect to {hostname} with username {username}")
+    ssh, _ = wait_until_ready(hostname, username, pkey, port=ssh_port)
+    return ssh
 
-def deploy_application(public_ip: str, repo_path: str, needs_localhost_fix: bool, framework: str, ssh_key: str = None, root_dir: str = None, dependency_path: str = None, main_file_path: str = None):
+
+def deploy_application(public_ip: str, repo_path: str, needs_localhost_fix: bool, framework: str, ssh_key: str = None, root_dir: str = None, dependency_path: str = None, main_file_path: str = None, upload_workers: int = DEFAULT_UPLOAD_WORKERS, upload_mode: str = "sftp", compression: str = "auto", zip_file_path: str = None, dependency_bundle: dict = None, port: int = None, proxy: bool = False, micro_cache: bool = False, max_workers: int = None, ssh_host: str = None, ssh_port: int = 22, remote_home: str = None, bindings: list[dict] = None, public_address: str = None, source_id: str = None) -> bool:
     print(f"[INFO] Deploying application from {repo_path} to VM at IP {public_ip}...")
 
     if not ssh_key:
         print("[WARNING] No SSH key provided. Cannot deploy code via SSH.")
-        return
-
-    # If code references 'localhost', do a naive replacement
-    if needs_localhost_fix:
-        replace_localhost(repo_path, public_ip, main_file_path)
+        return False
 
     # Use paramiko to SSH into the instance, copy code, install deps, and run the app
     username = "ubuntu"
-    
+    ssh = None
     try:
-        time.sleep(30)
-        print("ssh key:",ssh_key)
-        key_stream = StringIO(ssh_key)
-        pkey = paramiko.RSAKey.from_private_key(key_stream)
-
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-        # Convert IP address format for AWS hostname
-        formatted_ip = public_ip.replace('.', '-')
-        hostname = f"ec2-{formatted_ip}.compute-1.amazonaws.com"
-        
-        print(f"attempting to connect to {hostname} with username {username}")
-        print(f"using private key {pkey}")
-        ssh.connect(hostname, username=username, pkey=pkey)
-
-        sftp = ssh.open_sftp()
-
-        # make the app directory
-        try:
-            sftp.mkdir(f"/home/{username}/{root_dir}")
-        except IOError:
-            pass
-    
-        # upload files from repo_path to /home/{username}/
-        for root, dirs, files in os.walk(repo_path):
-            rel_path = os.path.relpath(root, repo_path)
-            if rel_path == ".":
-                rel_path = ""
-            remote_dir = f"/home/{username}/{root_dir}/{rel_path}"
-            try:
-                sftp.stat(remote_dir)
-            except IOError:
-                sftp.mkdir(remote_dir)
-
-            for file in files:
-                local_file = os.path.join(root, file)
-                remote_file = f"{remote_dir}/{file}"
-                print(f"[INFO] Uploading {local_file} to {remote_file}...")
-                sftp.put(local_file, remote_file)
-
-        sftp.close()
-
-        if framework.lower() in ["flask", "django"]:
-            wait_for_apt_lock_release(ssh)
-            
-            stdin, stdout, stderr = ssh.exec_command("which pip3")
-            if stdout.channel.recv_exit_status() != 0:
-                stdin, stdout, stderr = ssh.exec_command("sudo apt-get install -y python3-pip")
-                if stdout.channel.recv_exit_status() != 0:
-                    print(stderr.read().decode())
-                    return
-            
-            print(f"trying to install from /home/{username}/{root_dir}/{dependency_path}")
-            stdin, stdout, stderr = ssh.exec_command(f"sudo python3 -m pip install -r /home/{username}/{root_dir}/{dependency_path}")
-            # Wait for command to complete and check output
-            exit_status = stdout.channel.recv_exit_status()
-            if exit_status != 0:
-                print(stderr.read().decode())
-
-            stdin, stdout, stderr = ssh.exec_command("sudo python3 -m pip freeze")
-            print("pip:",stdout.read().decode())
-
-            stdin, stdout, stderr = ssh.exec_command(f"nohup python3 /home/{username}/{root_dir}/{main_file_path} > app.log 2>&1 &")
-            exit_status = stdout.channel.recv_exit_status()
-            if exit_status != 0:
-                print(stderr.read().decode())
-
-            # Check if the application is running
-            stdin, stdout, stderr = ssh.exec_command("ps aux | grep python3")
-            print(stdout.read().decode())
-
-        elif framework.lower() == "nodejs":
-            wait_for_apt_lock_release(ssh)
-            
-            _, stdout, stderr = ssh.exec_command("which npm")
-            npm_path = stdout.read().decode()
-            
-            if stdout.channel.recv_exit_status() != 0:
-                _, stdout, stderr = ssh.exec_command("sudo apt-get install -y nodejs npm")
-                install_output = stdout.read().decode()
-                install_error = stderr.read().decode()
-            if stdout.channel.recv_exit_status() != 0:
-                print(install_error)
-                return
-
-            _, stdout, _ = ssh.exec_command("node --version")
-            _, stdout, _ = ssh.exec_command("npm --version")
-
-            cmd = f"cd /home/{username}/{root_dir} && npm install"
-            stdin, stdout, stderr = ssh.exec_command(cmd)
-            npm_install_output = stdout.read().decode()
-            npm_install_error = stderr.read().decode()
-            
-            exit_status = stdout.channel.recv_exit_status()
-            if exit_status != 0:
-                print(npm_install_error)
-
-            _, stdout, _ = ssh.exec_command(f"cat /home/{username}/{root_dir}/package.json")
-
-            cmd = f"cd /home/{username}/{root_dir} && nohup npm start > app.log 2>&1 < /dev/null & disown"
-
-            stdin, stdout, stderr = ssh.exec_command(cmd)
-            
-        ssh.close()
+        # ssh_host/ssh_port/remote_home point the deploy elsewhere, e.g. at the local stand-ins in benchmark.py
+        home = remote_home or f"/home/{username}"
+        with span("deploy.ssh_wait"):
+            ssh = connect_instance(public_ip, ssh_key, username=username, ssh_host=ssh_host, ssh_port=ssh_port)
+
+        remote_root = f"{home}/{root_dir}"
+        port = port or DEFAULT_PORTS.get(framework.lower(), 5000)
+        launch = plan_launch(repo_path, framework, main_file_path, port, vcpus=remote_vcpus(ssh),
+                             manifest_path=dependency_path, max_workers=max_workers)
+
+        # Variables the code reads its bind address or loopback URLs from are set for the app.
+        # The app server binds 0.0.0.0 itself; only the dev-server fallback needs hardcoded values rewritten
+        if needs_localhost_fix and bindings is None:
+            bindings = scan_bindings(repo_path)
+        env = binding_env(bindings or [], public_address or public_ip)
+        if launch:
+            launch["env"] = env
+        if needs_localhost_fix and launch is None:
+            rewrite_bindings(repo_path, bindings, public_address or public_ip)
+        env_prefix = "env " + " ".join(shlex.quote(f"{k}={v}") for k, v in env.items()) + " " if env else ""
+
+        with span("deploy.upload", mode=upload_mode) as s:
+            if upload_mode == "tar":
+                # Streaming straight from the zip would skip the localhost rewrite done on disk above
+                source_zip = zip_file_path if not (needs_localhost_fix and launch is None) else None
+                s.add_stats(stream_tarball(ssh, repo_path, remote_root, compression=compression, zip_file_path=source_zip))
+            elif upload_mode == "delta":
+                # Keyed by where the code came from, so a redeploy from a fresh checkout reuses the hashes
+                s.add_stats(sync_tree(ssh, repo_path, remote_root, workers=upload_workers, cache_key=source_id))
+            else:
+                s.add_stats(upload_tree(ssh, repo_path, remote_root, workers=upload_workers))
+
+        # The bundle may still be building (see orchestrator.py); only this step waits for it
+        if isinstance(dependency_bundle, Future):
+            with span("deploy.bundle_wait"):
+                try:
+                    dependency_bundle = dependency_bundle.result()
+                except Exception as e:
+                    print(f"[WARN] Dependency bundle failed, installing from the network: {e}")
+                    dependency_bundle = None
+
+        # Everything from here runs as one script over one channel (see remote_steps.py);
+        # generated files go up first
+        fw = framework.lower()
+        name = unit_name(root_dir)
+        pip_args = pip_install_args(f"{remote_root}/{dependency_path}") if dependency_path else None
+        offline = None
+        if dependency_bundle and dependency_path:
+            with span("deploy.bundle_upload"):
+                remote_bundle = upload_dependency_bundle(ssh, dependency_bundle, remote_store=f"{home}/{DEPS_DIR}")
+            # Dependencies resolved locally install offline; any failure falls through to the network install
+            offline = (f"{{ {offline_install_command(dependency_bundle, remote_bundle, f'{remote_root}/{dependency_path}')}"
+                       f" || {{ echo 'Offline dependency install failed, installing from the network' >&2; false; }}; }}")
+
+        files = {}
+        steps = []
+        if fw in ["flask", "django"]:
+            steps.append(step("python", "command -v pip3 >/dev/null || "
+                                        f"sudo apt-get -o DPkg::Lock::Timeout={APT_LOCK_TIMEOUT} install -y python3-pip", retries=2))
+            if pip_args:
+                network = f"sudo python3 -m pip install {pip_args}"
+                steps.append(step("dependencies", f"{offline} || {network}" if offline else network, retries=1, check=False))
+            if launch:
+                # Already there when they came with the bundle or a pre-baked image
+                modules = ", ".join(PYTHON_SERVER_PACKAGES)
+                steps.append(step("server_packages", f"python3 -c 'import {modules}' 2>/dev/null || "
+                                                     f"sudo python3 -m pip install {' '.join(PYTHON_SERVER_PACKAGES)}", retries=1))
+            else:
+                print("[WARN] No WSGI/ASGI app object found; falling back to the development server")
+                steps.append(step("launch", f"nohup {env_prefix}python3 {shlex.quote(f'{remote_root}/{main_file_path}')} > app.log 2>&1 < /dev/null &"))
+
+        elif fw == "nodejs":
+            steps.append(step("node", "command -v npm >/dev/null || "
+                                      f"sudo apt-get -o DPkg::Lock::Timeout={APT_LOCK_TIMEOUT} install -y nodejs npm", retries=2))
+            network = f"cd {shlex.quote(remote_root)} && npm install"
+            steps.append(step("dependencies", f"{offline} || ({network})" if offline else network, retries=1, check=False))
+            if not launch:
+                steps.append(step("launch", f"cd {shlex.quote(remote_root)} && nohup {env_prefix}npm start > app.log 2>&1 < /dev/null &"))
+
+        if launch:
+            files.update(service_files(launch, remote_root, name, user=username))
+            steps += service_steps(launch, remote_root, name)
+        if proxy:
+            files.update(proxy_files(repo_path, remote_root, framework, main_file_path, port, name, micro_cache=micro_cache))
+            steps += proxy_steps(repo_path, remote_root, framework, main_file_path, name, apt_lock_timeout=APT_LOCK_TIMEOUT)
+
+        put_files(ssh, files)
+        run = run_steps(ssh, steps, label=public_ip, span_prefix="deploy.")
+        summary = ", ".join(f"{r['name']} {r['seconds']:.1f}s" + ("" if r["exit_status"] == 0 else f" (exit {r['exit_status']})")
+                            for r in run["steps"] if r["ran"])
+        print(f"[INFO] Remote steps on {public_ip}: {summary}")
+        if not run["ok"]:
+            return False
+        if launch:
+            print(f"[INFO] {name} running under systemd ({launch['kind']}, {launch['workers']} workers, port {launch['port']})")
+        if proxy:
+            print(f"[INFO] nginx proxying :80/:443 to 127.0.0.1:{port}")
+        return True
 
     except Exception as e:
         print(f"[ERROR] Deployment failed: {e}")
+        return False
+    finally:
+        # Failed deploys too; each open client holds a transport thread
+        if ssh is not None:
+            ssh.close()
 
 
-def replace_localhost(repo_path: str, public_ip: str, main_file_path: str):
-    print(f"[INFO] Replacing 'localhost' references with {public_ip} in main file...")
-    filepath = os.path.join(repo_path, main_file_path)
-    try:
-        with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-            content = f.read()
-        new_content = re.sub(r"localhost", public_ip, content)
-        new_content = re.sub(r"127.0.0.1", '0.0.0.0', new_content)
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(new_content)
-    except Exception as e:
-        print(f"[WARNING] Could not process {filepath}: {str(e)}")
-
 def tree(dir_path, prefix="") -> str:
-    # Get the list of entries in the directory
-    entries = sorted(os.listdir(dir_path))
-    entries_count = len(entries)
-    result = []
-    
-    for index, entry in enumerate(entries):
-        path = os.path.join(dir_path, entry)
-        connector = "├── " if index < entries_count - 1 else "└── "
-        result.append(prefix + connector + entry)
-        
-        if os.path.isdir(path):
-            extension = "│   " if index < entries_count - 1 else "    "
-            result.append(tree(path, prefix + extension))
-            
-    return "\n".join(result)
-
-def wait_for_apt_lock_release(ssh_client, max_retries=10, delay=10):
-    for attempt in range(1, max_retries + 1):
-        cmd = "sudo lsof /var/lib/dpkg/lock-frontend"
-        stdin, stdout, stderr = ssh_client.exec_command(cmd)
-        
-        # Force reading both streams so they don't remain in buffers
-        exit_code = stdout.channel.recv_exit_status()
-        out = stdout.read().decode().strip()
-        err = stderr.read().decode().strip()
-
-        if not out:
-            print("[INFO] dpkg lock is free. Proceeding.")
-            return
-
-        print(f"[WARN] dpkg lock is held by:\n{out}")
-        if err:
-            print(f"[WARN] stderr: {err}")
-        
-        if attempt < max_retries:
-            print(f"[INFO] Attempt {attempt}/{max_retries}. Retrying in {delay} seconds...")
-            time.sleep(delay)
-        else:
-            raise Exception("Still locked after all attempts; aborting.")
\ No newline at end of file
+    text = build_index(dir_path).tree_text()
+    if prefix:
+        text = "\n".join(prefix + line for line in text.splitlines())
+    return text
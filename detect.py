@@ -0,0 +1,207 @@
+import json
+import os
+import posixpath
+import re
+import shlex
+
+from walker import walk_repo
+
+# Below this the local answer is not trusted and analyze_repo asks the LLM
+CONFIDENCE_THRESHOLD = 0.7
+
+DEFAULT_PORTS = {"flask": 5000, "django": 8000, "nodejs": 3000}
+MAX_SOURCE_BYTES = 256 * 1024
+MAX_SOURCE_FILES = 300
+
+PYTHON_MANIFESTS = ["requirements.txt", "pyproject.toml", "Pipfile", "setup.py"]
+NODE_MANIFESTS = ["package.json"]
+# pip installs these as a project (`pip install <dir>`), not with -r
+PROJECT_MANIFESTS = {"pyproject.toml", "setup.py"}
+PYTHON_ENTRY_NAMES = {"app.py": 3, "main.py": 3, "wsgi.py": 2, "run.py": 2, "server.py": 2, "application.py": 2, "__init__.py": 0}
+NODE_ENTRY_NAMES = {"server.js": 3, "app.js": 3, "index.js": 2, "main.js": 2, "server.mjs": 2, "index.mjs": 1}
+
+FLASK_APP_RE = re.compile(r"\bFlask\s*\(\s*__name__")
+FLASK_RUN_RE = re.compile(r"\.run\s*\(([^)]*)\)")
+PY_PORT_KWARG_RE = re.compile(r"\bport\s*=\s*(?:int\s*\(\s*os\.environ\.get\s*\([^,]+,\s*['\"]?)?(\d{2,5})")
+EXPRESS_RE = re.compile(r"require\s*\(\s*['\"]express['\"]\s*\)|from\s+['\"]express['\"]")
+NODE_LISTEN_RE = re.compile(r"\.listen\s*\(\s*(\d{2,5})")
+NODE_PORT_VAR_RE = re.compile(r"\bport\s*=\s*(?:process\.env\.PORT\s*\|\|\s*)?(\d{2,5})", re.IGNORECASE)
+NODE_START_FILE_RE = re.compile(r"\bnode(?:mon)?\s+(?:\S+\s+)*?([\w./-]+\.(?:c|m)?js)\b")
+DJANGO_RUNSERVER_RE = re.compile(r"runserver\s+(?:[\d.]+:)?(\d{2,5})")
+
+
+def _read(path: str) -> str:
+    try:
+        if os.path.getsize(path) > MAX_SOURCE_BYTES:
+            return ""
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def _depth(rel_path: str) -> int:
+    return rel_path.count("/")
+
+
+def _manifest_framework(name: str, content: str) -> str | None:
+    content = content.lower()
+    if name == "package.json":
+        try:
+            data = json.loads(content)
+            deps = {**data.get("dependencies", {}), **data.get("devDependencies", {})}
+        except (ValueError, AttributeError):
+            deps = {}
+        return "nodejs" if "express" in deps or "express" in content else None
+    if re.search(r"^\s*['\"]?django\b", content, re.MULTILINE):
+        return "django"
+    if re.search(r"^\s*['\"]?flask\b", content, re.MULTILINE):
+        return "flask"
+    return None
+
+
+def manifest_kind(manifest_path: str | None) -> str | None:
+    # "requirements" (pip -r), "project" (pyproject.toml/setup.py), "pipfile" or "npm"
+    if not manifest_path:
+        return None
+    name = posixpath.basename(manifest_path)
+    if name in NODE_MANIFESTS:
+        return "npm"
+    if name in PROJECT_MANIFESTS:
+        return "project"
+    if name == "Pipfile":
+        return "pipfile"
+    return "requirements"
+
+
+def pip_install_args(manifest_path: str | None) -> str | None:
+    # What follows `pip install` for this manifest, or None when pip can't read it
+    kind = manifest_kind(manifest_path)
+    if kind == "requirements":
+        return f"-r {shlex.quote(manifest_path)}"
+    if kind == "project":
+        return shlex.quote(posixpath.dirname(manifest_path) or ".")
+    return None
+
+
+def _score_manifests(repo_path: str, files: list[str]) -> list[dict]:
+    candidates = []
+    for rel_path in files:
+        name = rel_path.rsplit("/", 1)[-1]
+        if name not in PYTHON_MANIFESTS and name not in NODE_MANIFESTS:
+            continue
+        framework = _manifest_framework(name, _read(os.path.join(repo_path, rel_path)))
+        score = 1.0 if framework else 0.3
+        score -= 0.1 * _depth(rel_path)
+        # pip install -r only understands requirements files
+        if name == "requirements.txt" or name == "package.json":
+            score += 0.2
+        candidates.append({"path": rel_path, "framework": framework, "score": score})
+    return sorted(candidates, key=lambda c: c["score"], reverse=True)
+
+
+def _find_python_entry(repo_path: str, files: list[str], framework: str) -> tuple[str | None, float, int | None]:
+    if framework == "django":
+        managers = sorted((f for f in files if f.rsplit("/", 1)[-1] == "manage.py"), key=_depth)
+        if managers:
+            port = None
+            for rel_path in files:
+                if rel_path.endswith((".sh", "Procfile", "Dockerfile", ".yml", ".yaml")):
+                    m = DJANGO_RUNSERVER_RE.search(_read(os.path.join(repo_path, rel_path)))
+                    if m:
+                        port = int(m.group(1))
+                        break
+            return managers[0], 1.0, port
+        return None, 0.0, None
+
+    best = (None, 0.0, None)
+    py_files = sorted(
+        (f for f in files if f.endswith(".py")),
+        key=lambda f: (-PYTHON_ENTRY_NAMES.get(f.rsplit("/", 1)[-1], -1), _depth(f)),
+    )
+    for rel_path in py_files[:MAX_SOURCE_FILES]:
+        source = _read(os.path.join(repo_path, rel_path))
+        if not FLASK_APP_RE.search(source):
+            continue
+        score = 0.6 + 0.05 * PYTHON_ENTRY_NAMES.get(rel_path.rsplit("/", 1)[-1], 0) - 0.05 * _depth(rel_path)
+        port = None
+        run = FLASK_RUN_RE.search(source)
+        if run:
+            score += 0.3
+            m = PY_PORT_KWARG_RE.search(run.group(1))
+            port = int(m.group(1)) if m else None
+        if score > best[1]:
+            best = (rel_path, min(score, 1.0), port)
+    return best
+
+
+def _find_node_entry(repo_path: str, files: list[str], manifest: str | None) -> tuple[str | None, float, int | None]:
+    entry, score = None, 0.0
+    base = ""
+    if manifest:
+        base = manifest.rsplit("/", 1)[0] + "/" if "/" in manifest else ""
+        try:
+            data = json.loads(_read(os.path.join(repo_path, manifest)) or "{}")
+        except ValueError:
+            data = {}
+        start = data.get("scripts", {}).get("start", "")
+        m = NODE_START_FILE_RE.search(start)
+        if m and f"{base}{m.group(1).lstrip('./')}" in files:
+            entry, score = f"{base}{m.group(1).lstrip('./')}", 1.0
+        elif data.get("main") and f"{base}{data['main'].lstrip('./')}" in files:
+            entry, score = f"{base}{data['main'].lstrip('./')}", 0.8
+
+    js_files = [f for f in files if f.endswith((".js", ".mjs", ".cjs")) and f.startswith(base)]
+    if entry:
+        js_files.insert(0, entry)
+    else:
+        js_files.sort(key=lambda f: (-NODE_ENTRY_NAMES.get(f.rsplit("/", 1)[-1], -1), _depth(f)))
+
+    for rel_path in js_files[:MAX_SOURCE_FILES]:
+        source = _read(os.path.join(repo_path, rel_path))
+        if not EXPRESS_RE.search(source) and ".listen(" not in source:
+            continue
+        port = None
+        m = NODE_LISTEN_RE.search(source) or NODE_PORT_VAR_RE.search(source)
+        if m:
+            port = int(m.group(1))
+        if entry is None:
+            entry, score = rel_path, 0.8
+        if port or rel_path == entry:
+            return entry, score, port
+    return entry, score, None
+
+
+def detect_app(repo_path: str, files: list[str] = None, known_framework: str = None) -> dict:
+    if files is None:
+        files = [rel for rel, _, is_dir in walk_repo(repo_path) if not is_dir]
+
+    manifests = _score_manifests(repo_path, files)
+    manifest = manifests[0] if manifests else None
+    framework = manifest["framework"] if manifest and manifest["framework"] else None
+    if framework is None and known_framework in DEFAULT_PORTS:
+        framework = known_framework
+
+    confidence = 0.0
+    if manifest:
+        confidence += 0.4 if manifest["framework"] else 0.15
+
+    if framework == "nodejs":
+        node_manifest = next((m["path"] for m in manifests if m["path"].endswith("package.json")), None)
+        main_file, entry_score, port = _find_node_entry(repo_path, files, node_manifest)
+    elif framework in ("flask", "django"):
+        main_file, entry_score, port = _find_python_entry(repo_path, files, framework)
+    else:
+        main_file, entry_score, port = None, 0.0, None
+
+    confidence += 0.4 * entry_score
+    confidence += 0.2 if port else 0.1 if main_file else 0.0
+
+    return {
+        "framework": framework or known_framework or "unknown",
+        "dependency_manifest_path": manifest["path"] if manifest else None,
+        "dependency_manifest_kind": manifest_kind(manifest["path"]) if manifest else None,
+        "main_file_path": main_file,
+        "ports": [port or DEFAULT_PORTS.get(framework, 5000)],
+        "confidence": round(min(confidence, 1.0), 2),
+    }
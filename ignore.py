@@ -0,0 +1,112 @@
+import os
+import re
+
+# Never worth shipping to the server: VCS metadata and dependency/build
+# directories that get recreated by the remote install step.
+DEFAULT_EXCLUDES = [".git", "node_modules/", "__pycache__/", "*.pyc", ".venv/", "venv/", ".DS_Store"]
+
+
+def _translate(pattern: str) -> str:
+    i, n = 0, len(pattern)
+    out = []
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == n:
+            out.append("(?:/.*)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+                continue
+            body = pattern[i + 1:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append(f"[{body}]")
+            i = end + 1
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out)
+
+
+def parse_pattern(line: str, base: str = "") -> tuple | None:
+    line = line.rstrip("\n")
+    if not line.strip() or line.startswith("#"):
+        return None
+    if not line.endswith("\\ "):
+        line = line.rstrip()
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    elif line.startswith("\\"):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    anchored = "/" in line
+    line = line.lstrip("/")
+    regex = re.compile(_translate(line) + r"\Z")
+    return (regex, negate, dir_only, anchored, base)
+
+
+class IgnoreRules:
+    def __init__(self, patterns: list[str] = None):
+        self.rules = []
+        for p in patterns or []:
+            self.add(p)
+
+    def add(self, pattern: str, base: str = ""):
+        rule = parse_pattern(pattern, base)
+        if rule:
+            self.rules.append(rule)
+
+    def add_file(self, path: str, base: str = ""):
+        try:
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                for line in f:
+                    self.add(line, base)
+        except OSError:
+            pass
+
+    def is_ignored(self, rel_path: str, is_dir: bool = False) -> bool:
+        rel_path = rel_path.replace(os.sep, "/").strip("/")
+        name = rel_path.rsplit("/", 1)[-1]
+        ignored = False
+        # Last matching rule wins, same as git
+        for regex, negate, dir_only, anchored, base in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not rel_path.startswith(base + "/"):
+                    continue
+                candidate = rel_path[len(base) + 1:]
+            else:
+                candidate = rel_path
+            if regex.match(candidate if anchored else name):
+                ignored = not negate
+        return ignored
+
+
+def load_ignore_rules(repo_path: str, use_defaults: bool = True) -> IgnoreRules:
+    rules = IgnoreRules(DEFAULT_EXCLUDES if use_defaults else [])
+    rules.add_file(os.path.join(repo_path, ".gitignore"))
+    return rules
+
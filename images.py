@@ -0,0 +1,219 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+from config import cache_path
+from launcher import PYTHON_SERVER_PACKAGES
+
+DEFAULT_REGION = "us-east-1"
+# Ubuntu 22.04 base the golden images are built from (same as the plain deploy)
+BASE_AMI = "ami-08c40ec9ead489470"
+PACKER_BIN = os.environ.get("AUTODEPLOY_PACKER", "packer")
+IMAGE_FORMAT_VERSION = 2
+
+BAKEABLE_MANIFESTS = {"requirements.txt", "package.json"}
+
+BASE_PACKAGES = {
+    "flask": "python3 python3-pip git",
+    "django": "python3 python3-pip git",
+    "nodejs": "nodejs npm git",
+}
+
+
+def _normalized_manifest(path: str) -> bytes:
+    # Ignore comments, blank lines and ordering so cosmetic edits keep the key
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        content = f.read()
+    if path.endswith("package.json"):
+        try:
+            data = json.loads(content)
+            deps = {k: data.get(k, {}) for k in ("dependencies", "devDependencies", "engines")}
+            return json.dumps(deps, sort_keys=True).encode()
+        except ValueError:
+            return content.encode()
+    lines = sorted(
+        line.split("#", 1)[0].strip().lower()
+        for line in content.splitlines()
+        if line.split("#", 1)[0].strip()
+    )
+    return "\n".join(lines).encode()
+
+
+def image_key(framework: str, repo_path: str, manifest_path: str = None) -> str:
+    h = hashlib.sha256(f"v{IMAGE_FORMAT_VERSION}:{framework}:".encode())
+    if manifest_path and os.path.isfile(os.path.join(repo_path, manifest_path)):
+        h.update(_normalized_manifest(os.path.join(repo_path, manifest_path)))
+    return f"{framework}-{h.hexdigest()[:16]}"
+
+
+def _registry_path() -> str:
+    return os.path.join(cache_path("images"), "registry.json")
+
+
+def load_registry() -> dict:
+    try:
+        with open(_registry_path(), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def register_image(key: str, ami: str, region: str = DEFAULT_REGION):
+    registry = load_registry()
+    registry[key] = {"ami": ami, "region": region, "created": time.time()}
+    tmp = f"{_registry_path()}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(registry, f, indent=2)
+    os.replace(tmp, _registry_path())
+
+
+def select_image(framework: str, repo_path: str, manifest_path: str = None, region: str = DEFAULT_REGION) -> str | None:
+    key = image_key(framework, repo_path, manifest_path)
+    entry = load_registry().get(key)
+    if entry and entry.get("region") == region:
+        print(f"[INFO] Using pre-baked image {entry['ami']} for {key}")
+        return entry["ami"]
+    print(f"[INFO] No pre-baked image for {key}; using the base AMI (build one with: python images.py build)")
+    return None
+
+
+def provision_commands(framework: str, manifest_name: str | None) -> list[str]:
+    commands = [
+        "cloud-init status --wait || true",
+        "sudo apt-get update -y",
+        f"sudo apt-get install -y {BASE_PACKAGES.get(framework, BASE_PACKAGES['flask'])}",
+    ]
+    if framework in ("flask", "django"):
+        commands.append(f"sudo python3 -m pip install {' '.join(PYTHON_SERVER_PACKAGES)}")
+    if manifest_name == "requirements.txt":
+        commands.append("sudo python3 -m pip install -r /tmp/autodeploy/requirements.txt")
+    elif manifest_name == "package.json":
+        # Warms the ubuntu user's npm cache, which the deploy-time npm install reuses
+        commands += [
+            "cd /tmp/autodeploy && npm install --no-audit --no-fund",
+            "rm -rf /tmp/autodeploy/node_modules",
+        ]
+    commands.append("sudo apt-get clean")
+    return commands
+
+
+def generate_packer_config(framework: str, repo_path: str, manifest_path: str = None, region: str = DEFAULT_REGION,
+                           base_ami: str = BASE_AMI) -> str:
+    key = image_key(framework, repo_path, manifest_path)
+    manifest_name = os.path.basename(manifest_path) if manifest_path else None
+    files = []
+    if manifest_name in BAKEABLE_MANIFESTS:
+        manifest_dir = os.path.dirname(os.path.join(repo_path, manifest_path))
+        files.append(os.path.join(repo_path, manifest_path))
+        lock = os.path.join(manifest_dir, "package-lock.json")
+        if manifest_name == "package.json" and os.path.isfile(lock):
+            files.append(lock)
+    elif manifest_name:
+        print(f"[WARN] {manifest_name} can't be pre-installed; the image will only carry base packages")
+        manifest_name = None
+
+    file_blocks = "".join(f"""
+  provisioner "file" {{
+    source      = {json.dumps(os.path.abspath(path))}
+    destination = "/tmp/autodeploy/{os.path.basename(path)}"
+  }}
+""" for path in files)
+    inline = ",\n".join(f"      {json.dumps(cmd)}" for cmd in provision_commands(framework, manifest_name))
+
+    return f"""
+packer {{
+  required_plugins {{
+    amazon = {{
+      source  = "github.com/hashicorp/amazon"
+      version = ">= 1.2.0"
+    }}
+  }}
+}}
+
+source "amazon-ebs" "autodeploy" {{
+  region        = "{region}"
+  source_ami    = "{base_ami}"
+  instance_type = "t2.micro"
+  ssh_username  = "ubuntu"
+  ami_name      = "autodeploy-{key}-${{formatdate("YYYYMMDDhhmmss", timestamp())}}"
+
+  tags = {{
+    AutodeployImageKey = "{key}"
+    Framework          = "{framework}"
+  }}
+}}
+
+build {{
+  sources = ["source.amazon-ebs.autodeploy"]
+
+  provisioner "shell" {{
+    inline = ["mkdir -p /tmp/autodeploy"]
+  }}
+{file_blocks}
+  provisioner "shell" {{
+    inline = [
+{inline}
+    ]
+  }}
+}}
+"""
+
+
+def parse_packer_artifact(output: str) -> str | None:
+    # -machine-readable lines: timestamp,builder,artifact,0,id,us-east-1:ami-...
+    for line in output.splitlines():
+        parts = line.split(",")
+        if len(parts) >= 6 and parts[2] == "artifact" and parts[4] == "id":
+            return parts[5].split(":", 1)[-1]
+    return None
+
+
+def build_image(framework: str, repo_path: str, manifest_path: str = None, region: str = DEFAULT_REGION) -> str:
+    key = image_key(framework, repo_path, manifest_path)
+    build_dir = tempfile.mkdtemp(prefix="packer_")
+    config_path = os.path.join(build_dir, "image.pkr.hcl")
+    with open(config_path, "w") as f:
+        f.write(generate_packer_config(framework, repo_path, manifest_path, region=region))
+
+    print(f"[INFO] Building image {key} with packer in {build_dir}...")
+    subprocess.run([PACKER_BIN, "init", config_path], cwd=build_dir, check=True)
+    result = subprocess.run([PACKER_BIN, "build", "-machine-readable", config_path], cwd=build_dir,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"packer build failed: {result.stderr.strip() or result.stdout[-2000:]}")
+    ami = parse_packer_artifact(result.stdout)
+    if not ami:
+        raise Exception("packer build finished without reporting an AMI id")
+    register_image(key, ami, region)
+    print(f"[INFO] Registered {ami} for {key}")
+    return ami
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Build and select pre-baked images keyed by framework and dependency hash")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("key", "config", "build"):
+        p = sub.add_parser(name)
+        p.add_argument("repo_path")
+        p.add_argument("--framework", required=True, choices=sorted(BASE_PACKAGES))
+        p.add_argument("--manifest", help="dependency manifest path relative to repo_path")
+        p.add_argument("--region", default=DEFAULT_REGION)
+    sub.add_parser("list")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        print(json.dumps(load_registry(), indent=2))
+    elif args.command == "key":
+        print(image_key(args.framework, args.repo_path, args.manifest))
+    elif args.command == "config":
+        print(generate_packer_config(args.framework, args.repo_path, args.manifest, region=args.region))
+    else:
+        build_image(args.framework, args.repo_path, args.manifest, region=args.region)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import json
+import os
+import posixpath
+import re
+import shlex
+from typing import TYPE_CHECKING
+
+from remote_steps import step
+
+if TYPE_CHECKING:
+    import paramiko
+
+# Installed alongside the app's own requirements (and bundled by dep_bundle)
+PYTHON_SERVER_PACKAGES = ["gunicorn", "uvicorn"]
+LAUNCH_DIR = ".autodeploy"
+SYSTEMD_UNIT_DIR = "/etc/systemd/system"
+# How long systemd waits for a (re)started app to accept connections, and how often it checks
+READY_TIMEOUT = 30
+READY_INTERVAL = 0.2
+
+WSGI_CLASSES = {"Flask"}
+ASGI_CLASSES = {"FastAPI", "Starlette", "Quart"}
+APP_OBJECT_RE = re.compile(r"^(\w+)\s*(?::\s*\w+\s*)?=\s*(?:\w+\.)?(" + "|".join(sorted(WSGI_CLASSES | ASGI_CLASSES)) + r")\s*\(", re.MULTILINE)
+APP_FACTORY_RE = re.compile(r"^def\s+(create_app|make_app)\s*\(\s*\)", re.MULTILINE)
+DJANGO_SETTINGS_RE = re.compile(r"DJANGO_SETTINGS_MODULE['\"]\s*,\s*['\"]([\w.]+)\.settings['\"]")
+NODE_START_RE = re.compile(r"^\s*node\s+([\w./-]+\.(?:c|m)?js)\s*$")
+
+GUNICORN_CONFIG = """# Generated by autodeploy
+import os
+
+# The unit's PORT wins, so a blue/green release can start on the alternate port
+bind = "0.0.0.0:" + os.environ.get("PORT", "{port}")
+workers = {workers}
+worker_class = "{worker_class}"
+threads = {threads}
+keepalive = {keepalive}
+timeout = 30
+graceful_timeout = 20
+# Recycle workers now and then so a slow leak can't take the box down
+max_requests = 2000
+max_requests_jitter = 200
+accesslog = "-"
+errorlog = "-"
+"""
+
+NODE_CLUSTER = """// Generated by autodeploy: one worker per CPU sharing the app's listen port.
+// Sticks to APIs the distro nodejs (12.x on Ubuntu 22.04) has.
+const cluster = require("cluster");
+const path = require("path");
+
+const workers = parseInt(process.env.WEB_CONCURRENCY || "0", 10) || require("os").cpus().length;
+const isPrimary = cluster.isPrimary === undefined ? cluster.isMaster : cluster.isPrimary;
+
+if (isPrimary) {{
+  for (let i = 0; i < workers; i++) cluster.fork();
+  cluster.on("exit", (worker, code, signal) => {{
+    console.error(`worker ${{worker.process.pid}} exited (${{signal || code}}), restarting`);
+    cluster.fork();
+  }});
+}} else {{
+  require(path.resolve(__dirname, {entry}));
+}}
+"""
+
+SYSTEMD_UNIT = """[Unit]
+Description=autodeploy {name}
+After=network-online.target
+Wants=network-online.target
+
+[Service]
+User={user}
+WorkingDirectory={workdir}
+Environment=PORT={port}
+Environment=WEB_CONCURRENCY={workers}
+{extra_env}ExecStart={exec_start}
+ExecStartPost={ready_check}
+Restart=always
+RestartSec=2
+LimitNOFILE=65536
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def detect_python_app(repo_path: str, main_file_path: str, framework: str) -> dict | None:
+    # Returns where to chdir, the gunicorn app spec and whether it's WSGI or ASGI
+    if not main_file_path:
+        return None
+    main_dir = posixpath.dirname(main_file_path)
+    if framework == "django":
+        m = DJANGO_SETTINGS_RE.search(_read(os.path.join(repo_path, main_file_path)))
+        if not m:
+            return None
+        project = m.group(1)
+        project_dir = os.path.join(repo_path, main_dir, *project.split("."))
+        if os.path.isfile(os.path.join(project_dir, "asgi.py")) and "channels" in _read(os.path.join(project_dir, "asgi.py")):
+            return {"chdir": main_dir, "app": f"{project}.asgi:application", "interface": "asgi"}
+        if os.path.isfile(os.path.join(project_dir, "wsgi.py")):
+            return {"chdir": main_dir, "app": f"{project}.wsgi:application", "interface": "wsgi"}
+        return None
+
+    source = _read(os.path.join(repo_path, main_file_path))
+    module = posixpath.splitext(posixpath.basename(main_file_path))[0]
+    if module == "__init__":
+        module = posixpath.basename(main_dir)
+        main_dir = posixpath.dirname(main_dir)
+    m = APP_OBJECT_RE.search(source)
+    if m:
+        interface = "asgi" if m.group(2) in ASGI_CLASSES else "wsgi"
+        return {"chdir": main_dir, "app": f"{module}:{m.group(1)}", "interface": interface}
+    m = APP_FACTORY_RE.search(source)
+    if m:
+        return {"chdir": main_dir, "app": f"{module}:{m.group(1)}()", "interface": "wsgi"}
+    return None
+
+
+def detect_node_entry(repo_path: str, main_file_path: str, manifest_path: str = None) -> dict | None:
+    # Cluster mode needs a plain `node file.js`; build steps or tools in the
+    # start script are left to npm start
+    base = posixpath.dirname(manifest_path) if manifest_path else posixpath.dirname(main_file_path or "")
+    entry, data = None, {}
+    if manifest_path:
+        try:
+            data = json.loads(_read(os.path.join(repo_path, manifest_path)) or "{}")
+        except ValueError:
+            data = {}
+        start = data.get("scripts", {}).get("start")
+        if start:
+            m = NODE_START_RE.match(start)
+            if not m:
+                return None
+            entry = posixpath.normpath(posixpath.join(base, m.group(1)))
+        elif data.get("main"):
+            entry = posixpath.normpath(posixpath.join(base, data["main"]))
+    entry = entry or main_file_path
+    if not entry or not os.path.isfile(os.path.join(repo_path, entry)):
+        return None
+    if entry.endswith(".mjs") or data.get("type") == "module":
+        # require() can't load ES modules
+        return None
+    return {"chdir": base, "entry": posixpath.relpath(entry, base or ".")}
+
+
+def gunicorn_settings(vcpus: int, interface: str, max_workers: int = None) -> dict:
+    # max_workers is the memory bound from sizing.py; CPU alone would overcommit small instances
+    vcpus = max(1, vcpus)
+    if interface == "asgi":
+        # Event-loop workers: one per core is enough to saturate it
+        workers = min(vcpus, max_workers or vcpus)
+        return {"workers": workers, "worker_class": "uvicorn.workers.UvicornWorker", "threads": 1, "keepalive": 5}
+    # Threads cover the I/O waits typical of these apps without the memory of extra processes
+    workers = min(2 * vcpus + 1, max_workers or 2 * vcpus + 1)
+    return {"workers": workers, "worker_class": "gthread", "threads": 4, "keepalive": 5}
+
+
+def plan_launch(repo_path: str, framework: str, main_file_path: str, port: int, vcpus: int = 1,
+                manifest_path: str = None, max_workers: int = None) -> dict | None:
+    # None means no production entry point was found and the caller keeps the dev-server start
+    framework = (framework or "").lower()
+    if framework in ("flask", "django"):
+        target = detect_python_app(repo_path, main_file_path, framework)
+        if not target:
+            return None
+        settings = gunicorn_settings(vcpus, target["interface"], max_workers=max_workers)
+        return {
+            "kind": "gunicorn",
+            "chdir": target["chdir"],
+            "app": target["app"],
+            "port": port,
+            "workers": settings["workers"],
+            "files": {"gunicorn.conf.py": GUNICORN_CONFIG.format(port=port, **settings)},
+        }
+    if framework == "nodejs":
+        target = detect_node_entry(repo_path, main_file_path, manifest_path)
+        if not target:
+            return None
+        return {
+            "kind": "node-cluster",
+            "chdir": target["chdir"],
+            "app": target["entry"],
+            "port": port,
+            "workers": max(1, min(vcpus, max_workers or vcpus)),
+            "files": {"cluster.js": NODE_CLUSTER.format(entry=json.dumps(posixpath.join("..", target["entry"])))},
+        }
+    return None
+
+
+def unit_name(root_dir: str) -> str:
+    return "autodeploy-" + (re.sub(r"[^A-Za-z0-9_.-]", "-", root_dir or "app").strip("-") or "app")
+
+
+def _systemd_quote(value: str) -> str:
+    # % starts a systemd specifier, so it always goes through the escaping branch
+    if re.fullmatch(r"[\w.:/@+=,-]+", value):
+        return value
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"').replace("%", "%%") + '"'
+
+
+def _ready_check() -> str:
+    # Holds the unit in "activating" until the app listens, so `systemctl restart`
+    # returns as soon as it's up, or fails if it exits or never binds its port
+    polls = int(READY_TIMEOUT / READY_INTERVAL)
+    return (f"/bin/bash -c 'for i in $$(seq {polls}); do (exec 3<>/dev/tcp/127.0.0.1/$$PORT) 2>/dev/null && exit 0;"
+            f" sleep {READY_INTERVAL}; done; echo \"nothing listening on :$$PORT after {READY_TIMEOUT}s\" >&2; exit 1'")
+
+
+def systemd_unit(plan: dict, remote_root: str, name: str, user: str = "ubuntu") -> str:
+    workdir = posixpath.join(remote_root, plan["chdir"]) if plan["chdir"] else remote_root
+    launch_dir = posixpath.join(workdir, LAUNCH_DIR)
+    extra_env = ""
+    if plan["kind"] == "gunicorn":
+        exec_start = f"/usr/bin/python3 -m gunicorn -c {launch_dir}/gunicorn.conf.py {plan['app']}"
+        extra_env = "Environment=PYTHONUNBUFFERED=1\n"
+        if plan.get("pythonpath"):
+            # Per-release dependencies (see bluegreen.py) shadow the system ones
+            extra_env += f"Environment=PYTHONPATH={plan['pythonpath']}\n"
+    else:
+        exec_start = f"/usr/bin/env node {launch_dir}/cluster.js"
+        extra_env = "Environment=NODE_ENV=production\n"
+    # From bindings.binding_env: where the app's own variables point on this VM
+    for key, value in (plan.get("env") or {}).items():
+        extra_env += f"Environment={_systemd_quote(f'{key}={value}')}\n"
+    return SYSTEMD_UNIT.format(name=name, user=user, workdir=workdir, port=plan["port"], workers=plan["workers"],
+                               extra_env=extra_env, exec_start=exec_start, ready_check=_ready_check())
+
+
+def remote_vcpus(ssh: paramiko.SSHClient) -> int:
+    _, stdout, _ = ssh.exec_command("nproc")
+    try:
+        return int(stdout.read().decode().strip())
+    except ValueError:
+        return 1
+
+
+def service_files(plan: dict, remote_root: str, name: str, user: str = "ubuntu") -> dict[str, str]:
+    # Remote path -> content; written over SFTP before service_steps run
+    workdir = posixpath.join(remote_root, plan["chdir"]) if plan["chdir"] else remote_root
+    launch_dir = posixpath.join(workdir, LAUNCH_DIR)
+    files = {f"{launch_dir}/{filename}": content for filename, content in plan["files"].items()}
+    files[f"{launch_dir}/{name}.service"] = systemd_unit(plan, remote_root, name, user)
+    return files
+
+
+def service_steps(plan: dict, remote_root: str, name: str) -> list[dict]:
+    workdir = posixpath.join(remote_root, plan["chdir"]) if plan["chdir"] else remote_root
+    unit_tmp = posixpath.join(workdir, LAUNCH_DIR, f"{name}.service")
+    return [step("launch",
+                 f"sudo install -m 644 {shlex.quote(unit_tmp)} {SYSTEMD_UNIT_DIR}/{name}.service"
+                 f" && sudo systemctl daemon-reload && sudo systemctl enable {name}"
+                 f" && sudo systemctl restart {name} && systemctl is-active --quiet {name}"
+                 f" || {{ sudo journalctl -u {name} -n 30 --no-pager >&2; exit 1; }}")]
@@ -0,0 +1,294 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import ssl
+import sys
+import time
+from urllib.parse import urlsplit
+
+from config import cache_path
+from readiness import wait_for_port
+from tracing import span
+
+# Post-deploy load test. Workers keep HTTP/1.1 connections open and send GETs
+# round-robin over the given paths, either as fast as `concurrency` allows or
+# at a fixed `rate`. With a rate, latency is measured from when a request was
+# due rather than when a free worker got to it, so a backed-up server shows
+# up in the percentiles instead of just sending fewer requests.
+
+DEFAULT_PATHS = ["/"]
+DEFAULT_CONCURRENCY = 10
+DEFAULT_DURATION = 10
+DEFAULT_WARMUP = 1
+DEFAULT_TIMEOUT = 5
+# Loose enough for the smallest instance behind gunicorn; a dev server or an
+# undersized box at 10-way concurrency misses them
+DEFAULT_SLO = {"p95_ms": 500, "p99_ms": 1000, "error_rate": 0.01}
+READY_TIMEOUT = 60
+
+
+class _Connection:
+    def __init__(self, host: str, port: int, tls: ssl.SSLContext | None):
+        self.host = host
+        self.port = port
+        self.tls = tls
+        self.reader = None
+        self.writer = None
+
+    async def get(self, path: str, host_header: str) -> tuple[int, int]:
+        # Returns (status, body bytes); reconnects if the server closed the last one
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.tls)
+        self.writer.write(f"GET {path} HTTP/1.1\r\nHost: {host_header}\r\nUser-Agent: autodeploy-loadtest\r\n"
+                          f"Accept: */*\r\n\r\n".encode())
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed before a response")
+        version, status = status_line.split(None, 2)[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.partition(b":")
+            headers[key.strip().lower()] = value.strip().lower()
+
+        keep_alive = version == b"HTTP/1.1" and headers.get(b"connection") != b"close"
+        if headers.get(b"transfer-encoding") == b"chunked":
+            size = 0
+            while True:
+                chunk = int((await self.reader.readline()).split(b";")[0], 16)
+                await self.reader.readexactly(chunk + 2)
+                size += chunk
+                if chunk == 0:
+                    break
+        elif b"content-length" in headers:
+            size = len(await self.reader.readexactly(int(headers[b"content-length"])))
+        else:
+            size = len(await self.reader.read())
+            keep_alive = False
+        if not keep_alive:
+            self.close()
+        return int(status), size
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def _percentile(values: list[float], q: float) -> float:
+    # Nearest rank on sorted values
+    if not values:
+        return 0.0
+    # q * n / 100 rather than q / 100 * n, which can land just above an integer (7 / 100 * 100 > 7)
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values) / 100) - 1))]
+
+
+def _latency_summary(latencies: list[float]) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "p50": _percentile(latencies, 50) * 1000,
+        "p95": _percentile(latencies, 95) * 1000,
+        "p99": _percentile(latencies, 99) * 1000,
+        "max": (latencies[-1] if latencies else 0.0) * 1000,
+        "mean": (sum(latencies) / len(latencies) if latencies else 0.0) * 1000,
+    }
+
+
+def summarize(samples: list[tuple], window: float) -> dict:
+    # samples are (path, seconds, status or None, error type or None)
+    def stats(rows):
+        errors = [r for r in rows if r[3] is not None or r[2] >= 400]
+        return {
+            "requests": len(rows),
+            "errors": len(errors),
+            "error_rate": len(errors) / len(rows) if rows else 0.0,
+            # Only requests that got a response; a refused connection isn't fast
+            "latency_ms": _latency_summary([r[1] for r in rows if r[3] is None]),
+        }
+
+    summary = stats(samples)
+    summary["throughput_rps"] = len(samples) / window if window > 0 else 0.0
+    summary["status_codes"] = {}
+    summary["error_types"] = {}
+    for _, _, status, error in samples:
+        if error is not None:
+            summary["error_types"][error] = summary["error_types"].get(error, 0) + 1
+        else:
+            summary["status_codes"][str(status)] = summary["status_codes"].get(str(status), 0) + 1
+    summary["paths"] = {path: stats([r for r in samples if r[0] == path]) for path in dict.fromkeys(r[0] for r in samples)}
+    return summary
+
+
+def check_slo(summary: dict, slo: dict) -> list[str]:
+    # slo keys: p50_ms/p95_ms/p99_ms (upper bounds), error_rate (upper), min_rps (lower)
+    if not summary["requests"]:
+        return ["no requests completed"]
+    violations = []
+    for key, limit in slo.items():
+        if limit is None:
+            continue
+        if key.endswith("_ms"):
+            value = summary["latency_ms"][key[:-3]]
+            if value > limit:
+                violations.append(f"{key[:-3]} latency {value:.0f}ms > {limit:g}ms")
+        elif key == "error_rate":
+            if summary["error_rate"] > limit:
+                violations.append(f"error rate {summary['error_rate']:.2%} > {limit:.2%}")
+        elif key == "min_rps":
+            if summary["throughput_rps"] < limit:
+                violations.append(f"throughput {summary['throughput_rps']:.1f} rps < {limit:g} rps")
+        else:
+            raise ValueError(f"Unknown SLO key {key!r}")
+    return violations
+
+
+async def load_test(url: str, paths: list[str] = None, concurrency: int = DEFAULT_CONCURRENCY, rate: float = None,
+                    duration: float = DEFAULT_DURATION, warmup: float = DEFAULT_WARMUP, timeout: float = DEFAULT_TIMEOUT,
+                    slo: dict = None, report_path: str = None) -> dict:
+    # Returns the report (also written as JSON to report_path): config,
+    # summary, slo, violations and passed. Requests due during `warmup` are sent
+    # but not counted.
+    parts = urlsplit(url)
+    tls = ssl.create_default_context() if parts.scheme == "https" else None
+    host, port = parts.hostname, parts.port or (443 if tls else 80)
+    host_header = parts.netloc.rpartition("@")[2]
+    base = parts.path.rstrip("/")
+    paths = [base + (p if p.startswith("/") else f"/{p}") for p in (paths or DEFAULT_PATHS)]
+    slo = DEFAULT_SLO if slo is None else slo
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    measure_from = start + warmup
+    end = measure_from + duration
+    samples = []
+    issued = 0
+
+    async def worker():
+        nonlocal issued
+        conn = _Connection(host, port, tls)
+        try:
+            while True:
+                i = issued
+                issued += 1
+                if rate:
+                    due = start + i / rate
+                    if due >= end:
+                        return
+                    await asyncio.sleep(max(0.0, due - loop.time()))
+                else:
+                    due = loop.time()
+                    if due >= end:
+                        return
+                path = paths[i % len(paths)]
+                status, error = None, None
+                try:
+                    status, _ = await asyncio.wait_for(conn.get(path, host_header), timeout)
+                except asyncio.TimeoutError:
+                    error = "timeout"
+                    conn.close()
+                except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+                    error = type(e).__name__
+                    conn.close()
+                if due >= measure_from:
+                    samples.append((path, loop.time() - due, status, error))
+        finally:
+            conn.close()
+
+    started_at = time.time()
+    with span("loadtest.run", url=url, concurrency=concurrency, rate=rate or 0) as s:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        window = min(duration, loop.time() - measure_from)
+        summary = summarize(samples, window)
+        s.count("requests", summary["requests"])
+        s.count("errors", summary["errors"])
+
+    violations = check_slo(summary, slo)
+    report = {
+        "url": url,
+        "started_at": started_at,
+        "config": {"paths": paths, "concurrency": concurrency, "rate": rate, "duration": duration, "warmup": warmup,
+                   "timeout": timeout},
+        "summary": summary,
+        "slo": slo,
+        "violations": violations,
+        "passed": not violations,
+    }
+    report_path = report_path or os.path.join(cache_path("loadtests"), f"{time.strftime('%Y%m%d-%H%M%S')}-{host}.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    report["report_path"] = report_path
+    return report
+
+
+def format_report(report: dict) -> str:
+    summary = report["summary"]
+    latency = summary["latency_ms"]
+    lines = [f"[INFO] Load test of {report['url']}: {summary['requests']} requests, "
+             f"{summary['throughput_rps']:.1f} rps, {summary['error_rate']:.2%} errors, "
+             f"p50 {latency['p50']:.1f}ms p95 {latency['p95']:.1f}ms p99 {latency['p99']:.1f}ms"]
+    if len(summary["paths"]) > 1:
+        for path, stats in summary["paths"].items():
+            lines.append(f"[INFO]   {path}: {stats['requests']} requests, {stats['error_rate']:.2%} errors, "
+                         f"p95 {stats['latency_ms']['p95']:.1f}ms")
+    if summary["error_types"]:
+        lines.append(f"[INFO]   errors: {', '.join(f'{k} x{v}' for k, v in summary['error_types'].items())}")
+    for violation in report["violations"]:
+        lines.append(f"[ERROR] SLO missed: {violation}")
+    lines.append(f"[INFO] Load test report written to {report['report_path']}")
+    return "\n".join(lines)
+
+
+async def verify_deployment(url: str, **options) -> dict:
+    # The pipeline stage: waits for the endpoint to accept connections, then
+    # runs load_test with `options` and prints the outcome
+    parts = urlsplit(url)
+    with span("loadtest", url=url) as s:
+        try:
+            await asyncio.to_thread(wait_for_port, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80),
+                                    timeout=READY_TIMEOUT, expect_banner=b"")
+        except TimeoutError as e:
+            print(f"[WARN] {e}; load testing anyway")
+        report = await load_test(url, **options)
+        s.set(passed=report["passed"])
+    print(format_report(report))
+    return report
+
+
+def run_load_test(url: str, **options) -> dict:
+    # Synchronous entry point for callers outside an event loop
+    return asyncio.run(verify_deployment(url, **options))
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Load test a deployed app and check it against latency/error SLOs")
+    parser.add_argument("url", help="base URL of the app, e.g. http://1.2.3.4:5000/")
+    parser.add_argument("--path", dest="paths", action="append", help="path to request (repeatable, default /)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="concurrent connections")
+    parser.add_argument("--rate", type=float, help="requests per second across all connections (default: unpaced)")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=DEFAULT_WARMUP, help="seconds of load before measuring")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="per-request timeout in seconds")
+    parser.add_argument("--p50-ms", type=float, help="p50 latency SLO")
+    parser.add_argument("--p95-ms", type=float, default=DEFAULT_SLO["p95_ms"], help="p95 latency SLO")
+    parser.add_argument("--p99-ms", type=float, default=DEFAULT_SLO["p99_ms"], help="p99 latency SLO")
+    parser.add_argument("--max-error-rate", type=float, default=DEFAULT_SLO["error_rate"], help="error rate SLO (0-1)")
+    parser.add_argument("--min-rps", type=float, help="throughput SLO")
+    parser.add_argument("--report", help="where to write the JSON report")
+    args = parser.parse_args(argv)
+
+    slo = {"p50_ms": args.p50_ms, "p95_ms": args.p95_ms, "p99_ms": args.p99_ms, "error_rate": args.max_error_rate,
+           "min_rps": args.min_rps}
+    report = run_load_test(args.url, paths=args.paths, concurrency=args.concurrency, rate=args.rate,
+                           duration=args.duration, warmup=args.warmup, timeout=args.timeout,
+                           slo={k: v for k, v in slo.items() if v is not None}, report_path=args.report)
+    return 0 if report["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
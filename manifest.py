@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import posixpath
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from config import cache_path
+from ignore import IgnoreRules
+from transfer import DEFAULT_UPLOAD_WORKERS, make_remote_dirs, print_transfer_summary, upload_files
+from walker import walk_repo
+
+if TYPE_CHECKING:
+    import paramiko
+
+MANIFEST_VERSION = 1
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def source_id(repo_url: str = None, root_dir: str = None) -> str | None:
+    # Identifies a deployment's code across runs; each run checks it out into a fresh temp dir
+    if repo_url:
+        return f"git:{repo_url.rstrip('/')}"
+    return f"zip:{root_dir}" if root_dir else None
+
+
+def _hash_cache_file(cache_key: str) -> str:
+    key = hashlib.sha1(cache_key.encode()).hexdigest()
+    return os.path.join(cache_path("hashes"), f"{key}.json")
+
+
+def _load_hash_cache(cache_key: str) -> dict:
+    try:
+        with open(_hash_cache_file(cache_key), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_hash_cache(cache_key: str, entries: dict):
+    path = _hash_cache_file(cache_key)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(entries, f)
+    os.replace(tmp, path)
+
+
+def _git_blob_ids(repo_path: str) -> dict[str, str]:
+    # rel_path -> blob id for tracked files whose working copy matches the index.
+    # A fresh checkout has new mtimes but the same blobs, so this is what lets
+    # the hash cache recognise it; anything edited since (e.g. by the localhost
+    # rewrite) is left out and rehashed.
+    if not os.path.exists(os.path.join(repo_path, ".git")):
+        return {}
+    try:
+        staged = subprocess.run(["git", "ls-files", "--stage", "-z"], cwd=repo_path, capture_output=True, check=True).stdout
+        modified = subprocess.run(["git", "diff-files", "--name-only", "--relative", "-z"], cwd=repo_path,
+                                  capture_output=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+    dirty = set(modified.decode(errors="surrogateescape").split("\0"))
+    blobs = {}
+    for record in staged.decode(errors="surrogateescape").split("\0"):
+        if not record:
+            continue
+        info, _, rel_path = record.partition("\t")
+        if rel_path not in dirty:
+            blobs[rel_path] = info.split()[1]
+    return blobs
+
+
+def build_manifest(repo_path: str, rules: IgnoreRules = None, workers: int = None, cache_key: str = None) -> dict:
+    # Files whose size and mtime (or, in a git checkout, blob id) match the local
+    # cache reuse the cached hash; everything else is hashed in a thread pool
+    # (hashlib releases the GIL). `cache_key` (see source_id) shares the cache
+    # between checkouts of the same code; by default it is per directory.
+    cache_key = cache_key or os.path.abspath(repo_path)
+    cached = _load_hash_cache(cache_key)
+    blobs = _git_blob_ids(repo_path)
+    files = {}
+    to_hash = []
+    for rel_path, abs_path, is_dir in walk_repo(repo_path, rules):
+        if is_dir:
+            continue
+        try:
+            st = os.stat(abs_path)
+        except OSError:
+            continue
+        entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "mode": st.st_mode & 0o777}
+        if rel_path in blobs:
+            entry["blob"] = blobs[rel_path]
+        hit = cached.get(rel_path)
+        if hit and hit["size"] == st.st_size and (hit["mtime_ns"] == st.st_mtime_ns
+                                                  or ("blob" in entry and hit.get("blob") == entry["blob"])):
+            entry["hash"] = hit["hash"]
+        else:
+            to_hash.append((rel_path, abs_path))
+        files[rel_path] = entry
+
+    if to_hash:
+        with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 2)) as pool:
+            for (rel_path, _), digest in zip(to_hash, pool.map(lambda item: hash_file(item[1]), to_hash)):
+                files[rel_path]["hash"] = digest
+
+    _save_hash_cache(cache_key, files)
+    print(f"[INFO] Manifest: {len(files)} files, {len(files) - len(to_hash)} from hash cache, {len(to_hash)} hashed")
+    return {
+        "version": MANIFEST_VERSION,
+        "files": {rel: {"hash": e["hash"], "size": e["size"], "mode": e["mode"]} for rel, e in files.items()},
+    }
+
+
+def diff_manifests(local: dict, remote: dict) -> dict:
+    local_files = local.get("files", {})
+    remote_files = remote.get("files", {}) if remote else {}
+    added = [p for p in local_files if p not in remote_files]
+    changed = [p for p in local_files if p in remote_files and local_files[p]["hash"] != remote_files[p]["hash"]]
+    deleted = [p for p in remote_files if p not in local_files]
+    return {"added": sorted(added), "changed": sorted(changed), "deleted": sorted(deleted)}
+
+
+def remote_manifest_path(remote_root: str) -> str:
+    return f"{remote_root.rstrip('/')}.manifest.json"
+
+
+def read_remote_manifest(sftp: paramiko.SFTPClient, remote_root: str) -> dict | None:
+    try:
+        sftp.stat(remote_root)
+        with sftp.open(remote_manifest_path(remote_root), "r") as f:
+            manifest = json.loads(f.read())
+    except (IOError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def write_remote_manifest(sftp: paramiko.SFTPClient, remote_root: str, manifest: dict):
+    path = remote_manifest_path(remote_root)
+    tmp = f"{path}.tmp"
+    with sftp.open(tmp, "w") as f:
+        f.set_pipelined(True)
+        f.write(json.dumps(manifest))
+    sftp.posix_rename(tmp, path)
+
+
+def remove_remote_files(ssh: paramiko.SSHClient, remote_paths: list[str]):
+    if not remote_paths:
+        return
+    stdin, stdout, stderr = ssh.exec_command("xargs -0 rm -f")
+    stdin.write("\0".join(remote_paths))
+    stdin.channel.shutdown_write()
+    if stdout.channel.recv_exit_status() != 0:
+        raise Exception(f"Failed to remove remote files: {stderr.read().decode().strip()}")
+
+
+def sync_tree(ssh: paramiko.SSHClient, repo_path: str, remote_root: str, workers: int = DEFAULT_UPLOAD_WORKERS,
+              rules: IgnoreRules = None, cache_key: str = None) -> dict:
+    remote_root = remote_root.rstrip("/")
+    start = time.perf_counter()
+    local = build_manifest(repo_path, rules, cache_key=cache_key)
+
+    sftp = ssh.open_sftp()
+    try:
+        remote = read_remote_manifest(sftp, remote_root)
+        if remote is None:
+            print(f"[INFO] No manifest found for {remote_root}, uploading everything")
+        delta = diff_manifests(local, remote)
+        print(
+            f"[INFO] Delta sync: {len(delta['added'])} added, {len(delta['changed'])} changed, "
+            f"{len(delta['deleted'])} deleted, {len(local['files']) - len(delta['added']) - len(delta['changed'])} unchanged"
+        )
+
+        to_upload = delta["added"] + delta["changed"]
+        remote_dirs = {remote_root}
+        files = []
+        for rel_path in to_upload:
+            remote_file = f"{remote_root}/{rel_path}"
+            remote_dirs.add(posixpath.dirname(remote_file))
+            files.append((os.path.join(repo_path, rel_path), remote_file, local["files"][rel_path]["size"]))
+        make_remote_dirs(ssh, sorted(remote_dirs))
+
+        stats = None
+        if files:
+            stats = upload_files(ssh.get_transport(), files, workers=workers)
+            print_transfer_summary(stats)
+        remove_remote_files(ssh, [f"{remote_root}/{p}" for p in delta["deleted"]])
+
+        # Only record the new state once the tree actually matches it
+        write_remote_manifest(sftp, remote_root, local)
+    finally:
+        sftp.close()
+
+    return {
+        "added": len(delta["added"]),
+        "changed": len(delta["changed"]),
+        "deleted": len(delta["deleted"]),
+        "bytes": stats["bytes"] if stats else 0,
+        "seconds": time.perf_counter() - start,
+    }
@@ -0,0 +1,199 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from dep_bundle import prepare_dependency_bundle
+from deploy import (
+    analyze_repo,
+    deploy_application,
+    deploy_fleet,
+    download_or_extract_code,
+    generate_terraform_config,
+    run_terraform_apply,
+    run_terraform_apply_fleet,
+)
+from images import select_image
+from launcher import PYTHON_SERVER_PACKAGES
+from llm_cache import get_cache
+from manifest import source_id
+from loadtest import verify_deployment
+from sizing import recommend_instance
+from terraform_runner import (
+    deployment_workspace,
+    resource_suffix,
+    terraform_destroy,
+    workspace_path,
+    workspace_resources,
+)
+from tracing import span, trace
+
+# Overlapped version of app.run_pipeline. Provisioning is the long pole, so
+# terraform starts the moment the instance type is known and everything that
+# doesn't need the VM (the dependency bundle) is built while it runs. The
+# deploy itself starts as soon as terraform has an address: it waits for SSH,
+# uploads, and only then waits on the bundle if that's still being built.
+
+
+async def _in_thread(fn, *args, **kwargs):
+    # asyncio.to_thread copies the context, so spans nest under the caller's
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+async def _stop_terraform(task: asyncio.Task, cancel: threading.Event):
+    # Cancelling the await doesn't stop the thread; terraform has to be told,
+    # and waited for, or its state (and the resources it lists) would be lost
+    cancel.set()
+    try:
+        await task
+    except BaseException:
+        pass
+
+
+async def run_pipeline_async(repo_url: str = None, zip_file_path: str = None, app_type: str = "unknown",
+                             resource_size: str = None, provider: str = "aws", ref: str = None, workspace: str = None,
+                             proxy: bool = False, micro_cache: bool = False, instance_count: int = 1,
+                             expected_rps: int = None, trace_dir: str = None, bundle_dependencies: bool = True,
+                             deploy_overrides: dict = None, load_test: dict = None, upload_mode: str = "sftp",
+                             destroy_on_failure: bool = False) -> dict:
+    # Returns the same result dict as app.run_pipeline. With destroy_on_failure
+    # anything terraform created is destroyed again if the run fails or is cancelled,
+    # unless the workspace already held an earlier deploy's resources; a missed load test SLO fails the run but leaves the instance up to be resized.
+    with trace("pipeline", out_dir=trace_dir, source=repo_url or zip_file_path or "", orchestrator="async") as root:
+        with span("acquire"):
+            try:
+                code_path, root_dir, tree, index = await _in_thread(
+                    download_or_extract_code, repo_url=repo_url, zip_file_path=zip_file_path, ref=ref)
+                print(f"Code downloaded/extracted to: {code_path}")
+            except Exception as e:
+                raise Exception(f"Failed to retrieve code: {e}") from e
+
+        with span("analyze"):
+            repo_analysis = await _in_thread(analyze_repo, code_path, root_dir, tree, known_framework=app_type, index=index)
+            print("[DEBUG] Repo Analysis:", repo_analysis)
+            if get_cache():
+                print("[DEBUG] LLM cache:", get_cache().stats())
+
+        framework = repo_analysis["framework"]
+        manifest_path = repo_analysis["dependency_manifest_path"]
+        sizing = recommend_instance(framework, code_path, manifest_path, resource_size=resource_size, expected_rps=expected_rps)
+        print(f"[INFO] Instance: {sizing['instance_type']} (${sizing['monthly_usd']}/month, {sizing['vcpus']} vCPU, "
+              f"{sizing['memory_gib']} GiB): {'; '.join(sizing['reasons'])}")
+        ami = select_image(framework, code_path, manifest_path)
+        # Redeploys of the same app share a workspace; resolved here so cleanup knows where the state is
+        workspace = workspace or deployment_workspace(source_id(repo_url, root_dir), root_dir)
+        if os.sep not in workspace:
+            workspace = workspace_path(workspace)
+        # Only resources this run created are destroyed on failure, never an earlier deploy's
+        existing = workspace_resources(workspace) != 0
+        tf_config = generate_terraform_config(provider, repo_analysis, instance_type=sizing["instance_type"], ami=ami,
+                                              proxy=proxy, instance_count=instance_count,
+                                              name_suffix=resource_suffix(workspace))
+
+        # Submitted before terraform starts so its span isn't nested under terraform's.
+        # A concurrent future rather than a task: deploy_application runs in a
+        # thread and resolves it itself, after the upload.
+        bundler = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bundle")
+        bundle = None
+        if bundle_dependencies:
+            bundle = bundler.submit(contextvars.copy_context().run, _build_bundle, framework, code_path, manifest_path)
+
+        cancel = threading.Event()
+        apply = run_terraform_apply_fleet if instance_count > 1 else run_terraform_apply
+        deployed = False
+        try:
+            with span("terraform"):
+                terraform = asyncio.create_task(_in_thread(apply, tf_config, workspace=workspace, cancel=cancel))
+                try:
+                    # Shielded so a cancel reaches this await, not the task running terraform
+                    provisioned = await asyncio.shield(terraform)
+                except asyncio.CancelledError:
+                    await _stop_terraform(terraform, cancel)
+                    raise
+                except Exception as e:
+                    raise Exception(f"Terraform apply failed: {e}") from e
+
+            if instance_count > 1:
+                public_ips, private_key, lb_dns_name = provisioned
+                public_ip = public_ips[0] if public_ips else None
+            else:
+                public_ip, private_key = provisioned
+                public_ips, lb_dns_name = ([public_ip] if public_ip else []), None
+            print(f"Terraform provisioning complete. Public IP: {public_ip}")
+
+            result = {
+                "root_dir": root_dir,
+                "framework": framework,
+                "public_ip": public_ip,
+                "public_ips": public_ips,
+                "lb_dns_name": lb_dns_name,
+                "instance_type": sizing["instance_type"],
+                "url": None,
+                "deployed": False,
+                "workspace": workspace,
+            }
+            deploy_args = dict(
+                framework=framework,
+                ssh_key=private_key,
+                root_dir=root_dir,
+                dependency_path=manifest_path,
+                main_file_path=repo_analysis["main_file_path"],
+                dependency_bundle=bundle,
+                port=repo_analysis["ports"][0],
+                bindings=repo_analysis["bindings"],
+                upload_mode=upload_mode,
+                source_id=source_id(repo_url, root_dir),
+                proxy=proxy,
+                micro_cache=micro_cache,
+                max_workers=sizing["max_workers"],
+                **(deploy_overrides or {})
+            )
+            with span("deploy"):
+                if lb_dns_name:
+                    outcomes = await _in_thread(deploy_fleet, public_ips, code_path, repo_analysis["needs_localhost_replacement"],
+                                                public_address=lb_dns_name, **deploy_args)
+                    result["deployed"] = bool(outcomes) and all(outcomes.values())
+                    result["url"] = f"http://{lb_dns_name}/"
+                elif public_ip:
+                    result["deployed"] = await _in_thread(deploy_application, public_ip=public_ip, repo_path=code_path,
+                                                          needs_localhost_fix=repo_analysis["needs_localhost_replacement"],
+                                                          **deploy_args)
+                    port = repo_analysis["ports"][0]
+                    result["url"] = f"http://{public_ip}/" if proxy else f"http://{public_ip}:{port}/"
+            deployed = result["deployed"]
+        finally:
+            if bundle is not None:
+                bundle.cancel()
+            bundler.shutdown(wait=False)
+            if not deployed:
+                await _cleanup(workspace, destroy_on_failure and not existing)
+
+        if load_test is not None and deployed and result["url"]:
+            result["load_test"] = await verify_deployment(result["url"], **load_test)
+            result["deployed"] = result["load_test"]["passed"]
+        root.set(deployed=result["deployed"], instance_type=sizing["instance_type"])
+        result["trace_id"] = root.trace_id
+        return result
+
+
+async def _cleanup(workspace: str, destroy: bool):
+    if not destroy:
+        print(f"[INFO] Resources left in place for inspection; run `terraform destroy` in {workspace} to remove them")
+        return
+    print(f"[INFO] Destroying the resources in {workspace} after the failed deploy")
+    with span("cleanup.destroy"):
+        # Shielded so a second Ctrl-C doesn't abandon a half-finished destroy
+        await asyncio.shield(_in_thread(terraform_destroy, workspace))
+
+
+def _build_bundle(framework: str, code_path: str, manifest_path: str):
+    with span("dependency_bundle") as s:
+        bundle = prepare_dependency_bundle(framework, code_path, manifest_path, extra_packages=PYTHON_SERVER_PACKAGES)
+        s.set(built=bundle is not None)
+        return bundle
+
+
+def run_pipeline_overlapped(**kwargs) -> dict:
+    # Synchronous entry point for callers outside an event loop
+    return asyncio.run(run_pipeline_async(**kwargs))
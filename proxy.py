@@ -0,0 +1,186 @@
+import os
+import posixpath
+import re
+import shlex
+
+from remote_steps import step
+
+PROXY_PORTS = [80, 443]
+STATIC_ROOT = "/var/www/autodeploy"
+CERT_DIR = "/etc/nginx/autodeploy"
+MICRO_CACHE_DIR = "/var/cache/nginx/autodeploy"
+STATIC_MAX_AGE = "7d"
+GZIP_TYPES = ("text/plain text/css text/javascript application/javascript application/json "
+              "application/xml image/svg+xml")
+
+FLASK_STATIC_FOLDER_RE = re.compile(r"\bstatic_folder\s*=\s*['\"]([^'\"]+)['\"]")
+FLASK_STATIC_URL_RE = re.compile(r"\bstatic_url_path\s*=\s*['\"]([^'\"]*)['\"]")
+EXPRESS_STATIC_RE = re.compile(
+    r"(?:\.use\(\s*['\"](/[^'\"]*)['\"]\s*,\s*)?express\.static\(\s*(?:path\.(?:join|resolve)\(\s*__dirname\s*,\s*)?['\"]\.?/?([^'\"]+)['\"]"
+)
+DJANGO_STATIC_URL_RE = re.compile(r"^STATIC_URL\s*=\s*['\"]/?([^'\"]*)['\"]", re.MULTILINE)
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def find_static_dirs(repo_path: str, framework: str, main_file_path: str) -> list[tuple[str, str]]:
+    # (URL prefix, directory relative to repo_path) pairs nginx can serve without the app
+    if not main_file_path:
+        return []
+    main_dir = posixpath.dirname(main_file_path)
+    source = _read(os.path.join(repo_path, main_file_path))
+    found = []
+    if framework == "flask":
+        folder = FLASK_STATIC_FOLDER_RE.search(source)
+        url = FLASK_STATIC_URL_RE.search(source)
+        folder = folder.group(1) if folder else "static"
+        prefix = url.group(1) if url else "/" + posixpath.basename(folder)
+        found.append((prefix, posixpath.normpath(posixpath.join(main_dir, folder))))
+    elif framework == "django":
+        url = "static/"
+        for dirpath, _, filenames in os.walk(os.path.join(repo_path, main_dir)):
+            if "settings.py" in filenames:
+                m = DJANGO_STATIC_URL_RE.search(_read(os.path.join(dirpath, "settings.py")))
+                url = m.group(1) if m else url
+                break
+        # Only app-level static/ dirs; collectstatic output is left to the app
+        found.append(("/" + url.strip("/"), posixpath.join(main_dir, "static")))
+    elif framework == "nodejs":
+        for prefix, folder in EXPRESS_STATIC_RE.findall(source):
+            found.append((prefix or "/", posixpath.normpath(posixpath.join(main_dir, folder))))
+
+    result = []
+    for prefix, rel_dir in found:
+        if os.path.isdir(os.path.join(repo_path, rel_dir)) and not rel_dir.startswith(".."):
+            result.append(("/" + prefix.strip("/") if prefix.strip("/") else "/", rel_dir))
+    return result
+
+
+def static_layout(name: str, prefixes: list[str]) -> list[str]:
+    # Where each prefix's files go on the VM: laid out under one root so nginx
+    # can use root + try_files instead of alias; "/" gets a separate root
+    return [f"{STATIC_ROOT}/{name}/_root" if prefix == "/" else f"{STATIC_ROOT}/{name}{prefix}" for prefix in prefixes]
+
+
+def nginx_config(name: str, app_port: int, static_prefixes: list[str], micro_cache: bool = False,
+                 tls: bool = True) -> str:
+    root_static = f"{STATIC_ROOT}/{name}/_root" if "/" in static_prefixes else None
+    static_blocks = "".join(f"""
+    location {prefix}/ {{
+        root {STATIC_ROOT}/{name};
+        expires {STATIC_MAX_AGE};
+        add_header Cache-Control "public";
+        access_log off;
+        try_files $uri @app;
+    }}
+""" for prefix in dict.fromkeys(static_prefixes) if prefix != "/")
+
+    cache_zone = ""
+    cache_directives = ""
+    if micro_cache:
+        cache_zone = f"proxy_cache_path {MICRO_CACHE_DIR}/{name} levels=1:2 keys_zone={name}:10m max_size=256m inactive=10m use_temp_path=off;\n"
+        # One-second cache for anonymous GET/HEAD to absorb bursts. While an entry is being
+        # refreshed, or the app errors or times out, the expired copy is served instead.
+        cache_directives = f"""
+        proxy_cache {name};
+        proxy_cache_methods GET HEAD;
+        proxy_cache_valid 200 301 302 1s;
+        proxy_cache_lock on;
+        proxy_cache_use_stale updating error timeout;
+        proxy_cache_bypass $http_authorization $http_cookie;
+        proxy_no_cache $http_authorization $http_cookie;
+        add_header X-Cache-Status $upstream_cache_status;"""
+
+    app_location = f"""
+        proxy_pass http://{name}_app;
+        proxy_http_version 1.1;
+        proxy_set_header Connection "";
+        proxy_set_header Host $host;
+        proxy_set_header X-Real-IP $remote_addr;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto $scheme;{cache_directives}"""
+
+    if root_static:
+        root_block = f"""
+    location / {{
+        root {root_static};
+        expires {STATIC_MAX_AGE};
+        add_header Cache-Control "public";
+        try_files $uri @app;
+    }}
+"""
+    else:
+        root_block = f"""
+    location / {{{app_location}
+    }}
+"""
+
+    listen = "    listen 80 default_server;\n"
+    if tls:
+        listen += (f"    listen 443 ssl default_server;\n"
+                   f"    ssl_certificate {CERT_DIR}/cert.pem;\n"
+                   f"    ssl_certificate_key {CERT_DIR}/key.pem;\n")
+
+    return f"""# Generated by autodeploy
+{cache_zone}upstream {name}_app {{
+    server 127.0.0.1:{app_port};
+    keepalive 32;
+}}
+
+server {{
+{listen}    server_name _;
+    client_max_body_size 20m;
+
+    gzip on;
+    gzip_comp_level 5;
+    gzip_min_length 512;
+    gzip_proxied any;
+    gzip_vary on;
+    gzip_types {GZIP_TYPES};
+{static_blocks}{root_block}
+    location @app {{{app_location}
+    }}
+}}
+"""
+
+
+def proxy_files(repo_path: str, remote_root: str, framework: str, main_file_path: str, app_port: int, name: str,
+                micro_cache: bool = False, static_dirs: list = None) -> dict[str, str]:
+    # `static_dirs` as returned by find_static_dirs, for callers without the checkout (a rollback)
+    if static_dirs is None:
+        static_dirs = find_static_dirs(repo_path, framework.lower(), main_file_path)
+    prefixes = [prefix for prefix, _ in static_dirs]
+    return {f"{remote_root}.nginx.conf": nginx_config(name, app_port, prefixes, micro_cache=micro_cache)}
+
+
+def proxy_steps(repo_path: str, remote_root: str, framework: str, main_file_path: str, name: str,
+                apt_lock_timeout: int = 300, static_dirs: list = None) -> list[dict]:
+    if static_dirs is None:
+        static_dirs = find_static_dirs(repo_path, framework.lower(), main_file_path)
+    # /home/ubuntu isn't readable by www-data, so static files are copied out of it
+    copy = [f"sudo rm -rf {STATIC_ROOT}/{name}"]
+    for (_, rel_dir), dest in zip(static_dirs, static_layout(name, [prefix for prefix, _ in static_dirs])):
+        src = posixpath.join(remote_root, rel_dir)
+        copy.append(f"sudo mkdir -p {dest} && sudo cp -a {shlex.quote(src)}/. {dest}/")
+    if static_dirs:
+        copy.append(f"sudo chmod -R a+rX {STATIC_ROOT}")
+    config_tmp = f"{remote_root}.nginx.conf"
+    return [
+        step("proxy.nginx", f"command -v nginx >/dev/null || sudo apt-get -o DPkg::Lock::Timeout={apt_lock_timeout} install -y nginx",
+             retries=2),
+        step("proxy.static", " && ".join(copy)),
+        # Self-signed until a real certificate is dropped in place
+        step("proxy.cert", f"sudo mkdir -p {CERT_DIR} {MICRO_CACHE_DIR}/{name}"
+                           f" && {{ [ -f {CERT_DIR}/cert.pem ] || sudo openssl req -x509 -nodes -newkey rsa:2048 -days 365"
+                           f" -subj /CN={name} -keyout {CERT_DIR}/key.pem -out {CERT_DIR}/cert.pem 2>/dev/null; }}"),
+        step("proxy.config", f"sudo install -m 644 {shlex.quote(config_tmp)} /etc/nginx/sites-available/{name}"
+                             f" && sudo ln -sf /etc/nginx/sites-available/{name} /etc/nginx/sites-enabled/{name}"
+                             f" && sudo rm -f /etc/nginx/sites-enabled/default"
+                             f" && sudo nginx -t && sudo systemctl reload-or-restart nginx"),
+    ]
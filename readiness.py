@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import random
+import socket
+import time
+from typing import TYPE_CHECKING
+
+from tracing import span
+
+if TYPE_CHECKING:
+    import paramiko
+
+# Exit codes of `cloud-init status --wait`: 0 done, 1 error, 2 done with
+# recoverable errors (degraded) on newer releases.
+CLOUD_INIT_OK = (0, 2)
+
+
+def backoff_delays(initial: float = 0.5, maximum: float = 8.0, factor: float = 2.0):
+    # Exponential backoff with full jitter, so a fleet of deploys doesn't
+    # probe in lockstep.
+    delay = initial
+    while True:
+        yield random.uniform(0, delay)
+        delay = min(delay * factor, maximum)
+
+
+def wait_for_port(host: str, port: int = 22, timeout: float = 300, expect_banner: bytes = b"SSH-") -> int:
+    deadline = time.monotonic() + timeout
+    attempts = 0
+    for delay in backoff_delays():
+        attempts += 1
+        try:
+            with socket.create_connection((host, port), timeout=5) as sock:
+                if not expect_banner:
+                    return attempts
+                sock.settimeout(5)
+                # The port can accept before sshd is really serving; wait for its banner
+                if sock.recv(len(expect_banner)) == expect_banner:
+                    return attempts
+        except OSError:
+            pass
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"{host}:{port} not reachable after {timeout:.0f}s ({attempts} attempts)")
+        time.sleep(delay)
+
+
+def connect_ssh(host: str, username: str, pkey: paramiko.PKey, port: int = 22, timeout: float = 120) -> tuple[paramiko.SSHClient, int]:
+    # sshd can answer before cloud-init has installed our key, so auth
+    # failures are retried too until the deadline.
+    import paramiko
+
+    deadline = time.monotonic() + timeout
+    attempts = 0
+    for delay in backoff_delays():
+        attempts += 1
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            ssh.connect(host, port=port, username=username, pkey=pkey, timeout=10, banner_timeout=30,
+                        look_for_keys=False, allow_agent=False)
+            return ssh, attempts
+        except (paramiko.SSHException, OSError) as e:
+            ssh.close()
+            if time.monotonic() + delay > deadline:
+                raise TimeoutError(f"SSH to {host}:{port} failed after {attempts} attempts: {e}") from e
+            time.sleep(delay)
+
+
+def wait_for_cloud_init(ssh: paramiko.SSHClient, timeout: float = 900) -> int:
+    # One blocking remote command instead of polling the dpkg lock
+    cmd = f"command -v cloud-init >/dev/null || exit 0; timeout {int(timeout)} cloud-init status --wait >/dev/null"
+    _, stdout, stderr = ssh.exec_command(cmd)
+    exit_status = stdout.channel.recv_exit_status()
+    if exit_status == 124:
+        raise TimeoutError(f"cloud-init did not finish within {timeout:.0f}s")
+    if exit_status not in CLOUD_INIT_OK:
+        raise Exception(f"cloud-init failed ({exit_status}): {stderr.read().decode().strip()}")
+    if exit_status == 2:
+        print("[WARN] cloud-init finished with recoverable errors")
+    return exit_status
+
+
+def wait_until_ready(host: str, username: str, pkey: paramiko.PKey, port: int = 22, timeout: float = 600,
+                     cloud_init: bool = True) -> tuple[paramiko.SSHClient, dict]:
+    timings = {}
+    start = time.perf_counter()
+    with span("ready.tcp", host=host) as s:
+        attempts = wait_for_port(host, port, timeout=timeout)
+        s.count("retries", attempts - 1)
+    timings["tcp"] = {"seconds": time.perf_counter() - start, "attempts": attempts}
+
+    phase = time.perf_counter()
+    with span("ready.ssh") as s:
+        ssh, attempts = connect_ssh(host, username, pkey, port=port, timeout=max(30, timeout - (phase - start)))
+        s.count("retries", attempts - 1)
+    timings["ssh"] = {"seconds": time.perf_counter() - phase, "attempts": attempts}
+
+    if cloud_init:
+        phase = time.perf_counter()
+        try:
+            with span("ready.cloud_init"):
+                wait_for_cloud_init(ssh, timeout=max(60, timeout - (phase - start)))
+        except Exception:
+            ssh.close()
+            raise
+        timings["cloud_init"] = {"seconds": time.perf_counter() - phase}
+
+    timings["total"] = {"seconds": time.perf_counter() - start}
+    print("[INFO] Instance ready: " + ", ".join(f"{name} {t['seconds']:.1f}s" for name, t in timings.items()))
+    return ssh, timings
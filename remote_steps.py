@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import posixpath
+import threading
+import time
+import uuid
+from io import BytesIO
+from typing import TYPE_CHECKING
+
+from tracing import record_span
+
+if TYPE_CHECKING:
+    import paramiko
+
+# Runs a list of deploy steps as one generated bash script over a single SSH
+# channel instead of an exec_command round trip per command. The script
+# prints a marker line around each attempt; the reader turns those into
+# per-step exit codes and durations while streaming everything else live.
+
+MARKER = "@@autodeploy"
+OUTPUT_TAIL_LINES = 30
+
+
+def step(name: str, command: str, retries: int = 0, retry_delay: float = 2.0, check: bool = True) -> dict:
+    # `retries` extra attempts, `retry_delay` doubling between them; a failed
+    # step with check=False is reported but doesn't stop the ones after it
+    return {"name": name, "command": command, "retries": retries, "retry_delay": retry_delay, "check": check}
+
+
+def build_script(steps: list[dict], token: str) -> str:
+    lines = [
+        "#!/bin/bash",
+        # On both streams, so stderr can be attributed to its step too
+        f"__mark() {{ printf '\\n{MARKER}:{token} %s\\n' \"$*\"; printf '\\n{MARKER}:{token} %s\\n' \"$*\" >&2; }}",
+    ]
+    for i, s in enumerate(steps):
+        delays = " ".join(f"{s['retry_delay'] * 2 ** attempt:g}" for attempt in range(s["retries"]))
+        lines += [
+            f"# {s['name']}",
+            f"__delays=({delays})",
+            "__attempt=0",
+            "while :; do",
+            "  __attempt=$((__attempt + 1))",
+            f"  __mark start {i} $__attempt",
+            # A subshell so a failing `set -e`/`cd`/`exit` in one step stays in that step
+            f"  ( {s['command']}\n  ) < /dev/null",
+            "  __rc=$?",
+            f"  __mark end {i} $__attempt $__rc",
+            f"  if [ $__rc -eq 0 ] || [ $__attempt -gt {s['retries']} ]; then break; fi",
+            "  sleep \"${__delays[$((__attempt - 1))]}\"",
+            "done",
+        ]
+        if s["check"]:
+            lines.append("[ $__rc -eq 0 ] || exit $__rc")
+    lines.append("exit 0")
+    return "\n".join(lines) + "\n"
+
+
+def _read_stream(stream, marker: str, steps: list[dict], results: list[dict], key: str, prefix: str, echo: bool,
+                 on_marker=None):
+    current = None
+    for raw in iter(stream.readline, b""):
+        line = raw.decode(errors="replace").rstrip("\n")
+        if line.startswith(marker):
+            event, index, attempt, *rest = line[len(marker):].split()
+            current = int(index) if event == "start" else None
+            if on_marker:
+                on_marker(event, int(index), int(attempt), rest)
+            continue
+        if not line:
+            continue
+        if current is not None:
+            results[current][key].append(line)
+        if echo:
+            print(f"{prefix}{steps[current]['name'] + ': ' if current is not None else ''}{line}")
+
+
+def run_steps(ssh: paramiko.SSHClient, steps: list[dict], label: str = None, echo: bool = True,
+              span_prefix: str = "") -> dict:
+    # Returns {"ok", "exit_status", "seconds", "steps": [{name, exit_status,
+    # attempts, seconds, ran, stdout, stderr}]}; steps after a failed checked
+    # step have ran=False and exit_status None
+    token = uuid.uuid4().hex[:12]
+    marker = f"{MARKER}:{token} "
+    results = [{"name": s["name"], "exit_status": None, "attempts": 0, "seconds": 0.0, "ran": False,
+                "stdout": [], "stderr": []} for s in steps]
+    prefix = f"[{label}] " if label else ""
+    started = {}
+    start = time.perf_counter()
+
+    def on_marker(event, index, attempt, rest):
+        entry = results[index]
+        if event == "start":
+            started[index] = time.perf_counter()
+            entry.update(ran=True, attempts=attempt)
+            if attempt > 1:
+                print(f"[WARN] {prefix}{entry['name']}: retrying (attempt {attempt})")
+            return
+        seconds = time.perf_counter() - started[index]
+        entry["seconds"] += seconds
+        entry["exit_status"] = int(rest[0])
+        error = None if entry["exit_status"] == 0 else RuntimeError(f"exit status {entry['exit_status']}")
+        record_span(f"{span_prefix}{entry['name']}", seconds, error=error, attempt=attempt)
+
+    channel = ssh.get_transport().open_session()
+    try:
+        channel.exec_command("bash -s")
+        channel.sendall(build_script(steps, token).encode())
+        channel.shutdown_write()
+        stderr_reader = threading.Thread(target=_read_stream, daemon=True,
+                                         args=(channel.makefile_stderr("rb"), marker, steps, results, "stderr", prefix, echo))
+        stderr_reader.start()
+        _read_stream(channel.makefile("rb"), marker, steps, results, "stdout", prefix, echo, on_marker=on_marker)
+        exit_status = channel.recv_exit_status()
+        stderr_reader.join(timeout=5)
+    finally:
+        channel.close()
+
+    for entry in results:
+        entry["stdout"] = entry["stdout"][-OUTPUT_TAIL_LINES:]
+        entry["stderr"] = entry["stderr"][-OUTPUT_TAIL_LINES:]
+    failed = [r for r, s in zip(results, steps) if r["exit_status"] not in (None, 0) and s["check"]]
+    if failed:
+        print(f"[ERROR] {prefix}{failed[0]['name']} failed with exit status {failed[0]['exit_status']}:\n"
+              + "\n".join(failed[0]["stdout"] + failed[0]["stderr"]))
+    return {
+        "ok": exit_status == 0,
+        "exit_status": exit_status,
+        "seconds": time.perf_counter() - start,
+        "steps": results,
+    }
+
+
+def step_result(run: dict, name: str) -> dict:
+    return next((r for r in run["steps"] if r["name"] == name), None)
+
+
+def put_files(ssh: paramiko.SSHClient, files: dict[str, str]):
+    # Generated files (unit files, configs) go up over one SFTP session ahead
+    # of the script that installs them
+    if not files:
+        return
+    sftp = ssh.open_sftp()
+    try:
+        for directory in sorted({posixpath.dirname(path) for path in files}):
+            try:
+                sftp.stat(directory)
+            except IOError:
+                sftp.mkdir(directory)
+        for path, content in files.items():
+            sftp.putfo(BytesIO(content.encode()), path)
+    finally:
+        sftp.close()
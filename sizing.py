@@ -0,0 +1,172 @@
+import argparse
+import json
+import math
+import os
+import re
+
+# us-east-1 on-demand Linux prices; all are x86_64 so the Ubuntu base AMI boots on each
+INSTANCE_CATALOG = [
+    {"type": "t2.micro", "vcpus": 1, "memory_gib": 1, "hourly_usd": 0.0116, "burstable": True},
+    {"type": "t3.micro", "vcpus": 2, "memory_gib": 1, "hourly_usd": 0.0104, "burstable": True},
+    {"type": "t3.small", "vcpus": 2, "memory_gib": 2, "hourly_usd": 0.0208, "burstable": True},
+    {"type": "t3.medium", "vcpus": 2, "memory_gib": 4, "hourly_usd": 0.0416, "burstable": True},
+    {"type": "t3.large", "vcpus": 2, "memory_gib": 8, "hourly_usd": 0.0832, "burstable": True},
+    {"type": "t3.xlarge", "vcpus": 4, "memory_gib": 16, "hourly_usd": 0.1664, "burstable": True},
+    {"type": "c6i.large", "vcpus": 2, "memory_gib": 4, "hourly_usd": 0.085, "burstable": False},
+    {"type": "c6i.xlarge", "vcpus": 4, "memory_gib": 8, "hourly_usd": 0.17, "burstable": False},
+    {"type": "c6i.2xlarge", "vcpus": 8, "memory_gib": 16, "hourly_usd": 0.34, "burstable": False},
+    {"type": "c6i.4xlarge", "vcpus": 16, "memory_gib": 32, "hourly_usd": 0.68, "burstable": False},
+    {"type": "m6i.large", "vcpus": 2, "memory_gib": 8, "hourly_usd": 0.096, "burstable": False},
+    {"type": "m6i.xlarge", "vcpus": 4, "memory_gib": 16, "hourly_usd": 0.192, "burstable": False},
+    {"type": "m6i.2xlarge", "vcpus": 8, "memory_gib": 32, "hourly_usd": 0.384, "burstable": False},
+    {"type": "r6i.large", "vcpus": 2, "memory_gib": 16, "hourly_usd": 0.126, "burstable": False},
+    {"type": "r6i.xlarge", "vcpus": 4, "memory_gib": 32, "hourly_usd": 0.252, "burstable": False},
+]
+CATALOG_BY_TYPE = {entry["type"]: entry for entry in INSTANCE_CATALOG}
+HOURS_PER_MONTH = 730
+
+# Minimum memory (GiB) implied by loose size words in a request
+SIZE_WORDS = {"nano": 0.5, "micro": 1, "tiny": 1, "small": 2, "medium": 4, "large": 8, "xlarge": 16, "huge": 32}
+
+# Rough steady-state requests/second one core sustains for a typical CRUD handler
+RPS_PER_CORE = {"flask": 150, "django": 100, "nodejs": 600}
+ML_RPS_PER_CORE = 10
+# Resident memory of one app-server worker, before per-dependency growth
+WORKER_BASE_MB = {"flask": 60, "django": 100, "nodejs": 70}
+WORKER_MB_PER_DEPENDENCY = 6
+ML_WORKER_MB = 900
+OS_RESERVED_MB = 350
+
+ML_PACKAGES = {
+    "torch", "tensorflow", "tensorflow-cpu", "keras", "jax", "transformers", "sentence-transformers",
+    "scikit-learn", "sklearn", "xgboost", "lightgbm", "catboost", "spacy", "onnxruntime", "opencv-python",
+    "@tensorflow/tfjs-node", "onnxruntime-node", "@xenova/transformers",
+}
+RPS_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(k)?\s*(?:rps|req(?:uests)?\s*(?:/|per)\s*s(?:ec(?:ond)?)?|qps)\b", re.IGNORECASE)
+RPM_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(k)?\s*(?:rpm|req(?:uests)?\s*(?:/|per)\s*min(?:ute)?)\b", re.IGNORECASE)
+REQUIREMENT_NAME_RE = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+
+def parse_expected_rps(text: str) -> int | None:
+    if not text:
+        return None
+    m = RPS_RE.search(text)
+    if m:
+        return int(float(m.group(1)) * (1000 if m.group(2) else 1))
+    m = RPM_RE.search(text)
+    if m:
+        return max(1, int(float(m.group(1)) * (1000 if m.group(2) else 1) / 60))
+    return None
+
+
+def read_dependencies(repo_path: str, manifest_path: str) -> list[str]:
+    if not manifest_path:
+        return []
+    path = os.path.join(repo_path, manifest_path)
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            content = f.read()
+    except OSError:
+        return []
+    if manifest_path.endswith("package.json"):
+        try:
+            data = json.loads(content)
+        except ValueError:
+            return []
+        return sorted({*data.get("dependencies", {}), *data.get("devDependencies", {})})
+    names = []
+    for line in content.splitlines():
+        line = line.split("#", 1)[0]
+        m = REQUIREMENT_NAME_RE.match(line)
+        if m and not line.lstrip().startswith("-"):
+            names.append(m.group(1).lower().replace("_", "-"))
+    return names
+
+
+def workers_for(framework: str, memory_gib: float, dependency_count: int, uses_ml: bool) -> int:
+    # How many app-server workers fit in memory; the launcher caps its CPU-based count with this
+    per_worker = WORKER_BASE_MB.get(framework, 80) + WORKER_MB_PER_DEPENDENCY * dependency_count
+    per_worker += ML_WORKER_MB if uses_ml else 0
+    return max(1, int((memory_gib * 1024 - OS_RESERVED_MB) // per_worker))
+
+
+def recommend_instance(framework: str, repo_path: str = None, manifest_path: str = None, resource_size: str = None,
+                       expected_rps: int = None, catalog: list[dict] = INSTANCE_CATALOG) -> dict:
+    framework = (framework or "").lower()
+    dependencies = read_dependencies(repo_path, manifest_path) if repo_path else []
+    ml = sorted(set(dependencies) & ML_PACKAGES)
+    reasons = []
+
+    rps_per_core = ML_RPS_PER_CORE if ml else RPS_PER_CORE.get(framework, 100)
+    min_vcpus = math.ceil(expected_rps / rps_per_core) if expected_rps else 1
+    if expected_rps:
+        reasons.append(f"{expected_rps} req/s at ~{rps_per_core} req/s per core needs {min_vcpus} vCPU")
+
+    per_worker_mb = WORKER_BASE_MB.get(framework, 80) + WORKER_MB_PER_DEPENDENCY * len(dependencies) + (ML_WORKER_MB if ml else 0)
+    # At least two workers so one slow request can't stall the app
+    min_memory = (OS_RESERVED_MB + 2 * per_worker_mb) / 1024
+    reasons.append(f"{len(dependencies)} dependencies put a worker at ~{per_worker_mb} MB; two workers need {min_memory:.1f} GiB")
+    if ml:
+        reasons.append(f"ML libraries ({', '.join(ml)}) need memory and sustained CPU")
+
+    requested = (resource_size or "").strip().lower()
+    if requested in CATALOG_BY_TYPE:
+        entry = CATALOG_BY_TYPE[requested]
+        if entry["vcpus"] < min_vcpus or entry["memory_gib"] < min_memory:
+            print(f"[WARN] Requested {requested} looks undersized ({min_vcpus} vCPU / {min_memory:.1f} GiB estimated)")
+        reasons.append(f"{requested} was requested explicitly")
+        return _recommendation(entry, framework, len(dependencies), bool(ml), reasons)
+    for word, gib in SIZE_WORDS.items():
+        if re.search(rf"\b{word}\b", requested):
+            min_memory = max(min_memory, gib)
+            reasons.append(f"'{resource_size}' asks for at least {gib} GiB")
+            break
+    else:
+        if requested:
+            reasons.append(f"ignored unrecognised size '{resource_size}'")
+
+    # Burstable instances run out of CPU credits under sustained load
+    sustained = bool(ml) or min_vcpus > 1
+    candidates = [
+        entry for entry in catalog
+        if entry["vcpus"] >= min_vcpus and entry["memory_gib"] >= min_memory and not (sustained and entry["burstable"])
+    ]
+    if not candidates:
+        entry = max(catalog, key=lambda e: (e["vcpus"], e["memory_gib"]))
+        reasons.append(f"nothing in the catalog meets the estimate; using the largest, {entry['type']}")
+    else:
+        entry = min(candidates, key=lambda e: (e["hourly_usd"], -e["vcpus"]))
+        if sustained:
+            reasons.append("sustained load rules out burstable t-family instances")
+        reasons.append(f"{entry['type']} is the cheapest type with {entry['vcpus']} vCPU / {entry['memory_gib']} GiB")
+    return _recommendation(entry, framework, len(dependencies), bool(ml), reasons)
+
+
+def _recommendation(entry: dict, framework: str, dependency_count: int, uses_ml: bool, reasons: list[str]) -> dict:
+    return {
+        "instance_type": entry["type"],
+        "vcpus": entry["vcpus"],
+        "memory_gib": entry["memory_gib"],
+        "hourly_usd": entry["hourly_usd"],
+        "monthly_usd": round(entry["hourly_usd"] * HOURS_PER_MONTH, 2),
+        "max_workers": workers_for(framework, entry["memory_gib"], dependency_count, uses_ml),
+        "reasons": reasons,
+    }
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Recommend an EC2 instance type for an app")
+    parser.add_argument("repo_path")
+    parser.add_argument("--framework", required=True, choices=sorted(RPS_PER_CORE))
+    parser.add_argument("--manifest", help="dependency manifest path relative to repo_path")
+    parser.add_argument("--size", help="requested size, e.g. 'small' or 't3.medium'")
+    parser.add_argument("--request", help="free-form request text to read expected load from")
+    parser.add_argument("--rps", type=int, help="expected requests per second")
+    args = parser.parse_args(argv)
+
+    rps = args.rps or parse_expected_rps(args.request)
+    print(json.dumps(recommend_instance(args.framework, args.repo_path, args.manifest, args.size, rps), indent=2))
+
+
+if __name__ == "__main__":
+    main()
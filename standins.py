@@ -0,0 +1,502 @@
+import json
+import logging
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from io import StringIO
+from types import SimpleNamespace
+
+import paramiko
+
+# Local stand-ins for the remote pieces of a deploy, used by benchmark.py.
+# LocalSSHServer speaks real SSH/SFTP on localhost and serves the local
+# filesystem, so remote paths should point into a temp directory.
+
+
+def _default_llm_answer(system_prompt: str, user_content: str) -> dict:
+    if "deployment instruction parser" in system_prompt:
+        framework = next((f for f in ("django", "flask", "nodejs") if f in user_content.lower()), None)
+        return {"cloud_provider": "aws", "application_type": framework, "resource_size": None}
+    # Structure request: pick the first plausible manifest and entry point from the tree
+    paths = []
+    stack = []
+    for line in user_content.splitlines():
+        m = re.match(r"^((?:[│ ]   )*)[├└]── (.+)$", line)
+        if not m:
+            continue
+        depth = len(m.group(1)) // 4
+        stack[depth:] = [m.group(2)]
+        paths.append("/".join(stack))
+    manifest = next((p for p in paths if p.rsplit("/", 1)[-1] in ("requirements.txt", "package.json")), None)
+    main = next((p for p in paths if p.rsplit("/", 1)[-1] in ("app.py", "main.py", "manage.py", "server.js", "index.js")), None)
+    return {"dependency_manifest_path": manifest, "main_file_path": main}
+
+
+FAKE_TERRAFORM = """#!{python}
+import json, os, re, sys, time
+
+OUTPUTS = {outputs}
+APPLY_SECONDS = {apply_seconds}
+
+args = sys.argv[1:]
+if os.environ.get("FAKE_TERRAFORM_LOG"):
+    with open(os.environ["FAKE_TERRAFORM_LOG"], "a") as f:
+        f.write(" ".join(args) + "\\n")
+
+def emit(kind, **fields):
+    print(json.dumps({{"type": kind, "@message": fields.pop("message", kind), **fields}}), flush=True)
+
+cmd = args[0] if args else ""
+if cmd == "init":
+    os.makedirs(".terraform/providers", exist_ok=True)
+    if not os.path.exists(".terraform.lock.hcl"):
+        with open(".terraform.lock.hcl", "w") as f:
+            f.write('provider "registry.terraform.io/hashicorp/aws" {{ version = "5.0.0" }}\\n')
+elif cmd == "apply":
+    with open("main.tf") as f:
+        addrs = [".".join(m) for m in re.findall(r'^resource "(\\w+)" "(\\w+)"', f.read(), re.M)]
+    for addr in addrs:
+        hook = {{"resource": {{"addr": addr}}, "action": "create"}}
+        emit("apply_start", hook=hook)
+        time.sleep(APPLY_SECONDS / max(len(addrs), 1))
+        emit("apply_complete", hook={{**hook, "elapsed_seconds": round(APPLY_SECONDS / max(len(addrs), 1), 3)}})
+    emit("change_summary", message=f"Apply complete! Resources: {{len(addrs)}} added, 0 changed, 0 destroyed.")
+    with open("terraform.tfstate", "w") as f:
+        json.dump({{"outputs": OUTPUTS, "resources": [{{"type": a.split(".")[0], "name": a.split(".")[1]}} for a in addrs]}}, f)
+elif cmd == "output":
+    with open("terraform.tfstate") as f:
+        outputs = json.load(f)["outputs"]
+    print(json.dumps({{k: {{"value": v, "type": "string", "sensitive": False}} for k, v in outputs.items()}}))
+elif cmd == "destroy":
+    if os.path.exists("terraform.tfstate"):
+        os.remove("terraform.tfstate")
+    print("Destroy complete!")
+else:
+    sys.exit(f"fake terraform: unsupported command {{cmd}}")
+"""
+
+
+def write_fake_terraform(directory: str, outputs: dict, apply_seconds: float = 0.0) -> str:
+    # An executable that answers init/apply -json/output -json/destroy like terraform
+    # does, without touching any cloud; point AUTODEPLOY_TERRAFORM at it.
+    path = os.path.join(directory, "terraform")
+    with open(path, "w") as f:
+        f.write(FAKE_TERRAFORM.format(python=sys.executable, outputs=repr(outputs), apply_seconds=apply_seconds))
+    os.chmod(path, 0o755)
+    return path
+
+
+PRIVILEGED_SHIM = """#!/bin/sh
+echo "$(basename "$0") $*" >> {log}
+exit 0
+"""
+
+PRIVILEGED_COMMANDS = ["sudo", "systemctl", "journalctl", "apt-get"]
+
+
+def write_privileged_shims(directory: str, log_path: str) -> str:
+    # Stand-ins for the root-only and systemd steps of a deploy (package
+    # installs, unit files, service restarts): they log the command line and
+    # succeed, so the rest of the pipeline runs for real without root or
+    # touching this machine's packages. Put `directory` first on PATH.
+    os.makedirs(directory, exist_ok=True)
+    for name in PRIVILEGED_COMMANDS:
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write(PRIVILEGED_SHIM.format(log=json.dumps(log_path)))
+        os.chmod(path, 0o755)
+    return directory
+
+
+FAKE_SYSTEMCTL = """#!{python}
+import os, shlex, shutil, signal, subprocess, sys, time
+
+UNIT_DIR = {unit_dir!r}
+RUN_DIR = os.path.join(UNIT_DIR, ".run")
+os.makedirs(RUN_DIR, exist_ok=True)
+with open({log!r}, "a") as f:
+    f.write("systemctl " + " ".join(sys.argv[1:]) + "\\n")
+
+
+def read_unit(unit):
+    try:
+        with open(os.path.join(UNIT_DIR, unit + ".service")) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    cfg = {{"env": {{}}, "cwd": None, "type": "simple", "exec": [], "post": []}}
+    for line in lines:
+        key, _, value = line.partition("=")
+        if key == "Environment":
+            k, _, v = value.partition("=")
+            cfg["env"][k] = v
+        elif key == "WorkingDirectory":
+            cfg["cwd"] = value
+        elif key == "Type":
+            cfg["type"] = value
+        elif key in ("ExecStart", "ExecStartPost"):
+            argv = shlex.split(value.lstrip("+-").replace("$$", "$"))
+            # Absolute paths resolve through PATH so the other shims apply
+            argv[0] = shutil.which(os.path.basename(argv[0])) or argv[0]
+            cfg["exec" if key == "ExecStart" else "post"].append(argv)
+    return cfg
+
+
+def pid_of(unit):
+    try:
+        with open(os.path.join(RUN_DIR, unit + ".pid")) as f:
+            pid = int(f.read())
+        os.kill(pid, 0)
+        return pid
+    except (OSError, ValueError):
+        return None
+
+
+def stop(unit):
+    pid = pid_of(unit)
+    if pid:
+        os.killpg(pid, signal.SIGTERM)
+        for _ in range(300):
+            if pid_of(unit) is None:
+                break
+            time.sleep(0.1)
+    try:
+        os.remove(os.path.join(RUN_DIR, unit + ".pid"))
+    except OSError:
+        pass
+
+
+def start(unit):
+    cfg = read_unit(unit)
+    if cfg is None:
+        sys.exit(f"Unit {{unit}}.service not found.")
+    env = {{**os.environ, **cfg["env"]}}
+    if cfg["type"] == "oneshot":
+        for argv in cfg["exec"] + cfg["post"]:
+            subprocess.run(argv, cwd=cfg["cwd"], env=env, check=True)
+        return
+    stop(unit)
+    log = open(os.path.join(RUN_DIR, unit + ".log"), "ab")
+    proc = subprocess.Popen(cfg["exec"][0], cwd=cfg["cwd"], env=env, stdin=subprocess.DEVNULL, stdout=log,
+                            stderr=log, start_new_session=True)
+    with open(os.path.join(RUN_DIR, unit + ".pid"), "w") as f:
+        f.write(str(proc.pid))
+    # Like systemd, a failed ExecStartPost fails the start and stops the service
+    for argv in cfg["post"]:
+        if subprocess.run(argv, cwd=cfg["cwd"], env=env).returncode != 0:
+            stop(unit)
+            sys.exit(f"Job for {{unit}}.service failed.")
+
+
+args = [a for a in sys.argv[1:] if not a.startswith("-")]
+flags = [a for a in sys.argv[1:] if a.startswith("-")]
+cmd, units = args[0], [a[:-len(".service")] if a.endswith(".service") else a for a in args[1:]]
+for unit in units:
+    if cmd in ("start", "restart", "reload-or-restart"):
+        start(unit)
+    elif cmd == "stop" or (cmd == "disable" and "--now" in flags):
+        stop(unit)
+    elif cmd == "is-active":
+        sys.exit(0 if pid_of(unit) else 3)
+"""
+
+SERVICE_SUDO = """#!/bin/sh
+echo "sudo $*" >> {log}
+exec "$@"
+"""
+
+SERVICE_LOGGED_COMMANDS = ["journalctl", "apt-get", "iptables", "iptables-restore", "nginx", "openssl"]
+
+
+def write_service_shims(directory: str, log_path: str, unit_dir: str) -> str:
+    # Like write_privileged_shims, but services really run: sudo runs its
+    # command as the SSH user and systemctl starts, stops and checks units
+    # from `unit_dir` as plain processes. Point launcher.SYSTEMD_UNIT_DIR (and
+    # bluegreen's) at `unit_dir`; firewall and nginx commands are only logged.
+    os.makedirs(directory, exist_ok=True)
+    os.makedirs(unit_dir, exist_ok=True)
+    scripts = {"sudo": SERVICE_SUDO.format(log=json.dumps(log_path)),
+               "systemctl": FAKE_SYSTEMCTL.format(python=sys.executable, unit_dir=unit_dir, log=log_path)}
+    scripts.update({name: PRIVILEGED_SHIM.format(log=json.dumps(log_path)) for name in SERVICE_LOGGED_COMMANDS})
+    for name, content in scripts.items():
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write(content)
+        os.chmod(path, 0o755)
+    return directory
+
+
+def stop_fake_services(unit_dir: str):
+    # Terminates whatever the fake systemctl left running
+    run_dir = os.path.join(unit_dir, ".run")
+    for name in os.listdir(run_dir) if os.path.isdir(run_dir) else []:
+        if name.endswith(".pid"):
+            try:
+                with open(os.path.join(run_dir, name)) as f:
+                    os.killpg(int(f.read()), signal.SIGTERM)
+            except (OSError, ValueError):
+                pass
+
+
+class FakeOpenAIClient:
+    # Drop-in for openai.OpenAI() as used by chatbot.py: answers are computed
+    # locally (or by `responder`) after an optional simulated latency.
+    def __init__(self, responder=None, latency: float = 0.0):
+        self.responder = responder or _default_llm_answer
+        self.latency = latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model: str, messages: list[dict], **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        answer = self.responder(messages[0]["content"], messages[-1]["content"])
+        content = answer if isinstance(answer, str) else json.dumps(answer)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class _LocalSFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        try:
+            paramiko.SFTPServer.set_file_attr(self.filename, attr)
+            return paramiko.SFTP_OK
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+class _LocalSFTPServer(paramiko.SFTPServerInterface):
+    def list_folder(self, path):
+        try:
+            out = []
+            for name in os.listdir(path):
+                attr = paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(path, name)))
+                attr.filename = name
+                out.append(attr)
+            return out
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.lstat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def open(self, path, flags, attr):
+        try:
+            mode = getattr(attr, "st_mode", None) or 0o666
+            fd = os.open(path, flags, mode)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_CREAT and attr is not None:
+            attr._flags &= ~attr.FLAG_PERMISSIONS
+            paramiko.SFTPServer.set_file_attr(path, attr)
+        if flags & os.O_WRONLY:
+            fstr = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            fstr = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            fstr = "rb"
+        try:
+            f = os.fdopen(fd, fstr)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle = _LocalSFTPHandle(flags)
+        handle.filename = path
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.rename(oldpath, newpath)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def posix_rename(self, oldpath, newpath):
+        return self.rename(oldpath, newpath)
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(path)
+            if attr is not None:
+                paramiko.SFTPServer.set_file_attr(path, attr)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rmdir(self, path):
+        try:
+            os.rmdir(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        try:
+            paramiko.SFTPServer.set_file_attr(path, attr)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+
+def _pump(src, dst, close_dst=None):
+    try:
+        while True:
+            data = src(32768)
+            if not data:
+                break
+            dst(data)
+    except (OSError, EOFError):
+        pass
+    finally:
+        if close_dst:
+            close_dst()
+
+
+def _run_exec(channel: paramiko.Channel, command: str, cwd: str, env: dict = None):
+    proc = subprocess.Popen(
+        ["bash", "-c", command],
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    feeders = [
+        threading.Thread(target=_pump, args=(channel.recv, proc.stdin.write, proc.stdin.close), daemon=True),
+        threading.Thread(target=_pump, args=(proc.stdout.read1, channel.sendall), daemon=True),
+        threading.Thread(target=_pump, args=(proc.stderr.read1, channel.sendall_stderr), daemon=True),
+    ]
+    for t in feeders:
+        t.start()
+    exit_code = proc.wait()
+    for t in feeders[1:]:
+        t.join()
+    try:
+        channel.send_exit_status(exit_code)
+        channel.close()
+    except (OSError, EOFError):
+        # The client didn't wait for the exit status and has hung up
+        pass
+
+
+class _LocalServerInterface(paramiko.ServerInterface):
+    def __init__(self, cwd: str, env: dict = None):
+        self.cwd = cwd
+        self.env = env
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def get_allowed_auths(self, username):
+        return "publickey,password"
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=_run_exec, args=(channel, command.decode(), self.cwd, self.env), daemon=True).start()
+        return True
+
+
+logging.getLogger("autodeploy.standins.sshd").setLevel(logging.CRITICAL)
+
+
+class LocalSSHServer:
+    def __init__(self, cwd: str = None, host: str = "127.0.0.1", port: int = 0, env: dict = None):
+        self.cwd = cwd or os.getcwd()
+        # Environment for exec'd commands, e.g. a PATH with write_privileged_shims first
+        self.env = env
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.client_key = paramiko.RSAKey.generate(2048)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self.host, self.port = self._sock.getsockname()
+        self._transports = []
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def private_key_pem(self) -> str:
+        out = StringIO()
+        self.client_key.write_private_key(out)
+        return out.getvalue()
+
+    def start(self):
+        self._sock.listen(16)
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def _accept_loop(self):
+        while not self._stopped.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket):
+        transport = paramiko.Transport(conn)
+        # Probes and teardown make the server side log tracebacks that aren't errors here
+        transport.set_log_channel("autodeploy.standins.sshd")
+        transport.add_server_key(self.host_key)
+        transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _LocalSFTPServer)
+        self._transports.append(transport)
+        try:
+            transport.start_server(server=_LocalServerInterface(self.cwd, self.env))
+        except (paramiko.SSHException, EOFError, OSError):
+            # Readiness probes connect and hang up without negotiating
+            transport.close()
+
+    def connect(self, username: str = "ubuntu") -> paramiko.SSHClient:
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(self.host, port=self.port, username=username, pkey=self.client_key,
+                    look_for_keys=False, allow_agent=False)
+        return ssh
+
+    def stop(self):
+        self._stopped.set()
+        self._sock.close()
+        for transport in self._transports:
+            transport.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
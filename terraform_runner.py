@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import uuid
+
+from config import cache_path
+from tracing import span
+
+TERRAFORM_BIN = os.environ.get("AUTODEPLOY_TERRAFORM", "terraform")
+DEFAULT_PARALLELISM = 10
+LOCK_FILE = ".terraform.lock.hcl"
+INIT_STAMP = ".autodeploy_init"
+STATE_FILE = "terraform.tfstate"
+WORKSPACE_MAX_AGE_DAYS = 14
+
+TERRAFORM_BLOCK_RE = re.compile(r"^terraform\s*\{.*?^\}", re.MULTILINE | re.DOTALL)
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    # Providers are downloaded once per machine and symlinked into workspaces
+    env.setdefault("TF_PLUGIN_CACHE_DIR", cache_path("terraform", "plugins"))
+    env["TF_IN_AUTOMATION"] = "1"
+    env["TF_INPUT"] = "0"
+    return env
+
+
+def workspace_path(name: str = None) -> str:
+    name = name or f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    return cache_path("terraform", "workspaces", name)
+
+
+def deployment_workspace(source: str, root_dir: str) -> str:
+    # One workspace per deployed app: redeploys reuse its state and its initialized
+    # providers instead of provisioning (and leaking) a fresh set of resources
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "-", root_dir or "").strip("-.") or "app"
+    return f"{slug}-{hashlib.sha256(source.encode()).hexdigest()[:8]}"
+
+
+def resource_suffix(workspace: str) -> str:
+    # Stable resource names per workspace, so re-applying doesn't replace everything
+    return hashlib.sha256(os.path.basename(workspace.rstrip(os.sep)).encode()).hexdigest()[:6]
+
+
+def workspace_resources(workspace: str) -> int:
+    try:
+        with open(os.path.join(workspace, STATE_FILE), "r") as f:
+            return len(json.load(f).get("resources") or [])
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError):
+        # An unreadable state may still describe live resources
+        return -1
+
+
+def prune_workspaces(max_age_days: float = WORKSPACE_MAX_AGE_DAYS, keep: str = None) -> list[str]:
+    # Removes workspaces untouched for max_age_days that track no resources.
+    # Ones with live state are kept: deleting them would orphan what they created.
+    root = cache_path("terraform", "workspaces")
+    cutoff = time.time() - max_age_days * 86400
+    removed = []
+    for entry in os.scandir(root):
+        if not entry.is_dir() or (keep and os.path.samefile(entry.path, keep)):
+            continue
+        config = os.path.join(entry.path, "main.tf")
+        used = os.path.getmtime(config) if os.path.isfile(config) else entry.stat().st_mtime
+        if used >= cutoff or workspace_resources(entry.path) != 0:
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        removed.append(entry.path)
+    if removed:
+        print(f"[INFO] Pruned {len(removed)} unused terraform workspace(s)")
+    return removed
+
+
+def _init_stamp(workspace: str, tf_config: str) -> str:
+    # Re-init is only needed when provider requirements or the lock file change
+    match = TERRAFORM_BLOCK_RE.search(tf_config)
+    h = hashlib.sha256((match.group(0) if match else "").encode())
+    lock_path = os.path.join(workspace, LOCK_FILE)
+    if os.path.isfile(lock_path):
+        with open(lock_path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def terraform_init(workspace: str, tf_config: str) -> bool:
+    shared_lock = os.path.join(cache_path("terraform"), LOCK_FILE)
+    lock_path = os.path.join(workspace, LOCK_FILE)
+    if not os.path.isfile(lock_path) and os.path.isfile(shared_lock):
+        # With a lock file and a warm plugin cache init never touches the registry
+        shutil.copyfile(shared_lock, lock_path)
+
+    stamp_path = os.path.join(workspace, INIT_STAMP)
+    stamp = _init_stamp(workspace, tf_config)
+    if os.path.isdir(os.path.join(workspace, ".terraform")) and os.path.isfile(stamp_path):
+        with open(stamp_path, "r") as f:
+            if f.read().strip() == stamp:
+                print(f"[INFO] Terraform workspace {workspace} already initialized, skipping init")
+                return False
+
+    subprocess.run([TERRAFORM_BIN, "init", "-input=false", "-no-color"], cwd=workspace, env=_env(), check=True)
+    if os.path.isfile(lock_path):
+        tmp = f"{shared_lock}.{os.getpid()}.tmp"
+        shutil.copyfile(lock_path, tmp)
+        os.replace(tmp, shared_lock)
+    with open(stamp_path, "w") as f:
+        f.write(_init_stamp(workspace, tf_config))
+    return True
+
+
+def _handle_event(event: dict, resources: dict):
+    kind = event.get("type")
+    hook = event.get("hook", {})
+    addr = hook.get("resource", {}).get("addr")
+    if kind == "apply_start":
+        resources[addr] = {"action": hook.get("action"), "start": time.perf_counter()}
+        print(f"[INFO] terraform: {addr} {hook.get('action')}...")
+    elif kind == "apply_progress":
+        print(f"[INFO] terraform: {addr} still {hook.get('action')} ({hook.get('elapsed_seconds')}s)")
+    elif kind == "apply_complete":
+        entry = resources.setdefault(addr, {"action": hook.get("action")})
+        entry["seconds"] = hook.get("elapsed_seconds", time.perf_counter() - entry.get("start", time.perf_counter()))
+        print(f"[INFO] terraform: {addr} done in {entry['seconds']}s")
+    elif kind == "apply_errored":
+        resources.setdefault(addr, {})["error"] = True
+        print(f"[ERROR] terraform: {addr} failed")
+    elif kind == "diagnostic":
+        diag = event.get("diagnostic", {})
+        print(f"[{'ERROR' if diag.get('severity') == 'error' else 'WARN'}] terraform: {diag.get('summary')}: {diag.get('detail', '')}")
+    elif kind == "change_summary":
+        print(f"[INFO] terraform: {event.get('@message')}")
+
+
+def _interrupt_on(cancel: threading.Event, proc: subprocess.Popen):
+    # SIGINT is terraform's graceful stop: in-flight resources finish and state is written
+    while not cancel.wait(0.5):
+        if proc.poll() is not None:
+            return
+    if proc.poll() is None:
+        print("[WARN] terraform: cancelled, waiting for it to stop and save state")
+        proc.send_signal(signal.SIGINT)
+
+
+def terraform_apply(workspace: str, parallelism: int = DEFAULT_PARALLELISM, cancel: threading.Event = None) -> dict:
+    resources = {}
+    cmd = [TERRAFORM_BIN, "apply", "-auto-approve", "-input=false", "-json", f"-parallelism={parallelism}"]
+    proc = subprocess.Popen(cmd, cwd=workspace, env=_env(), stdout=subprocess.PIPE, text=True)
+    if cancel is not None:
+        threading.Thread(target=_interrupt_on, args=(cancel, proc), daemon=True).start()
+    for line in proc.stdout:
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            print(line.rstrip())
+            continue
+        _handle_event(event, resources)
+    if proc.wait() != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    for entry in resources.values():
+        entry.pop("start", None)
+    return resources
+
+
+def terraform_destroy(workspace: str, parallelism: int = DEFAULT_PARALLELISM) -> bool:
+    cmd = [TERRAFORM_BIN, "destroy", "-auto-approve", "-input=false", "-no-color", f"-parallelism={parallelism}"]
+    result = subprocess.run(cmd, cwd=workspace, env=_env())
+    if result.returncode != 0:
+        print(f"[ERROR] terraform destroy failed in {workspace}; resources may still be running")
+    return result.returncode == 0
+
+
+def terraform_outputs(workspace: str) -> dict:
+    result = subprocess.run([TERRAFORM_BIN, "output", "-json"], cwd=workspace, env=_env(),
+                            capture_output=True, text=True, check=True)
+    return {name: value.get("value") for name, value in json.loads(result.stdout or "{}").items()}
+
+
+def apply_config(tf_config: str, workspace: str = None, parallelism: int = DEFAULT_PARALLELISM,
+                 cancel: threading.Event = None) -> dict:
+    # `workspace` is a directory path, or a bare name kept under the cache dir
+    if workspace is None or os.sep not in workspace:
+        workspace = workspace_path(workspace)
+    else:
+        os.makedirs(workspace, exist_ok=True)
+    prune_workspaces(keep=workspace)
+    with open(os.path.join(workspace, "main.tf"), "w") as f:
+        f.write(tf_config)
+
+    timings = {}
+    start = time.perf_counter()
+    with span("terraform.init") as s:
+        initialized = terraform_init(workspace, tf_config)
+        s.set(skipped=not initialized)
+    timings["init"] = time.perf_counter() - start
+
+    phase = time.perf_counter()
+    with span("terraform.apply", parallelism=parallelism) as s:
+        resources = terraform_apply(workspace, parallelism=parallelism, cancel=cancel)
+        s.count("resources", len(resources))
+    timings["apply"] = time.perf_counter() - phase
+
+    phase = time.perf_counter()
+    with span("terraform.output"):
+        outputs = terraform_outputs(workspace)
+    timings["output"] = time.perf_counter() - phase
+
+    print("[INFO] Terraform timings: " + ", ".join(f"{k} {v:.1f}s" for k, v in timings.items())
+          + ("" if initialized else " (init skipped)"))
+    return {"workspace": workspace, "outputs": outputs, "resources": resources, "timings": timings, "initialized": initialized}
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repo root, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    # Keeps mirrors, registries and hash caches out of the real ~/.cache
+    path = tmp_path / "cache"
+    monkeypatch.setattr(config, "CACHE_DIR", str(path))
+    return path
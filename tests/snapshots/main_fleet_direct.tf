@@ -0,0 +1,186 @@
+
+terraform {
+  required_providers {
+    aws = {
+      source  = "hashicorp/aws"
+      version = ">= 4.0"
+    }
+  }
+  required_version = ">= 1.0"
+}
+
+provider "aws" {
+  region = "us-east-1"
+}
+
+data "aws_vpc" "default" {
+  default = true
+}
+
+data "aws_subnets" "default" {
+  filter {
+    name   = "vpc-id"
+    values = [data.aws_vpc.default.id]
+  }
+}
+
+data "aws_security_groups" "existing_sg" {
+  filter {
+    name   = "group-name"
+    values = ["auto_deployed_sg"]
+  }
+
+  filter {
+    name   = "vpc-id"
+    values = [data.aws_vpc.default.id]
+  }
+}
+
+resource "aws_security_group" "app_sg_new" {
+  count = length(data.aws_security_groups.existing_sg.ids) == 0 ? 1 : 0
+
+  name        = "auto_deployed_sg_41pjso"
+  description = "Security group for auto-deployed app"
+  vpc_id      = data.aws_vpc.default.id
+
+
+      ingress {
+        description = "Allow inbound on port 5000"
+        from_port   = 5000
+        to_port     = 5000
+        protocol    = "tcp"
+        cidr_blocks = ["0.0.0.0/0"]
+      }
+    
+      ingress {
+        description = "Allow inbound on port 9000"
+        from_port   = 9000
+        to_port     = 9000
+        protocol    = "tcp"
+        cidr_blocks = ["0.0.0.0/0"]
+      }
+    
+      ingress {
+        description = "Allow inbound on port 80"
+        from_port   = 80
+        to_port     = 80
+        protocol    = "tcp"
+        cidr_blocks = ["0.0.0.0/0"]
+      }
+    
+      ingress {
+        description = "Allow inbound SSH on port 22"
+        from_port   = 22
+        to_port     = 22
+        protocol    = "tcp"
+        cidr_blocks = ["0.0.0.0/0"]
+      }
+    
+  egress {
+    description = "Allow all outbound"
+    from_port   = 0
+    to_port     = 0
+    protocol    = "-1"
+    cidr_blocks = ["0.0.0.0/0"]
+  }
+}
+
+locals {
+  final_sg_id = length(data.aws_security_groups.existing_sg.ids) > 0 ? data.aws_security_groups.existing_sg.ids[0] : aws_security_group.app_sg_new[0].id
+}
+
+resource "tls_private_key" "ssh_key" {
+  algorithm = "RSA"
+  rsa_bits  = 2048
+}
+
+resource "aws_key_pair" "generated_key" {
+  key_name   = "auto_deployed_key_41pjso"
+  public_key = tls_private_key.ssh_key.public_key_openssh
+}
+
+resource "aws_instance" "app_server" {
+  count                  = 3
+
+  ami                    = "ami-08c40ec9ead489470"
+  instance_type          = "t3.small"
+  key_name               = aws_key_pair.generated_key.key_name
+  subnet_id              = element(data.aws_subnets.default.ids, count.index)
+  vpc_security_group_ids = [local.final_sg_id]
+
+  user_data = <<-EOT
+#!/bin/bash
+set -e
+sudo apt-get update -y
+sudo apt-get install -y python3 python3-pip git
+
+  EOT
+
+  tags = {
+    Name = "AutoDeployedVM"
+  }
+}
+
+resource "aws_lb" "app_lb" {
+  name               = "autodeploy-lb-41pjso"
+  load_balancer_type = "application"
+  security_groups    = [local.final_sg_id]
+  subnets            = data.aws_subnets.default.ids
+}
+
+resource "aws_lb_target_group" "app_tg" {
+  name                 = "autodeploy-tg-41pjso"
+  port                 = 5000
+  protocol             = "HTTP"
+  vpc_id               = data.aws_vpc.default.id
+  deregistration_delay = 30
+
+  health_check {
+    path                = "/healthz"
+    port                = "traffic-port"
+    matcher             = "200-399"
+    interval            = 10
+    timeout             = 5
+    healthy_threshold   = 2
+    unhealthy_threshold = 3
+  }
+}
+
+resource "aws_lb_target_group_attachment" "app_tg_attachment" {
+  count            = 3
+  target_group_arn = aws_lb_target_group.app_tg.arn
+  target_id        = aws_instance.app_server[count.index].id
+  port             = 5000
+}
+
+resource "aws_lb_listener" "app_http" {
+  load_balancer_arn = aws_lb.app_lb.arn
+  port              = 80
+  protocol          = "HTTP"
+
+  default_action {
+    type             = "forward"
+    target_group_arn = aws_lb_target_group.app_tg.arn
+  }
+}
+
+output "public_ip" {
+  description = "Public IP of the first instance"
+  value       = aws_instance.app_server[0].public_ip
+}
+
+output "public_ips" {
+  description = "Public IPs of every instance behind the load balancer"
+  value       = aws_instance.app_server[*].public_ip
+}
+
+output "lb_dns_name" {
+  description = "DNS name of the application load balancer"
+  value       = aws_lb.app_lb.dns_name
+}
+
+output "private_key_pem" {
+  description = "Private key in PEM format (Sensitive! Do not commit to public repos)"
+  value       = tls_private_key.ssh_key.private_key_pem
+  sensitive   = true
+}
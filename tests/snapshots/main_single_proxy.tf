@@ -0,0 +1,123 @@
+
+terraform {
+  required_providers {
+    aws = {
+      source  = "hashicorp/aws"
+      version = ">= 4.0"
+    }
+  }
+  required_version = ">= 1.0"
+}
+
+provider "aws" {
+  region = "us-east-1"
+}
+
+data "aws_vpc" "default" {
+  default = true
+}
+
+data "aws_subnets" "default" {
+  filter {
+    name   = "vpc-id"
+    values = [data.aws_vpc.default.id]
+  }
+}
+
+data "aws_security_groups" "existing_sg" {
+  filter {
+    name   = "group-name"
+    values = ["auto_deployed_sg"]
+  }
+
+  filter {
+    name   = "vpc-id"
+    values = [data.aws_vpc.default.id]
+  }
+}
+
+resource "aws_security_group" "app_sg_new" {
+  count = length(data.aws_security_groups.existing_sg.ids) == 0 ? 1 : 0
+
+  name        = "auto_deployed_sg_41pjso"
+  description = "Security group for auto-deployed app"
+  vpc_id      = data.aws_vpc.default.id
+
+
+      ingress {
+        description = "Allow inbound on port 80"
+        from_port   = 80
+        to_port     = 80
+        protocol    = "tcp"
+        cidr_blocks = ["0.0.0.0/0"]
+      }
+    
+      ingress {
+        description = "Allow inbound on port 443"
+        from_port   = 443
+        to_port     = 443
+        protocol    = "tcp"
+        cidr_blocks = ["0.0.0.0/0"]
+      }
+    
+      ingress {
+        description = "Allow inbound SSH on port 22"
+        from_port   = 22
+        to_port     = 22
+        protocol    = "tcp"
+        cidr_blocks = ["0.0.0.0/0"]
+      }
+    
+  egress {
+    description = "Allow all outbound"
+    from_port   = 0
+    to_port     = 0
+    protocol    = "-1"
+    cidr_blocks = ["0.0.0.0/0"]
+  }
+}
+
+locals {
+  final_sg_id = length(data.aws_security_groups.existing_sg.ids) > 0 ? data.aws_security_groups.existing_sg.ids[0] : aws_security_group.app_sg_new[0].id
+}
+
+resource "tls_private_key" "ssh_key" {
+  algorithm = "RSA"
+  rsa_bits  = 2048
+}
+
+resource "aws_key_pair" "generated_key" {
+  key_name   = "auto_deployed_key_41pjso"
+  public_key = tls_private_key.ssh_key.public_key_openssh
+}
+
+resource "aws_instance" "app_server" {
+  ami                    = "ami-08c40ec9ead489470"
+  instance_type          = "t3.small"
+  key_name               = aws_key_pair.generated_key.key_name
+  subnet_id              = element(data.aws_subnets.default.ids, 0)
+  vpc_security_group_ids = [local.final_sg_id]
+
+  user_data = <<-EOT
+#!/bin/bash
+set -e
+sudo apt-get update -y
+sudo apt-get install -y python3 python3-pip git nginx
+
+  EOT
+
+  tags = {
+    Name = "AutoDeployedVM"
+  }
+}
+
+output "public_ip" {
+  description = "Public IP of the instance"
+  value       = aws_instance.app_server.public_ip
+}
+
+output "private_key_pem" {
+  description = "Private key in PEM format (Sensitive! Do not commit to public repos)"
+  value       = tls_private_key.ssh_key.private_key_pem
+  sensitive   = true
+}
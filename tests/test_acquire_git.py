@@ -0,0 +1,86 @@
+import os
+import subprocess
+
+import pytest
+
+import acquire
+
+
+def git(*args, cwd=None):
+    return subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args], cwd=cwd,
+                          check=True, capture_output=True, text=True).stdout.strip()
+
+
+def commit(repo, name, content):
+    with open(os.path.join(repo, name), "w") as f:
+        f.write(content)
+    git("add", name, cwd=repo)
+    git("commit", "--quiet", "-m", f"write {name}", cwd=repo)
+    return git("rev-parse", "HEAD", cwd=repo)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+@pytest.fixture
+def origin(tmp_path):
+    repo = tmp_path / "origin"
+    repo.mkdir()
+    git("init", "--quiet", "--initial-branch=main", cwd=repo)
+    first = commit(repo, "app.py", "v1\n")
+    git("tag", "v1", cwd=repo)
+    second = commit(repo, "app.py", "v2\n")
+    return {"path": str(repo), "url": f"file://{repo}", "first": first, "second": second}
+
+
+def test_mirror_is_created_and_checked_out(cache_dir, origin, tmp_path):
+    dest = tmp_path / "checkout"
+    assert acquire.acquire_git_repo(origin["url"], str(dest), use_cache=True) == origin["second"]
+    assert read(dest / "app.py") == "v2\n"
+    mirror = acquire.mirror_path(origin["url"])
+    assert os.path.isdir(mirror)
+    assert mirror.startswith(str(cache_dir))
+
+
+def test_mirror_is_refreshed_on_the_next_checkout(cache_dir, origin, tmp_path):
+    acquire.acquire_git_repo(origin["url"], str(tmp_path / "first"), use_cache=True)
+    third = commit(origin["path"], "app.py", "v3\n")
+
+    dest = tmp_path / "second"
+    assert acquire.acquire_git_repo(origin["url"], str(dest), use_cache=True) == third
+    assert read(dest / "app.py") == "v3\n"
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+@pytest.mark.parametrize("ref,expected", [("v1", "first"), ("main", "second"), ("sha", "first")])
+def test_checkout_is_pinned_to_ref(cache_dir, origin, tmp_path, use_cache, ref, expected):
+    ref = origin["first"] if ref == "sha" else ref
+    dest = tmp_path / "checkout"
+    assert acquire.acquire_git_repo(origin["url"], str(dest), ref=ref, use_cache=use_cache) == origin[expected]
+    assert read(dest / "app.py") == ("v1\n" if expected == "first" else "v2\n")
+
+
+def test_uncached_checkout_is_shallow_and_leaves_no_mirror(cache_dir, origin, tmp_path):
+    dest = tmp_path / "checkout"
+    acquire.acquire_git_repo(origin["url"], str(dest), use_cache=False)
+    assert git("rev-list", "--count", "HEAD", cwd=dest) == "1"
+    assert not os.path.exists(acquire.mirror_path(origin["url"]))
+
+
+def test_unusable_mirror_falls_back_to_shallow_clone(cache_dir, origin, tmp_path, capsys):
+    # Something that isn't a git repository where the mirror should be
+    os.makedirs(acquire.mirror_path(origin["url"]))
+
+    dest = tmp_path / "checkout"
+    assert acquire.acquire_git_repo(origin["url"], str(dest), use_cache=True) == origin["second"]
+    assert read(dest / "app.py") == "v2\n"
+    assert git("rev-list", "--count", "HEAD", cwd=dest) == "1"
+    assert "falling back to a shallow clone" in capsys.readouterr().out
+
+
+def test_cache_can_be_disabled_from_the_environment(cache_dir, origin, tmp_path, monkeypatch):
+    monkeypatch.setenv("AUTODEPLOY_GIT_CACHE", "0")
+    acquire.acquire_git_repo(origin["url"], str(tmp_path / "checkout"))
+    assert not os.path.exists(acquire.mirror_path(origin["url"]))
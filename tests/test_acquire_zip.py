@@ -0,0 +1,75 @@
+import os
+import stat
+import zipfile
+
+import pytest
+
+import acquire
+
+
+def make_zip(path, members, compression=zipfile.ZIP_DEFLATED):
+    # members: name -> bytes, or ZipInfo -> bytes for hand-built headers
+    with zipfile.ZipFile(path, "w", compression) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return str(path)
+
+
+def extracted(dest):
+    return sorted(os.path.relpath(os.path.join(root, f), dest).replace(os.sep, "/")
+                  for root, _, files in os.walk(dest) for f in files)
+
+
+@pytest.mark.parametrize("name", ["../evil.py", "app/../../evil.py", "/etc/evil.py", "C:/evil.py", "C:\\evil.py",
+                                  "..\\evil.py"])
+def test_unsafe_member_names_are_rejected(tmp_path, name):
+    archive = make_zip(tmp_path / "bad.zip", {"app.py": b"ok", name: b"boom"})
+    dest = tmp_path / "out"
+    with pytest.raises(ValueError, match="Unsafe path"):
+        acquire.extract_zip(archive, str(dest))
+    assert not (tmp_path / "evil.py").exists()
+    assert not dest.exists() or extracted(dest) == []
+
+
+def test_symlink_members_are_skipped(tmp_path):
+    link = zipfile.ZipInfo("proj/secret")
+    link.external_attr = (stat.S_IFLNK | 0o777) << 16
+    archive = make_zip(tmp_path / "link.zip", {"proj/app.py": b"ok", link: b"/etc/passwd"})
+    dest = tmp_path / "out"
+    acquire.extract_zip(archive, str(dest))
+    assert extracted(dest) == ["app.py"]
+    assert not os.path.islink(dest / "secret")
+
+
+def test_oversized_member_is_rejected(tmp_path):
+    archive = make_zip(tmp_path / "big.zip", {"app.py": b"ok", "data.bin": os.urandom(4096)})
+    with zipfile.ZipFile(archive) as zf:
+        with pytest.raises(ValueError, match="limit is 1024"):
+            list(acquire.iter_zip_members(zf, max_file_bytes=1024))
+        with pytest.raises(ValueError, match="expands to more than"):
+            list(acquire.iter_zip_members(zf, max_total_bytes=2048))
+        with pytest.raises(ValueError, match="entries, limit is 1"):
+            list(acquire.iter_zip_members(zf, max_files=1))
+
+
+def test_high_compression_ratio_is_rejected(tmp_path):
+    # 8 MB of zeros deflates to a few KB, far past ZIP_MAX_RATIO
+    archive = make_zip(tmp_path / "bomb.zip", {"app.py": b"ok", "zeros.bin": bytes(8 * 1024 ** 2)})
+    with pytest.raises(ValueError, match="compression ratio"):
+        acquire.extract_zip(archive, str(tmp_path / "out"))
+
+
+def test_single_folder_archive_is_stripped_to_its_root(tmp_path):
+    archive = make_zip(tmp_path / "upload.zip", {"myapp/app.py": b"ok", "myapp/lib/util.py": b"ok",
+                                                 "myapp/node_modules/x/index.js": b"skip"})
+    dest = tmp_path / "out"
+    code_path, root_dir = acquire.extract_zip(archive, str(dest))
+    assert (code_path, root_dir) == (str(dest), "myapp")
+    assert extracted(dest) == ["app.py", "lib/util.py"]
+
+
+def test_archive_without_a_single_folder_is_named_after_the_zip(tmp_path):
+    archive = make_zip(tmp_path / "upload.zip", {"app.py": b"ok", "lib/util.py": b"ok"})
+    dest = tmp_path / "out"
+    assert acquire.extract_zip(archive, str(dest)) == (str(dest), "upload")
+    assert extracted(dest) == ["app.py", "lib/util.py"]
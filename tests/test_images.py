@@ -0,0 +1,56 @@
+import json
+import pathlib
+import tempfile
+
+import images
+
+
+def write(repo, name, content):
+    path = repo / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    return name
+
+
+def key(tmp_path, name, content, framework="flask"):
+    repo = pathlib.Path(tempfile.mkdtemp(dir=tmp_path))
+    return images.image_key(framework, str(repo), write(repo, name, content))
+
+
+def test_requirements_key_ignores_order_whitespace_case_and_comments(tmp_path):
+    base = key(tmp_path, "requirements.txt", "flask==3.0.0\nrequests==2.31.0\n")
+    assert key(tmp_path, "requirements.txt", "# deps\n\n  requests==2.31.0  \nFlask==3.0.0 # web\n\n") == base
+    assert key(tmp_path, "requirements.txt", "flask==3.0.1\nrequests==2.31.0\n") != base
+    assert key(tmp_path, "requirements.txt", "flask==3.0.0\nrequests==2.31.0\n", framework="django") != base
+
+
+def test_package_json_key_only_depends_on_dependencies(tmp_path):
+    deps = {"dependencies": {"express": "^4.18.0", "cors": "^2.8.5"}}
+    base = key(tmp_path, "package.json", json.dumps({"name": "a", **deps}), framework="nodejs")
+    reordered = {"version": "2.0.0", "dependencies": {"cors": "^2.8.5", "express": "^4.18.0"}, "name": "b"}
+    assert key(tmp_path, "package.json", json.dumps(reordered, indent=4), framework="nodejs") == base
+    bumped = {"dependencies": {"express": "^4.19.0", "cors": "^2.8.5"}}
+    assert key(tmp_path, "package.json", json.dumps(bumped), framework="nodejs") != base
+
+
+def test_key_without_a_manifest_is_per_framework(tmp_path):
+    assert images.image_key("flask", str(tmp_path)) == images.image_key("flask", str(tmp_path), "missing.txt")
+    assert images.image_key("flask", str(tmp_path)) != images.image_key("nodejs", str(tmp_path))
+
+
+def test_select_image_hit_and_miss(cache_dir, tmp_path):
+    manifest = write(tmp_path, "requirements.txt", "flask\n")
+    assert images.select_image("flask", str(tmp_path), manifest) is None
+
+    images.register_image(images.image_key("flask", str(tmp_path), manifest), "ami-0123456789abcdef0")
+    assert images.select_image("flask", str(tmp_path), manifest) == "ami-0123456789abcdef0"
+    # Built for another region, or for different dependencies: not usable
+    assert images.select_image("flask", str(tmp_path), manifest, region="eu-west-1") is None
+    write(tmp_path, "requirements.txt", "flask\ngunicorn\n")
+    assert images.select_image("flask", str(tmp_path), manifest) is None
+
+
+def test_select_image_tolerates_a_corrupt_registry(cache_dir, tmp_path):
+    (cache_dir / "images").mkdir(parents=True)
+    (cache_dir / "images" / "registry.json").write_text("{not json")
+    assert images.select_image("flask", str(tmp_path)) is None
@@ -0,0 +1,119 @@
+import pytest
+
+import chatbot
+import llm_cache
+from standins import FakeOpenAIClient
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    cache = llm_cache.LLMCache(path=str(tmp_path / "responses.sqlite3"), ttl=60)
+    yield cache
+    cache.close()
+
+
+def fill(cache, clock, keys, value="x"):
+    for key in keys:
+        cache.put(key, value)
+        clock.advance(1)
+
+
+def test_complete_hits_the_cache_on_a_repeated_prompt(cache_dir, monkeypatch):
+    monkeypatch.setenv("AUTODEPLOY_LLM_CACHE", "1")
+    monkeypatch.setattr(llm_cache, "_default_cache", None)
+    client = FakeOpenAIClient(responder=lambda system, user: {"application_type": "flask"})
+    monkeypatch.setattr(chatbot, "client", client)
+
+    first = chatbot._complete("system", "deploy my flask app")
+    second = chatbot._complete("system", "deploy my flask app")
+    chatbot._complete("system", "deploy my django app")
+
+    assert first == second == '{"application_type": "flask"}'
+    assert client.calls == 2
+    stats = llm_cache.get_cache().stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+    llm_cache.get_cache().close()
+
+
+def test_entries_expire_after_the_ttl(cache, clock):
+    cache.put("k", "v")
+    clock.advance(59)
+    assert cache.get("k") == "v"
+    clock.advance(2)
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_max_entries_evicts_the_least_recently_used(cache, clock):
+    cache.max_entries = 3
+    fill(cache, clock, ["a", "b", "c"])
+    assert cache.get("a") == "x"
+    clock.advance(1)
+    fill(cache, clock, ["d"])
+
+    assert cache.get("b") is None
+    assert [cache.get(k) for k in ("a", "c", "d")] == ["x", "x", "x"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_max_bytes_evicts_until_the_total_fits(cache, clock):
+    cache.max_bytes = 25
+    fill(cache, clock, ["a", "b", "c"], value="0123456789")
+
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (2, 20, 1)
+    assert cache.get("a") is None
+
+
+def test_counters_persist_across_instances(tmp_path, clock):
+    path = str(tmp_path / "responses.sqlite3")
+    first = llm_cache.LLMCache(path=path)
+    first.put("k", "v")
+    first.get("k")
+    first.get("missing")
+    first.close()
+
+    second = llm_cache.LLMCache(path=path)
+    second.get("k")
+    stats = second.stats()
+    second.close()
+    assert (stats["hits"], stats["misses"]) == (1, 0)
+    assert (stats["total_hits"], stats["total_misses"]) == (2, 1)
+
+
+def test_two_instances_share_one_file(tmp_path, clock):
+    path = str(tmp_path / "responses.sqlite3")
+    writer = llm_cache.LLMCache(path=path, max_entries=2)
+    reader = llm_cache.LLMCache(path=path, max_entries=2)
+    try:
+        writer.put("a", "1")
+        assert reader.get("a") == "1"
+        clock.advance(1)
+        reader.put("b", "2")
+        clock.advance(1)
+        writer.put("c", "3")
+        # Eviction by one instance is seen by the other
+        assert reader.get("a") is None
+        assert writer.get("b") == "2"
+        assert reader.stats()["total_hits"] == writer.stats()["total_hits"] == 2
+    finally:
+        writer.close()
+        reader.close()
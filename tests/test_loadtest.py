@@ -0,0 +1,18 @@
+import pytest
+
+import loadtest
+
+
+@pytest.mark.parametrize("n, q, rank", [
+    (100, 50, 50), (100, 95, 95), (100, 99, 99),
+    (10, 50, 5), (10, 95, 10), (10, 99, 10),
+    (200, 95, 190), (200, 99, 198),
+    (100, 7, 7), (1, 99, 1),
+])
+def test_percentile_is_nearest_rank(n, q, rank):
+    values = list(range(1, n + 1))
+    assert loadtest._percentile(values, q) == rank
+
+
+def test_percentile_of_nothing_is_zero():
+    assert loadtest._percentile([], 95) == 0.0
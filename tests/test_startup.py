@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Only the LLM, SSH and load-test paths may load these (see benchmark.py --suite startup)
+HEAVY_MODULES = ["openai", "httpx", "paramiko", "cryptography", "asyncio"]
+
+APP = """from flask import Flask
+
+app = Flask(__name__)
+
+if __name__ == "__main__":
+    app.run(host="127.0.0.1", port=5000)
+"""
+
+
+def loaded_modules(code: str, tmp_path) -> list[str]:
+    # Runs `code` in a fresh interpreter and returns the heavy modules it ended up importing
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    env.update(AUTODEPLOY_CACHE_DIR=str(tmp_path / "cache"), AUTODEPLOY_TRACE_DIR=str(tmp_path / "traces"))
+    probe = f"import sys\n{code}\nimport json\nprint(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    result = subprocess.run([sys.executable, "-c", probe], env=env, cwd=REPO_ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("module", ["app", "deploy"])
+def test_import_is_light(tmp_path, module):
+    assert loaded_modules(f"import {module}", tmp_path) == []
+
+
+def test_dry_run_is_light(tmp_path):
+    archive = tmp_path / "demo.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("demo/app.py", APP)
+        zf.writestr("demo/requirements.txt", "flask\n")
+    out = tmp_path / "out"
+    code = ("import app, contextlib, io\nwith contextlib.redirect_stdout(io.StringIO()):\n"
+            f"    assert app.main(['--dry-run', '--zip', {str(archive)!r}, '--out', {str(out)!r}]) == 0")
+    assert loaded_modules(code, tmp_path) == []
+    assert (out / "main.tf").is_file()
+    analysis = json.loads((out / "analysis.json").read_text())
+    assert analysis["analysis"]["framework"] == "flask"
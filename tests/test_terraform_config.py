@@ -0,0 +1,59 @@
+import os
+import random
+import re
+
+import pytest
+
+from deploy import generate_terraform_config
+
+# Regenerate after an intended change with: UPDATE_SNAPSHOTS=1 python -m pytest tests/test_terraform_config.py
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), "snapshots")
+
+ANALYSIS = {"framework": "flask", "ports": [5000, 9000]}
+
+
+def assert_snapshot(name: str, text: str):
+    path = os.path.join(SNAPSHOT_DIR, name)
+    if os.environ.get("UPDATE_SNAPSHOTS") == "1":
+        with open(path, "w") as f:
+            f.write(text)
+    assert os.path.exists(path), f"{name} is missing; rerun with UPDATE_SNAPSHOTS=1 to generate it"
+    with open(path) as f:
+        assert text == f.read(), f"{name} changed; rerun with UPDATE_SNAPSHOTS=1 if that's intended"
+
+
+def generate(**kwargs) -> str:
+    # The resource name suffix is random; seed it so the output is stable
+    random.seed(0)
+    return generate_terraform_config("aws", ANALYSIS, instance_type="t3.small", **kwargs)
+
+
+@pytest.mark.parametrize("proxy", [False, True], ids=["direct", "proxy"])
+@pytest.mark.parametrize("instance_count", [1, 3], ids=["single", "fleet"])
+def test_config_snapshot(instance_count, proxy):
+    config = generate(instance_count=instance_count, proxy=proxy, health_check_path="/healthz")
+    assert_snapshot(f"main_{'fleet' if instance_count > 1 else 'single'}_{'proxy' if proxy else 'direct'}.tf", config)
+
+
+def test_single_instance_has_no_load_balancer():
+    config = generate(instance_count=1)
+    assert 'resource "aws_lb"' not in config
+    assert "lb_dns_name" not in config
+    assert not re.search(r"^\s*count\s*=\s*\d", config, re.MULTILINE)
+
+
+def test_fleet_puts_every_instance_behind_the_load_balancer():
+    config = generate(instance_count=3, health_check_path="/healthz")
+    assert 'resource "aws_lb" ' in config
+    assert 'resource "aws_lb_target_group" ' in config
+    assert len(re.findall(r"^\s*count\s*=\s*3$", config, re.MULTILINE)) == 2
+    assert "/healthz" in config
+
+
+def test_proxy_only_opens_http_https_and_ssh():
+    config = generate(proxy=True)
+    assert sorted(map(int, re.findall(r"from_port\s*=\s*(\d+)", config))) == [0, 22, 80, 443]
+
+
+def test_prebaked_image_replaces_the_base_ami():
+    assert "ami-0123456789abcdef0" in generate(ami="ami-0123456789abcdef0")
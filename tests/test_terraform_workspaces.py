@@ -0,0 +1,94 @@
+import json
+import os
+import time
+
+import pytest
+
+import standins
+import terraform_runner
+
+
+def make_workspace(name, resources=None, age_days=0):
+    path = terraform_runner.workspace_path(name)
+    with open(os.path.join(path, "main.tf"), "w") as f:
+        f.write("")
+    if resources is not None:
+        with open(os.path.join(path, terraform_runner.STATE_FILE), "w") as f:
+            json.dump({"resources": [{"type": "aws_instance"}] * resources}, f)
+    stamp = time.time() - age_days * 86400
+    os.utime(os.path.join(path, "main.tf"), (stamp, stamp))
+    return path
+
+
+def test_deployment_workspace_is_stable_per_source(cache_dir):
+    name = terraform_runner.deployment_workspace("git:https://example.com/app.git", "app")
+    assert name == terraform_runner.deployment_workspace("git:https://example.com/app.git", "app")
+    assert name.startswith("app-")
+    assert name != terraform_runner.deployment_workspace("git:https://example.com/other/app.git", "app")
+    assert os.sep not in terraform_runner.deployment_workspace("zip:../weird dir", "../weird dir")
+
+
+def test_resource_suffix_ignores_where_the_workspace_lives(cache_dir):
+    suffix = terraform_runner.resource_suffix("app-1234abcd")
+    assert suffix == terraform_runner.resource_suffix(terraform_runner.workspace_path("app-1234abcd"))
+    assert len(suffix) == 6
+
+
+def test_prune_removes_only_old_workspaces_without_resources(cache_dir):
+    stale = make_workspace("stale", age_days=30)
+    destroyed = make_workspace("destroyed", resources=0, age_days=30)
+    live = make_workspace("live", resources=2, age_days=30)
+    recent = make_workspace("recent", age_days=1)
+    current = make_workspace("current", age_days=30)
+
+    removed = terraform_runner.prune_workspaces(keep=current)
+
+    assert sorted(removed) == sorted([stale, destroyed])
+    assert all(os.path.isdir(path) for path in (live, recent, current))
+
+
+CONFIG = """terraform {
+  required_providers {
+    aws = { source = "hashicorp/aws" }
+  }
+}
+
+resource "aws_security_group" "app" {}
+
+resource "aws_instance" "app" {}
+"""
+
+
+@pytest.fixture
+def fake_terraform(tmp_path, cache_dir, monkeypatch):
+    log = tmp_path / "terraform.log"
+    outputs = {"public_ip": "203.0.113.7", "private_key_pem": "KEY"}
+    monkeypatch.setattr(terraform_runner, "TERRAFORM_BIN", standins.write_fake_terraform(str(tmp_path), outputs))
+    monkeypatch.setenv("FAKE_TERRAFORM_LOG", str(log))
+    return log
+
+
+def test_second_apply_on_a_workspace_skips_init(fake_terraform):
+    first = terraform_runner.apply_config(CONFIG, workspace="app-1234abcd")
+    second = terraform_runner.apply_config(CONFIG, workspace="app-1234abcd")
+
+    assert first["initialized"] and not second["initialized"]
+    assert first["workspace"] == second["workspace"] == terraform_runner.workspace_path("app-1234abcd")
+    commands = [line.split()[0] for line in fake_terraform.read_text().splitlines()]
+    assert commands == ["init", "apply", "output", "apply", "output"]
+
+
+def test_provider_changes_rerun_init(fake_terraform):
+    terraform_runner.apply_config(CONFIG, workspace="app-1234abcd")
+    changed = CONFIG.replace('source = "hashicorp/aws"', 'source = "hashicorp/aws", version = "~> 5.0"')
+    assert terraform_runner.apply_config(changed, workspace="app-1234abcd")["initialized"]
+
+
+def test_outputs_and_apply_events_are_parsed(fake_terraform, capsys):
+    result = terraform_runner.apply_config(CONFIG, workspace="app-1234abcd")
+
+    assert result["outputs"] == {"public_ip": "203.0.113.7", "private_key_pem": "KEY"}
+    assert set(result["resources"]) == {"aws_security_group.app", "aws_instance.app"}
+    assert all(r["action"] == "create" and "seconds" in r and "start" not in r for r in result["resources"].values())
+    assert "Apply complete! Resources: 2 added" in capsys.readouterr().out
+    assert terraform_runner.workspace_resources(result["workspace"]) == 2
@@ -0,0 +1,47 @@
+import pytest
+
+import transfer
+
+
+class FakeSFTP:
+    def __init__(self, uploaded):
+        self.uploaded = uploaded
+
+    def putfo(self, fl, remote_file, file_size=None, confirm=True):
+        self.uploaded[remote_file] = fl.read()
+
+    def close(self):
+        pass
+
+
+class FakeTransport:
+    def __init__(self, fail_opens=0):
+        self.fail_opens = fail_opens
+        self.uploaded = {}
+
+    def open_sftp_client(self):
+        if self.fail_opens:
+            self.fail_opens -= 1
+            raise EOFError("channel refused")
+        return FakeSFTP(self.uploaded)
+
+
+def plan(tmp_path, count=3):
+    files = []
+    for i in range(count):
+        path = tmp_path / f"f{i}.txt"
+        path.write_text(str(i))
+        files.append((str(path), f"/srv/app/f{i}.txt", path.stat().st_size))
+    return files
+
+
+def test_uploads_every_planned_file(tmp_path):
+    transport = FakeTransport()
+    stats = transfer.upload_files(transport, plan(tmp_path), workers=2)
+    assert stats["files"] == 3
+    assert transport.uploaded == {f"/srv/app/f{i}.txt": str(i).encode() for i in range(3)}
+
+
+def test_channel_that_fails_to_open_is_an_error(tmp_path):
+    with pytest.raises(Exception, match="channel refused"):
+        transfer.upload_files(FakeTransport(fail_opens=1), plan(tmp_path), workers=1)
@@ -0,0 +1,29 @@
+import walker
+from ignore import IgnoreRules
+
+
+def make_files(root, count):
+    for i in range(count):
+        (root / f"f{i:02d}.txt").write_text("x")
+
+
+def test_exactly_max_entries_is_not_truncated(tmp_path):
+    make_files(tmp_path, 5)
+    index = walker.build_index(str(tmp_path), IgnoreRules(), max_entries=5)
+    assert len(index.files) == 5
+    assert not index.truncated
+
+
+def test_entries_past_the_limit_truncate(tmp_path):
+    make_files(tmp_path, 6)
+    index = walker.build_index(str(tmp_path), IgnoreRules(), max_entries=5)
+    assert index.files == [f"f{i:02d}.txt" for i in range(5)]
+    assert index.truncated
+    assert "listing truncated after 5 entries" in index.tree_text()
+
+
+def test_no_limit_reads_everything(tmp_path):
+    make_files(tmp_path, 6)
+    index = walker.build_index(str(tmp_path), IgnoreRules(), max_entries=None)
+    assert len(index.files) == 6
+    assert not index.truncated
@@ -0,0 +1,233 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from config import cache_path
+
+# Span-based timing for a deploy. `trace()` opens a root (or nests if one is
+# already open) and on exit writes the spans out and prints a summary;
+# `span()` outside any trace costs next to nothing, so library code can
+# always use it.
+
+TRACE_DIR_ENV = "AUTODEPLOY_TRACE_DIR"
+SPANS_FILE = "spans.jsonl"
+
+_current = contextvars.ContextVar("autodeploy_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent: "Span" = None, attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.counters = {}
+        self.status = "ok"
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._perf_start = time.perf_counter()
+        self.seconds = None
+        self.children = []
+        self._lock = threading.Lock()
+        if parent is not None:
+            with parent._lock:
+                parent.children.append(self)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        return self
+
+    def add_stats(self, stats: dict, keys=("files", "bytes", "wire_bytes", "added", "changed", "deleted")):
+        # Folds a transfer/sync stats dict into counters
+        for key in keys:
+            if isinstance((stats or {}).get(key), (int, float)):
+                self.count(key, stats[key])
+        return self
+
+    def finish(self, error: BaseException = None):
+        self.seconds = time.perf_counter() - self._perf_start
+        self.end_ns = self.start_ns + int(self.seconds * 1e9)
+        if error is not None:
+            self.status = "error"
+            self.error = f"{type(error).__name__}: {error}"
+
+    def walk(self, depth: int = 0):
+        yield self, depth
+        for child in sorted(self.children, key=lambda c: c.start_ns):
+            yield from child.walk(depth + 1)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": self.start_ns / 1e9,
+            "seconds": round(self.seconds, 6) if self.seconds is not None else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+            "counters": self.counters,
+        }
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        return self
+
+    def count(self, name: str, value: float = 1):
+        return self
+
+    def add_stats(self, stats: dict, keys=()):
+        return self
+
+
+_NOOP = _NoopSpan()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    parent = _current.get()
+    if parent is None:
+        yield _NOOP
+        return
+    s = Span(name, parent.trace_id, parent, attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.finish(e)
+        raise
+    else:
+        s.finish()
+    finally:
+        _current.reset(token)
+
+
+def record_span(name: str, seconds: float, error: BaseException = None, **attributes):
+    # A finished child of the current span for work timed elsewhere (e.g. a
+    # step of a remote script), ending now
+    parent = _current.get()
+    if parent is None:
+        return _NOOP
+    s = Span(name, parent.trace_id, parent, attributes)
+    s.start_ns = time.time_ns() - int(seconds * 1e9)
+    s.finish(error)
+    s.seconds = seconds
+    s.end_ns = s.start_ns + int(seconds * 1e9)
+    return s
+
+
+def current_span():
+    return _current.get() or _NOOP
+
+
+@contextmanager
+def trace(name: str, out_dir: str = None, summary: bool = True, **attributes):
+    # Nested inside another trace this is just a span
+    if _current.get() is not None:
+        with span(name, **attributes) as s:
+            yield s
+        return
+    root = Span(name, uuid.uuid4().hex, None, attributes)
+    token = _current.set(root)
+    error = None
+    try:
+        yield root
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        root.finish(error)
+        _current.reset(token)
+        try:
+            paths = export(root, out_dir)
+            if summary:
+                print(summary_table(root))
+                print(f"[INFO] Trace {root.trace_id} written to {paths['otlp']}")
+        except OSError as e:
+            print(f"[WARN] Could not write trace: {e}")
+
+
+def trace_dir(out_dir: str = None) -> str:
+    out_dir = out_dir or os.environ.get(TRACE_DIR_ENV)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+        return out_dir
+    return cache_path("traces")
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(root: Span, service_name: str = "autodeploy") -> dict:
+    # OTLP/JSON (the format of the collector's file exporter and /v1/traces)
+    spans = []
+    for s, _ in root.walk():
+        attributes = {**s.attributes, **{f"count.{k}": v for k, v in s.counters.items()}}
+        spans.append({
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            "parentSpanId": s.parent.span_id if s.parent else "",
+            "name": s.name,
+            "kind": 1,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns or s.start_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()],
+            "status": {"code": 2, "message": s.error} if s.status == "error" else {"code": 1},
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+        "scopeSpans": [{"scope": {"name": "autodeploy.tracing"}, "spans": spans}],
+    }]}
+
+
+def export(root: Span, out_dir: str = None) -> dict:
+    out_dir = trace_dir(out_dir)
+    # One growing JSONL across runs for regression tracking, one OTLP file per run
+    jsonl_path = os.path.join(out_dir, SPANS_FILE)
+    with open(jsonl_path, "a") as f:
+        for s, _ in root.walk():
+            f.write(json.dumps(s.to_dict()) + "\n")
+    otlp_path = os.path.join(out_dir, f"{root.trace_id}.otlp.json")
+    with open(otlp_path, "w") as f:
+        json.dump(to_otlp(root), f)
+    return {"jsonl": jsonl_path, "otlp": otlp_path}
+
+
+def _format_counter(name: str, value: float) -> str:
+    if "bytes" in name:
+        return f"{name}={value / 1e6:.2f}MB"
+    return f"{name}={value:g}"
+
+
+def summary_table(root: Span) -> str:
+    total = root.seconds or 0.0
+    rows = []
+    for s, depth in root.walk():
+        share = (s.seconds / total * 100) if total and s.seconds is not None else 0.0
+        counters = " ".join(_format_counter(k, v) for k, v in s.counters.items())
+        flag = " !" if s.status == "error" else ""
+        rows.append((f"{'  ' * depth}{s.name}{flag}", f"{s.seconds or 0.0:8.2f}s", f"{share:5.1f}%", counters))
+    width = max(len(r[0]) for r in rows)
+    lines = [f"{'phase'.ljust(width)}  {'wall':>9}  {'share':>6}  counters"]
+    lines += [f"{name.ljust(width)}  {wall:>9}  {share:>6}  {counters}".rstrip() for name, wall, share, counters in rows]
+    return "\n".join(lines)
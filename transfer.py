@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+import os
+import shlex
+import tarfile
+import threading
+import time
+import zipfile
+from queue import Empty, Full, Queue
+from typing import TYPE_CHECKING
+
+from acquire import iter_zip_members, open_zip_member
+from ignore import IgnoreRules
+from walker import walk_repo
+
+if TYPE_CHECKING:
+    import paramiko
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# OpenSSH allows 10 sessions per connection by default (MaxSessions), so keep
+# the SFTP channel pool below that to leave room for exec channels.
+DEFAULT_UPLOAD_WORKERS = 8
+
+
+def collect_upload_plan(repo_path: str, remote_root: str, rules: IgnoreRules = None) -> dict:
+    # Same walk and ignore rules as the tar and delta modes, so every mode ships the same tree
+    remote_root = remote_root.rstrip("/")
+    dirs = [remote_root]
+    files = []
+    for rel_path, abs_path, is_dir in walk_repo(repo_path, rules):
+        if is_dir:
+            dirs.append(f"{remote_root}/{rel_path}")
+        elif os.path.isfile(abs_path):
+            files.append((abs_path, f"{remote_root}/{rel_path}", os.path.getsize(abs_path)))
+
+    # Biggest files first so a large asset doesn't end up as the tail of the run
+    files.sort(key=lambda f: f[2], reverse=True)
+    return {"dirs": dirs, "files": files}
+
+
+def make_remote_dirs(ssh: paramiko.SSHClient, remote_dirs: list[str]):
+    if not remote_dirs:
+        return
+    # One round trip for the whole directory set; paths go over stdin so the
+    # command line can't hit ARG_MAX on large trees.
+    stdin, stdout, stderr = ssh.exec_command("xargs -0 mkdir -p")
+    stdin.write("\0".join(remote_dirs))
+    stdin.channel.shutdown_write()
+    if stdout.channel.recv_exit_status() != 0:
+        raise Exception(f"Failed to create remote directories: {stderr.read().decode().strip()}")
+
+
+def _upload_worker(transport: paramiko.Transport, queue: Queue, results: list, errors: list, lock: threading.Lock):
+    sftp = None
+    try:
+        sftp = transport.open_sftp_client()
+        while True:
+            try:
+                local_file, remote_file, size = queue.get_nowait()
+            except Empty:
+                return
+            start = time.perf_counter()
+            try:
+                # putfo opens the remote file with pipelined writes; skip the
+                # trailing stat since we already know the size we sent.
+                with open(local_file, "rb") as fl:
+                    sftp.putfo(fl, remote_file, file_size=size, confirm=False)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    results.append({"path": remote_file, "bytes": size, "seconds": elapsed})
+            except Exception as e:
+                with lock:
+                    errors.append((local_file, str(e)))
+    except Exception as e:
+        # A channel that can't open uploads nothing; the other workers may still drain the queue
+        with lock:
+            errors.append(("SFTP channel", str(e)))
+    finally:
+        if sftp is not None:
+            sftp.close()
+
+
+def upload_files(transport: paramiko.Transport, files: list[tuple[str, str, int]], workers: int = DEFAULT_UPLOAD_WORKERS) -> dict:
+    queue = Queue()
+    for item in files:
+        queue.put(item)
+
+    results = []
+    errors = []
+    lock = threading.Lock()
+    workers = max(1, min(workers, len(files)))
+
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=_upload_worker, args=(transport, queue, results, errors, lock), daemon=True)
+        for _ in range(workers)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    if errors:
+        local_file, message = errors[0]
+        raise Exception(f"{len(errors)} upload error(s), first: {local_file}: {message}")
+    uploaded = {r["path"] for r in results}
+    missing = [remote_file for _, remote_file, _ in files if remote_file not in uploaded]
+    if missing:
+        raise Exception(f"{len(missing)} file(s) were never uploaded, first: {missing[0]}")
+
+    return summarize_transfer(results, elapsed, workers)
+
+
+def summarize_transfer(per_file: list[dict], elapsed: float, workers: int) -> dict:
+    total_bytes = sum(f["bytes"] for f in per_file)
+    for f in per_file:
+        f["mb_per_sec"] = (f["bytes"] / f["seconds"] / 1e6) if f["seconds"] > 0 else 0.0
+    return {
+        "files": len(per_file),
+        "bytes": total_bytes,
+        "seconds": elapsed,
+        "workers": workers,
+        "files_per_sec": len(per_file) / elapsed if elapsed > 0 else 0.0,
+        "mb_per_sec": total_bytes / elapsed / 1e6 if elapsed > 0 else 0.0,
+        "per_file": per_file,
+    }
+
+
+def print_transfer_summary(stats: dict):
+    print(
+        f"[INFO] Uploaded {stats['files']} files ({stats['bytes'] / 1e6:.2f} MB) in {stats['seconds']:.2f}s "
+        f"using {stats['workers']} channel(s): {stats['files_per_sec']:.1f} files/s, {stats['mb_per_sec']:.2f} MB/s"
+    )
+    slowest = sorted(stats["per_file"], key=lambda f: f["seconds"], reverse=True)[:3]
+    for f in slowest:
+        print(f"[INFO]   slowest: {f['path']} {f['bytes']} bytes in {f['seconds'] * 1000:.1f}ms ({f['mb_per_sec']:.2f} MB/s)")
+
+
+def upload_tree(ssh: paramiko.SSHClient, repo_path: str, remote_root: str, workers: int = DEFAULT_UPLOAD_WORKERS,
+                rules: IgnoreRules = None) -> dict:
+    plan = collect_upload_plan(repo_path, remote_root, rules)
+    print(f"[INFO] Uploading {len(plan['files'])} files into {len(plan['dirs'])} directories under {remote_root}...")
+    make_remote_dirs(ssh, plan["dirs"])
+    stats = upload_files(ssh.get_transport(), plan["files"], workers=workers)
+    print_transfer_summary(stats)
+    return stats
+
+
+TAR_COMPRESSIONS = ["none", "gzip", "zstd"]
+TAR_CHUNK_QUEUE = 64
+# How often a builder blocked on a full queue checks whether the consumer went away
+TAR_PUT_POLL = 0.1
+
+
+class _StreamCancelled(Exception):
+    pass
+
+
+def _put(queue: Queue, item, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=TAR_PUT_POLL)
+            return
+        except Full:
+            continue
+    raise _StreamCancelled()
+
+
+class _QueueWriter:
+    def __init__(self, queue: Queue, stop: threading.Event):
+        self.queue = queue
+        self.stop = stop
+
+    def write(self, data) -> int:
+        if data:
+            _put(self.queue, bytes(data), self.stop)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def _add_tree(repo_path: str, rules: IgnoreRules):
+    def add(tar: tarfile.TarFile, counters: dict):
+        for rel_path, abs_path, is_dir in walk_repo(repo_path, rules):
+            if not is_dir and not os.path.isfile(abs_path):
+                continue
+            tar.add(abs_path, arcname=rel_path, recursive=False)
+            if not is_dir:
+                counters["files"] += 1
+                counters["bytes"] += os.path.getsize(abs_path)
+    return add
+
+
+def _add_zip(zip_file_path: str, rules: IgnoreRules):
+    # Re-packs zip members straight into the tar, no extracted copy on disk
+    def add(tar: tarfile.TarFile, counters: dict):
+        with zipfile.ZipFile(zip_file_path, "r") as zip_ref:
+            for rel_path, info in iter_zip_members(zip_ref, rules):
+                tarinfo = tarfile.TarInfo(rel_path)
+                tarinfo.size = info.file_size
+                tarinfo.mode = (info.external_attr >> 16) & 0o777 or 0o644
+                tarinfo.mtime = time.mktime(info.date_time + (0, 0, -1))
+                with open_zip_member(zip_ref, info) as src:
+                    tar.addfile(tarinfo, src)
+                counters["files"] += 1
+                counters["bytes"] += info.file_size
+    return add
+
+
+def _build_tar(add_entries, queue: Queue, compression: str, counters: dict, stop: threading.Event):
+    # Unwinds (closing whatever it had open) as soon as `stop` is set
+    try:
+        sink = _QueueWriter(queue, stop)
+        zwriter = None
+        if compression == "zstd":
+            zwriter = zstandard.ZstdCompressor(level=3).stream_writer(sink, closefd=False)
+            sink = zwriter
+        mode = "w|gz" if compression == "gzip" else "w|"
+        with tarfile.open(fileobj=sink, mode=mode, format=tarfile.PAX_FORMAT) as tar:
+            add_entries(tar, counters)
+        if zwriter:
+            zwriter.flush(zstandard.FLUSH_FRAME)
+        _put(queue, None, stop)
+    except _StreamCancelled:
+        pass
+    except Exception as e:
+        try:
+            _put(queue, e, stop)
+        except _StreamCancelled:
+            pass
+
+
+def iter_tar_stream(repo_path: str = None, compression: str = "gzip", rules: IgnoreRules = None, counters: dict = None,
+                    zip_file_path: str = None):
+    # The archive is produced on a background thread into a bounded queue, so
+    # nothing touches disk and memory stays flat however big the repo is.
+    # With zip_file_path the source is the archive itself instead of a tree.
+    if compression not in TAR_COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{compression}', expected one of {TAR_COMPRESSIONS}")
+    if compression == "zstd" and zstandard is None:
+        raise ValueError("zstd compression requires the 'zstandard' package")
+    if counters is None:
+        counters = {}
+    counters.update({"files": 0, "bytes": 0})
+    add_entries = _add_zip(zip_file_path, rules) if zip_file_path else _add_tree(repo_path, rules)
+
+    queue = Queue(maxsize=TAR_CHUNK_QUEUE)
+    stop = threading.Event()
+    builder = threading.Thread(target=_build_tar, args=(add_entries, queue, compression, counters, stop), daemon=True)
+    builder.start()
+    try:
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Also runs when the consumer stops early (a failed send, or the generator
+        # being closed), so the builder doesn't sit on a full queue forever
+        stop.set()
+        builder.join()
+
+
+def resolve_compression(ssh: paramiko.SSHClient, compression: str = "auto") -> str:
+    if compression != "auto":
+        return compression
+    if zstandard is not None:
+        _, stdout, _ = ssh.exec_command("command -v zstd")
+        if stdout.channel.recv_exit_status() == 0:
+            return "zstd"
+    return "gzip"
+
+
+def remote_untar_command(remote_root: str, compression: str) -> str:
+    target = shlex.quote(remote_root)
+    if compression == "gzip":
+        extract = f"tar -xzf - -C {target}"
+    elif compression == "zstd":
+        extract = f"zstd -dc | tar -xf - -C {target}"
+    else:
+        extract = f"tar -xf - -C {target}"
+    return f"mkdir -p {target} && {extract}"
+
+
+def stream_tarball(ssh: paramiko.SSHClient, repo_path: str, remote_root: str, compression: str = "auto",
+                   rules: IgnoreRules = None, zip_file_path: str = None) -> dict:
+    compression = resolve_compression(ssh, compression)
+    print(f"[INFO] Streaming {zip_file_path or repo_path} to {remote_root} as a single tar ({compression})...")
+
+    channel = ssh.get_transport().open_session()
+    channel.exec_command(remote_untar_command(remote_root, compression))
+
+    counters = {}
+    sent = 0
+    start = time.perf_counter()
+    try:
+        for chunk in iter_tar_stream(repo_path, compression, rules, counters, zip_file_path=zip_file_path):
+            channel.sendall(chunk)
+            sent += len(chunk)
+        channel.shutdown_write()
+        exit_status = channel.recv_exit_status()
+    except Exception:
+        channel.close()
+        raise
+    elapsed = time.perf_counter() - start
+
+    if exit_status != 0:
+        err = b""
+        while channel.recv_stderr_ready():
+            err += channel.recv_stderr(65536)
+        channel.close()
+        raise Exception(f"Remote tar extraction failed ({exit_status}): {err.decode(errors='ignore').strip()}")
+    channel.close()
+
+    stats = {
+        "files": counters["files"],
+        "bytes": counters["bytes"],
+        "wire_bytes": sent,
+        "compression": compression,
+        "seconds": elapsed,
+        "files_per_sec": counters["files"] / elapsed if elapsed > 0 else 0.0,
+        "mb_per_sec": counters["bytes"] / elapsed / 1e6 if elapsed > 0 else 0.0,
+    }
+    print(
+        f"[INFO] Streamed {stats['files']} files ({stats['bytes'] / 1e6:.2f} MB, {sent / 1e6:.2f} MB on the wire) "
+        f"in {elapsed:.2f}s: {stats['files_per_sec']:.1f} files/s, {stats['mb_per_sec']:.2f} MB/s"
+    )
+    return stats
@@ -0,0 +1,135 @@
+import os
+
+from ignore import IgnoreRules, load_ignore_rules
+
+DEFAULT_MAX_ENTRIES = 50000
+TREE_MAX_DEPTH = 6
+TREE_MAX_CHILDREN = 40
+
+
+def scan(repo_path: str, rules: IgnoreRules = None, max_depth: int = None, max_entries: int = None):
+    # Iterative os.scandir walk yielding (rel_path, DirEntry, depth), parents
+    # before children and siblings sorted, so output order is stable.
+    # Nested .gitignore files apply to their own subtree.
+    if rules is None:
+        rules = load_ignore_rules(repo_path)
+    emitted = 0
+    stack = [("", repo_path, 0)]
+    while stack:
+        rel_dir, abs_dir, depth = stack.pop()
+        try:
+            with os.scandir(abs_dir) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+
+        if rel_dir and any(e.name == ".gitignore" for e in entries):
+            rules.add_file(os.path.join(abs_dir, ".gitignore"), base=rel_dir)
+
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if rules.is_ignored(rel_path, is_dir=is_dir):
+                continue
+            if max_entries is not None and emitted >= max_entries:
+                return
+            emitted += 1
+            yield rel_path, entry, depth
+            if is_dir and (max_depth is None or depth + 1 < max_depth):
+                subdirs.append((rel_path, entry.path, depth + 1))
+        stack.extend(reversed(subdirs))
+
+
+def walk_repo(repo_path: str, rules: IgnoreRules = None):
+    # Yields (rel_path, abs_path, is_dir) for everything not ignored
+    for rel_path, entry, _ in scan(repo_path, rules):
+        yield rel_path, entry.path, entry.is_dir(follow_symlinks=False)
+
+
+class RepoIndex:
+    def __init__(self, repo_path: str):
+        self.repo_path = repo_path
+        self.files = []
+        self.dirs = []
+        self.sizes = {}
+        self.children = {"": []}
+        self.truncated = False
+        self._dir_totals = None
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self.sizes.values())
+
+    def dir_stats(self, rel_dir: str) -> tuple[int, int]:
+        if self._dir_totals is None:
+            totals = {}
+            for rel_path, size in self.sizes.items():
+                parent = rel_path
+                while "/" in parent:
+                    parent = parent.rsplit("/", 1)[0]
+                    count, total = totals.get(parent, (0, 0))
+                    totals[parent] = (count + 1, total + size)
+            self._dir_totals = totals
+        if not rel_dir:
+            return len(self.files), self.total_bytes
+        return self._dir_totals.get(rel_dir, (0, 0))
+
+    def tree_text(self, max_depth: int = TREE_MAX_DEPTH, max_children: int = TREE_MAX_CHILDREN) -> str:
+        lines = []
+        self._render("", "", 0, max_depth, max_children, lines)
+        if self.truncated:
+            lines.append(f"... (listing truncated after {len(self.files) + len(self.dirs)} entries)")
+        return "\n".join(lines)
+
+    def _render(self, rel_dir: str, prefix: str, depth: int, max_depth: int, max_children: int, lines: list):
+        children = self.children.get(rel_dir, [])
+        shown = children[:max_children]
+        hidden = children[max_children:]
+        for index, (name, is_dir) in enumerate(shown):
+            last = index == len(shown) - 1 and not hidden
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            lines.append(prefix + ("└── " if last else "├── ") + name)
+            if is_dir:
+                extension = "    " if last else "│   "
+                if depth + 1 < max_depth:
+                    self._render(rel_path, prefix + extension, depth + 1, max_depth, max_children, lines)
+                elif self.children.get(rel_path):
+                    count, size = self.dir_stats(rel_path)
+                    lines.append(f"{prefix}{extension}└── ... ({count} files, {_human(size)})")
+        if hidden:
+            hidden_files = sum(1 for _, is_dir in hidden if not is_dir)
+            hidden_dirs = len(hidden) - hidden_files
+            lines.append(f"{prefix}└── ... {len(hidden)} more entries ({hidden_dirs} dirs, {hidden_files} files)")
+
+
+def _human(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def build_index(repo_path: str, rules: IgnoreRules = None, max_entries: int = DEFAULT_MAX_ENTRIES) -> RepoIndex:
+    index = RepoIndex(repo_path)
+    count = 0
+    # One entry past the limit is scanned so a repo of exactly max_entries isn't marked truncated
+    limit = max_entries + 1 if max_entries is not None else None
+    for rel_path, entry, _ in scan(repo_path, rules, max_entries=limit):
+        count += 1
+        if limit is not None and count == limit:
+            index.truncated = True
+            break
+        parent, _, name = rel_path.rpartition("/")
+        is_dir = entry.is_dir(follow_symlinks=False)
+        index.children.setdefault(parent, []).append((name, is_dir))
+        if is_dir:
+            index.dirs.append(rel_path)
+            index.children.setdefault(rel_path, [])
+        else:
+            try:
+                index.sizes[rel_path] = entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                index.sizes[rel_path] = 0
+            index.files.append(rel_path)
+    return index